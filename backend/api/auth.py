@@ -7,6 +7,7 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 import os
 import hashlib
+import hmac
 
 from database import get_db
 from models import User, Session as DBSession
@@ -16,9 +17,13 @@ SECRET_KEY = os.getenv("JWT_SECRET", "your-secret-key-min-32-chars")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("JWT_EXPIRATION", 60))
 REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRATION", 2592000)) // 86400
+# Bearer token Prometheus scrapes /metrics with; the endpoint is disabled without one
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
+# For routes that also accept a media token, where the header is optional
+optional_security = HTTPBearer(auto_error=False)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
@@ -60,6 +65,22 @@ def decode_token(token: str) -> dict:
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+def create_media_token(user_id: str, route_name: str, expires_delta: timedelta) -> str:
+    """Create a JWT granting a route's media, for URLs fetched by players that cannot send headers"""
+    expire = datetime.utcnow() + expires_delta
+    to_encode = {"sub": user_id, "route": route_name, "exp": expire, "type": "media"}
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+def verify_media_token(token: str, route_name: str) -> str:
+    """Validate a media token for a route; returns the id of the user it was issued to"""
+    payload = decode_token(token)
+    if payload.get("type") != "media" or payload.get("route") != route_name or not payload.get("sub"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid media token"
+        )
+    return payload["sub"]
+
 def get_token_hash(token: str) -> str:
     """Create a hash of a token for storage"""
     return hashlib.sha256(token.encode()).hexdigest()
@@ -112,6 +133,37 @@ async def get_current_active_user(
     """Get the current active user"""
     return current_user
 
+async def get_media_user_id(
+    route_name: str,
+    token: Optional[str] = None,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    db: Session = Depends(get_db)
+) -> str:
+    """Get the id of the user fetching a route's media, by the route's media token or the bearer token"""
+    if token:
+        return verify_media_token(token, route_name)
+    if credentials is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user = await get_current_user(credentials, db)
+    return str(user.id)
+
+def verify_metrics_token(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
+) -> None:
+    """Allow only the metrics scraper, which presents METRICS_TOKEN"""
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if credentials is None or not hmac.compare_digest(credentials.credentials, METRICS_TOKEN):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
 def create_tokens_for_user(user: User, db: Session, ip_address: str = None, user_agent: str = None):
     """Create access and refresh tokens for a user and store session"""
     access_token = create_access_token(data={"sub": str(user.id)})
@@ -0,0 +1,77 @@
+"""Presign throughput benchmark.
+
+Compares boto3's generate_presigned_url with the cached-key SigV4Presigner
+used by the upload router. Signing is local, so no MinIO is needed.
+
+Usage (from backend/api):
+    python benchmarks/bench_presign.py [--count 20000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import boto3
+from botocore.client import Config
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from presign import SigV4Presigner
+
+ENDPOINT = "http://minio:9000"
+ACCESS_KEY = "admin"
+SECRET_KEY = "password"
+BUCKET = "comma-uploads"
+
+def object_keys(count: int):
+    """Keys shaped like a fleet of devices uploading segment files"""
+    file_types = ("qlog.bz2", "qcamera.ts", "rlog.bz2", "fcamera.hevc")
+    return [
+        f"{dongle:016x}/{dongle:016x}|2024-01-01--12-00-00/{segment}/{file_types[segment % 4]}"
+        for dongle, segment in ((i // 240, i % 240) for i in range(count))
+    ]
+
+def bench(name: str, presign, keys) -> float:
+    start = time.perf_counter()
+    for key in keys:
+        presign(key)
+    elapsed = time.perf_counter() - start
+    rate = len(keys) / elapsed
+    print(f"{name:<24} {len(keys):>8} URLs  {elapsed:8.3f}s  {rate:>12,.0f} presigns/s")
+    return rate
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=20000)
+    args = parser.parse_args()
+
+    keys = object_keys(args.count)
+
+    s3_client = boto3.client(
+        's3',
+        endpoint_url=ENDPOINT,
+        aws_access_key_id=ACCESS_KEY,
+        aws_secret_access_key=SECRET_KEY,
+        config=Config(signature_version='s3v4'),
+        region_name='us-east-1'
+    )
+    presigner = SigV4Presigner(ENDPOINT, ACCESS_KEY, SECRET_KEY)
+
+    # Warm up both paths (botocore loads its service model lazily)
+    s3_client.generate_presigned_url('put_object', Params={'Bucket': BUCKET, 'Key': keys[0]}, ExpiresIn=3600)
+    presigner.presign('PUT', BUCKET, keys[0])
+
+    boto_rate = bench(
+        "boto3",
+        lambda key: s3_client.generate_presigned_url('put_object', Params={'Bucket': BUCKET, 'Key': key}, ExpiresIn=3600),
+        keys
+    )
+    cached_rate = bench(
+        "SigV4Presigner",
+        lambda key: presigner.presign('PUT', BUCKET, key, expires_in=3600),
+        keys
+    )
+    print(f"speedup: {cached_rate / boto_rate:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+from typing import Callable, List
+import math
+
+from models import RouteSegment
+
+def _variants(segment: RouteSegment) -> dict:
+    """HLS variants packaged for a segment"""
+    return ((segment.renditions or {}).get("hls") or {}).get("variants") or {}
+
+def playable_variants(segments: List[RouteSegment]) -> dict:
+    """Variants packaged for every segment, as {name: (bandwidth, resolution, codecs)}.
+
+    The bandwidth is the peak over all segments, so players pick a rendition
+    that keeps up with the whole route.
+    """
+    variants = None
+    for segment in segments:
+        names = set(_variants(segment))
+        variants = names if variants is None else variants & names
+
+    playable = {}
+    for name in variants or ():
+        first = _variants(segments[0])[name]
+        playable[name] = (
+            max(_variants(segment)[name]["bandwidth"] for segment in segments),
+            first.get("resolution"),
+            first.get("codecs")
+        )
+    return playable
+
+def master_playlist(segments: List[RouteSegment], query: str = "") -> str:
+    """Build a master playlist pointing at the route's media playlists.
+
+    query is appended to every variant URI, e.g. to carry the token that
+    authorizes it.
+    """
+    lines = ["#EXTM3U", "#EXT-X-VERSION:7", "#EXT-X-INDEPENDENT-SEGMENTS"]
+    variants = playable_variants(segments)
+    for name, (bandwidth, resolution, codecs) in sorted(variants.items(), key=lambda item: item[1][0]):
+        attributes = [f"BANDWIDTH={bandwidth}"]
+        if resolution:
+            attributes.append(f"RESOLUTION={resolution}")
+        if codecs:
+            attributes.append(f'CODECS="{codecs}"')
+        lines.append(f"#EXT-X-STREAM-INF:{','.join(attributes)}")
+        lines.append(f"{name}.m3u8?{query}" if query else f"{name}.m3u8")
+    return "\n".join(lines) + "\n"
+
+def media_playlist(segments: List[RouteSegment], name: str, sign: Callable[[str, str], str]) -> str:
+    """Build a VOD media playlist stitching one variant of every segment together in order.
+
+    sign(bucket, key) returns the URL of a stored file. Every openpilot
+    segment is its own CMAF track with its own init segment and timeline,
+    hence the discontinuity between them.
+    """
+    variants = [(segment.renditions["hls"]["bucket"], _variants(segment)[name]) for segment in segments]
+    target_duration = max(
+        (math.ceil(duration) for _, variant in variants for _, duration in variant["segments"]),
+        default=1
+    )
+
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:7",
+        f"#EXT-X-TARGETDURATION:{target_duration}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+        "#EXT-X-PLAYLIST-TYPE:VOD",
+        "#EXT-X-INDEPENDENT-SEGMENTS",
+    ]
+    for i, (bucket, variant) in enumerate(variants):
+        if i:
+            lines.append("#EXT-X-DISCONTINUITY")
+        lines.append(f'#EXT-X-MAP:URI="{sign(bucket, variant["init"])}"')
+        for key, duration in variant["segments"]:
+            lines.append(f"#EXTINF:{duration:.3f},")
+            lines.append(sign(bucket, key))
+    lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
@@ -1,13 +1,15 @@
-from fastapi import FastAPI, Request
+from fastapi import Depends, FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from datetime import datetime
 import redis
 import logging
 from sqlalchemy import text
 
+from auth import verify_metrics_token
 from database import engine, get_db
 from routers import auth, devices, routes, upload, maps
+import processing
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -79,6 +81,19 @@ async def health_check():
 
     return status
 
+@app.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(verify_metrics_token)])
+def metrics():
+    """Prometheus metrics; queue depths let each worker pool be autoscaled on its own backlog.
+
+    The API port is public, so only a scraper presenting METRICS_TOKEN may read them.
+    """
+    lines = [
+        "# HELP celery_queue_length Tasks waiting in a worker queue",
+        "# TYPE celery_queue_length gauge"
+    ]
+    lines += [f'celery_queue_length{{queue="{queue}"}} {depth}' for queue, depth in processing.queue_depths().items()]
+    return "\n".join(lines) + "\n"
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     """Global exception handler"""
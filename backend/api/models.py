@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Boolean, Integer, Float, DateTime, ForeignKey, Text, TIMESTAMP
+from sqlalchemy import Column, String, Boolean, Integer, BigInteger, Float, DateTime, ForeignKey, Text, TIMESTAMP, UniqueConstraint, LargeBinary
 from sqlalchemy.dialects.postgresql import UUID, INET, JSONB
 from sqlalchemy.orm import relationship
 from geoalchemy2 import Geography
@@ -58,6 +58,8 @@ class Route(Base):
     processed = Column(Boolean, default=False)
     has_video = Column(Boolean, default=False)
     max_camera_points = Column(Integer, default=0)
+    previews = Column(JSONB, default=dict)
+    stats = Column(JSONB, default=dict)  # {"fixes", "rejected_fixes", "max_speed", "mean_speed"}; speeds in m/s
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -65,9 +67,11 @@ class Route(Base):
     segments = relationship("RouteSegment", back_populates="route", cascade="all, delete-orphan")
     events = relationship("Event", back_populates="route", cascade="all, delete-orphan")
     shares = relationship("SharedRoute", back_populates="route", cascade="all, delete-orphan")
+    geometries = relationship("RouteGeometry", back_populates="route", cascade="all, delete-orphan")
 
 class RouteSegment(Base):
     __tablename__ = "route_segments"
+    __table_args__ = (UniqueConstraint("route_id", "segment_number"),)
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     route_id = Column(UUID(as_uuid=True), ForeignKey("routes.id", ondelete="CASCADE"), index=True)
@@ -82,22 +86,54 @@ class RouteSegment(Base):
     qlog_path = Column(String(512))
     qcamera_path = Column(String(512))
     thumbnail_path = Column(String(512))
+    renditions = Column(JSONB, default=dict)  # {"hevc": {"bucket", "key", "codec", "size"}, "h264": ...}
+    telemetry = Column(JSONB, default=dict)  # {"source", "bucket", "tables": {"gps": {"key", "rows"}, "car": ...}}
     upload_complete = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     route = relationship("Route", back_populates="segments")
+    files = relationship("SegmentFile", back_populates="segment", cascade="all, delete-orphan")
     events = relationship("Event", back_populates="segment", cascade="all, delete-orphan")
 
+class SegmentFile(Base):
+    __tablename__ = "segment_files"
+    __table_args__ = (UniqueConstraint("segment_id", "file_type"),)
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    segment_id = Column(UUID(as_uuid=True), ForeignKey("route_segments.id", ondelete="CASCADE"), index=True)
+    file_type = Column(String(50), nullable=False)
+    object_key = Column(String(512), nullable=False)
+    content_hash = Column(String(64), index=True)
+    etag = Column(String(255))
+    file_size = Column(BigInteger)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    segment = relationship("RouteSegment", back_populates="files")
+
+class RouteGeometry(Base):
+    """A route's path simplified for map zoom levels up to max_zoom"""
+    __tablename__ = "route_geometries"
+
+    route_id = Column(UUID(as_uuid=True), ForeignKey("routes.id", ondelete="CASCADE"), primary_key=True)
+    max_zoom = Column(Integer, primary_key=True)
+    tolerance_meters = Column(Float, nullable=False)
+    point_count = Column(Integer, nullable=False)
+    polyline = Column(Text, nullable=False)  # Google encoded polyline, 1e-5 degrees
+    packed = Column(LargeBinary, nullable=False)  # The same deltas as zigzag LEB128 varints
+
+    route = relationship("Route", back_populates="geometries")
+
 class Event(Base):
     __tablename__ = "events"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     route_id = Column(UUID(as_uuid=True), ForeignKey("routes.id", ondelete="CASCADE"), index=True)
-    segment_id = Column(UUID(as_uuid=True), ForeignKey("route_segments.id", ondelete="CASCADE"))
+    segment_id = Column(UUID(as_uuid=True), ForeignKey("route_segments.id", ondelete="CASCADE"), index=True)
     event_type = Column(String(50), nullable=False)
     timestamp = Column(DateTime, nullable=False, index=True)
     location = Column(Geography(geometry_type='POINT', srid=4326))
-    metadata = Column(JSONB)
+    metadata_ = Column("metadata", JSONB)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     route = relationship("Route", back_populates="events")
@@ -118,7 +154,7 @@ class DeviceStatus(Base):
     openpilot_version = Column(String(100))
     location = Column(Geography(geometry_type='POINT', srid=4326))
     is_online = Column(Boolean, default=True)
-    metadata = Column(JSONB)
+    metadata_ = Column("metadata", JSONB)
 
     device = relationship("Device", back_populates="status_records")
 
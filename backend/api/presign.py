@@ -0,0 +1,106 @@
+from datetime import datetime
+from typing import Dict, Optional
+from urllib.parse import quote, urlsplit
+import hashlib
+import hmac
+import os
+
+UNSIGNED_PAYLOAD = "UNSIGNED-PAYLOAD"
+
+def _quote(value: str, safe: str = "-_.~") -> str:
+    """URI-encode a value the way SigV4 canonicalization expects"""
+    return quote(value, safe=safe)
+
+def _hmac(key: bytes, msg: str) -> bytes:
+    return hmac.new(key, msg.encode(), hashlib.sha256).digest()
+
+class SigV4Presigner:
+    """Presigns S3 URLs with SigV4 query authentication.
+
+    The derived signing key only changes with the date, so it is computed
+    once per day instead of four HMACs per URL, and no botocore request
+    objects are built. URLs are path-style, as MinIO expects.
+    """
+
+    def __init__(self, endpoint_url: str, access_key: str, secret_key: str, region: str = "us-east-1"):
+        endpoint = urlsplit(endpoint_url)
+        self.base_url = f"{endpoint.scheme}://{endpoint.netloc}"
+        self.host = endpoint.netloc
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self._signing_key = (None, None)
+
+    def signing_key(self, datestamp: str) -> bytes:
+        """Get the signing key for a date (YYYYMMDD), deriving it on the first use that day"""
+        cached_datestamp, key = self._signing_key
+        if cached_datestamp != datestamp:
+            key = _hmac(f"AWS4{self.secret_key}".encode(), datestamp)
+            key = _hmac(key, self.region)
+            key = _hmac(key, "s3")
+            key = _hmac(key, "aws4_request")
+            self._signing_key = (datestamp, key)
+        return key
+
+    def presign(
+        self,
+        method: str,
+        bucket: str,
+        key: str,
+        expires_in: int = 3600,
+        params: Optional[Dict[str, str]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        now: Optional[datetime] = None
+    ) -> str:
+        """Presign a request for an object.
+
+        params are extra query parameters (e.g. uploadId, partNumber); headers
+        are signed, so the client must send them with the same values.
+        """
+        now = now or datetime.utcnow()
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        datestamp = amz_date[:8]
+        scope = f"{datestamp}/{self.region}/s3/aws4_request"
+
+        signed_headers = {"host": self.host}
+        for name, value in (headers or {}).items():
+            signed_headers[name.lower()] = str(value).strip()
+        signed_header_names = ";".join(sorted(signed_headers))
+
+        query = {name: str(value) for name, value in (params or {}).items()}
+        query.update({
+            "X-Amz-Algorithm": "AWS4-HMAC-SHA256",
+            "X-Amz-Credential": f"{self.access_key}/{scope}",
+            "X-Amz-Date": amz_date,
+            "X-Amz-Expires": str(expires_in),
+            "X-Amz-SignedHeaders": signed_header_names,
+        })
+        canonical_query = "&".join(
+            f"{_quote(name)}={_quote(value)}" for name, value in sorted(query.items())
+        )
+
+        path = f"/{_quote(bucket)}/{_quote(key, safe='-_.~/')}"
+        canonical_request = "\n".join([
+            method,
+            path,
+            canonical_query,
+            "".join(f"{name}:{signed_headers[name]}\n" for name in sorted(signed_headers)),
+            signed_header_names,
+            UNSIGNED_PAYLOAD,
+        ])
+        string_to_sign = "\n".join([
+            "AWS4-HMAC-SHA256",
+            amz_date,
+            scope,
+            hashlib.sha256(canonical_request.encode()).hexdigest(),
+        ])
+        signature = hmac.new(self.signing_key(datestamp), string_to_sign.encode(), hashlib.sha256).hexdigest()
+
+        return f"{self.base_url}{path}?{canonical_query}&X-Amz-Signature={signature}"
+
+# Presigner for the API's MinIO; reuses the day's signing key for every URL
+presigner = SigV4Presigner(
+    f"http://{os.getenv('MINIO_ENDPOINT', 'minio:9000')}",
+    os.getenv("MINIO_ACCESS_KEY", "admin"),
+    os.getenv("MINIO_SECRET_KEY", "password")
+)
@@ -0,0 +1,169 @@
+from celery import Celery
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from typing import Dict, List, Optional
+import logging
+import os
+import redis
+import uuid
+
+from models import Route, RouteSegment, SegmentFile
+from shared import queues
+from upload_sessions import redis_client
+
+logger = logging.getLogger(__name__)
+
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://redis:6379/3")
+
+# How long a completed upload is remembered for deduplication
+ENQUEUE_DEDUP_TTL = int(os.getenv("ENQUEUE_DEDUP_TTL", 7 * 86400))
+
+# How long an on-demand transcode is waited for before it can be requested again
+TRANSCODE_REQUEST_TTL = int(os.getenv("TRANSCODE_REQUEST_TTL", 3600))
+
+# How long on-demand HLS packaging is waited for before it can be requested again
+HLS_REQUEST_TTL = int(os.getenv("HLS_REQUEST_TTL", 3600))
+
+# Producer-only Celery app; tasks are sent by name to the worker service
+celery_app = Celery('comma_api', broker=CELERY_BROKER_URL)
+queues.configure(celery_app)
+
+# The broker's own Redis database, where queued tasks wait
+broker_client = redis.from_url(CELERY_BROKER_URL)
+
+# Segment column and worker tasks for each uploaded file type. HLS renditions
+# are encoded when a route is first played (request_hls), not on upload
+FILE_TYPES = {
+    'rlog': ('log_path', ['tasks.parse_log_file']),
+    'log': ('log_path', ['tasks.parse_log_file']),
+    'qlog': ('qlog_path', ['tasks.parse_log_file']),
+    'fcamera': ('video_path', ['tasks.process_video']),
+    'video': ('video_path', ['tasks.process_video']),
+    'qcamera': ('qcamera_path', []),
+}
+
+def file_type_base(file_type: str) -> str:
+    """Strip the extension from a file type (e.g. 'rlog.bz2' -> 'rlog')"""
+    return file_type.split('.')[0]
+
+def record_upload(
+    db: Session,
+    route_name: str,
+    segment_number: int,
+    file_type: str,
+    object_key: str,
+    etag: str,
+    file_size: int,
+    content_hash: Optional[str] = None
+) -> Optional[RouteSegment]:
+    """Store a completed upload on its segment and in the segment's file index"""
+    segment = db.query(RouteSegment).join(Route).filter(
+        Route.fullname == route_name,
+        RouteSegment.segment_number == segment_number
+    ).first()
+
+    if not segment:
+        return None
+
+    column, _ = FILE_TYPES.get(file_type_base(file_type), (None, []))
+    if column and getattr(segment, column) != object_key:
+        setattr(segment, column, object_key)
+
+    values = {
+        'object_key': object_key,
+        'content_hash': content_hash,
+        'etag': etag,
+        'file_size': file_size
+    }
+    file_insert = insert(SegmentFile).values(segment_id=segment.id, file_type=file_type, **values)
+    db.execute(file_insert.on_conflict_do_update(
+        index_elements=[SegmentFile.segment_id, SegmentFile.file_type],
+        set_=values
+    ))
+    db.commit()
+
+    return segment
+
+def find_duplicates(db: Session, segment_ids: Dict[int, uuid.UUID], files: list) -> Dict[tuple, SegmentFile]:
+    """Find the files whose content hash is already stored for their segment and file type.
+
+    files are upload requests with segment_number, file_type and content_hash;
+    returns {(segment_number, file_type): SegmentFile}.
+    """
+    wanted = {
+        (segment_ids[f.segment_number], f.file_type): (f.segment_number, f.content_hash)
+        for f in files
+        if f.content_hash and f.segment_number in segment_ids
+    }
+    if not wanted:
+        return {}
+
+    stored = db.query(SegmentFile).filter(
+        SegmentFile.segment_id.in_({segment_id for segment_id, _ in wanted}),
+        SegmentFile.content_hash.in_({content_hash for _, content_hash in wanted.values()})
+    ).all()
+
+    duplicates = {}
+    for segment_file in stored:
+        segment_number, content_hash = wanted.get((segment_file.segment_id, segment_file.file_type), (None, None))
+        if content_hash == segment_file.content_hash:
+            duplicates[(segment_number, segment_file.file_type)] = segment_file
+    return duplicates
+
+def _send_once(task_name: str, marker: str, args: list, ttl: int = ENQUEUE_DEDUP_TTL) -> Optional[str]:
+    """Send a task unless its marker is already set, returning the task id if sent"""
+    if not redis_client.set(marker, 1, nx=True, ex=ttl):
+        return None
+
+    task_id = str(uuid.uuid5(uuid.NAMESPACE_URL, marker))
+    try:
+        celery_app.send_task(task_name, args=args, task_id=task_id)
+    except Exception:
+        # Let a retry enqueue it again
+        redis_client.delete(marker)
+        raise
+
+    logger.info(f"Enqueued {task_name} ({task_id})")
+    return task_id
+
+def enqueue_processing(segment: RouteSegment, file_type: str, object_key: str, etag: str) -> List[str]:
+    """Enqueue the worker tasks a file type needs, once per object version.
+
+    Returns the ids of the tasks that were sent; retried completes of the
+    same object and ETag send nothing.
+    """
+    _, task_names = FILE_TYPES.get(file_type_base(file_type), (None, []))
+    sent = []
+
+    for task_name in task_names:
+        task_id = _send_once(
+            task_name,
+            f"processing:{task_name}:{object_key}:{etag}",
+            [str(segment.route_id), str(segment.id), object_key]
+        )
+        if task_id:
+            sent.append(task_id)
+
+    return sent
+
+def request_transcode(segment: RouteSegment) -> Optional[str]:
+    """Enqueue the H.264 transcode of a segment's video, at most once per TRANSCODE_REQUEST_TTL"""
+    return _send_once(
+        'tasks.transcode_video',
+        f"processing:tasks.transcode_video:{segment.video_path}",
+        [str(segment.route_id), str(segment.id), segment.video_path],
+        ttl=TRANSCODE_REQUEST_TTL
+    )
+
+def request_hls(segment: RouteSegment) -> Optional[str]:
+    """Enqueue the HLS packaging of a segment's video, at most once per HLS_REQUEST_TTL"""
+    return _send_once(
+        'tasks.package_hls',
+        f"processing:tasks.package_hls:{segment.video_path}",
+        [str(segment.route_id), str(segment.id), segment.video_path],
+        ttl=HLS_REQUEST_TTL
+    )
+
+def queue_depths() -> Dict[str, int]:
+    """Tasks waiting in each worker queue"""
+    return queues.queue_depths(broker_client)
@@ -1,14 +1,61 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
 from sqlalchemy.orm import Session
+from datetime import timedelta
 from typing import List, Optional
+from urllib.parse import urlencode
+import os
 
 from database import get_db
-from models import User, Device, Route, RouteSegment, Event
-from schemas import RouteResponse, RouteListResponse, RouteSegmentResponse, EventResponse
-from auth import get_current_active_user
+from models import User, Device, Route, RouteSegment, RouteGeometry, Event
+from schemas import (
+    RouteResponse, RouteListResponse, RouteSegmentResponse, EventResponse, RouteVideoResponse,
+    RouteSpritesResponse, RouteThumbnailResponse, RoutePreviewResponse, RouteHLSResponse,
+    RouteGeometryResponse, RouteGeometryListResponse
+)
+from auth import get_current_active_user, get_media_user_id, create_media_token, verify_media_token
+from presign import presigner
+import hls
+import processing
 
 router = APIRouter()
 
+THUMBNAIL_BUCKET = os.getenv("THUMBNAIL_BUCKET", "comma-thumbnails")
+
+VIDEO_URL_EXPIRATION = 3600
+# Renditions offered when the client names no codec, in order of preference;
+# HEVC is the camera's own stream, H.264 only exists once transcoded
+VIDEO_CODECS = ("hevc", "h264")
+# HLS playlists are fetched once per playback, so their media URLs outlive a long drive
+HLS_URL_EXPIRATION = 6 * 3600
+HLS_MEDIA_TYPE = "application/vnd.apple.mpegurl"
+# Seconds a player is told to wait while a route's first segments are packaged for HLS
+HLS_PACKAGING_RETRY = 30
+# Images are cached by the browser for the whole time a route page is open
+IMAGE_URL_EXPIRATION = 6 * 3600
+# Web map zoom levels; the worker stores a simplification covering each range up to the highest
+MAX_ZOOM = 22
+PACKED_MEDIA_TYPE = "application/octet-stream"
+
+def _geometry_for_zoom(db: Session, route_ids: list, zoom: int) -> dict:
+    """The coarsest stored geometry of each route still detailed enough for zoom, by route id"""
+    geometries = db.query(RouteGeometry).filter(
+        RouteGeometry.route_id.in_(route_ids),
+        RouteGeometry.max_zoom >= zoom
+    ).order_by(RouteGeometry.route_id, RouteGeometry.max_zoom).all()
+    chosen = {}
+    for geometry in geometries:
+        chosen.setdefault(geometry.route_id, geometry)
+    return chosen
+
+def _geometry_response(route_name: str, geometry: RouteGeometry) -> dict:
+    return {
+        "route_name": route_name,
+        "max_zoom": geometry.max_zoom,
+        "tolerance_meters": geometry.tolerance_meters,
+        "points": geometry.point_count,
+        "polyline": geometry.polyline
+    }
+
 @router.get("/", response_model=RouteListResponse)
 async def list_routes(
     page: int = Query(1, ge=1),
@@ -37,6 +84,32 @@ async def list_routes(
         "page_size": page_size
     }
 
+@router.get("/geometries", response_model=RouteGeometryListResponse)
+async def list_route_geometries(
+    zoom: int = Query(..., ge=0, le=MAX_ZOOM),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=500),
+    device_id: Optional[str] = None,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Paths of a page of routes (in the order of list_routes), simplified for a map zoom level"""
+    query = db.query(Route.id, Route.fullname).join(Device).filter(Device.owner_id == current_user.id)
+
+    if device_id:
+        query = query.filter(Device.dongle_id == device_id)
+
+    routes = query.order_by(Route.start_time.desc()).offset((page - 1) * page_size).limit(page_size).all()
+    geometries = _geometry_for_zoom(db, [route.id for route in routes], zoom)
+
+    return {
+        "zoom": zoom,
+        "routes": [
+            _geometry_response(route.fullname, geometries[route.id])
+            for route in routes if route.id in geometries
+        ]
+    }
+
 @router.get("/{route_name}", response_model=RouteResponse)
 async def get_route(
     route_name: str,
@@ -128,14 +201,21 @@ async def get_route_events(
 
     return events
 
-@router.get("/{route_name}/video")
+@router.get("/{route_name}/video", response_model=RouteVideoResponse)
 async def stream_video(
     route_name: str,
     segment: Optional[int] = None,
+    codec: Optional[str] = Query(None, pattern="^(hevc|h264)$"),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Stream video for a route"""
+    """Get playback URLs for the video of a route.
+
+    Without a codec each segment gets the rendition it already has, the
+    remuxed HEVC camera stream first. Clients that cannot decode HEVC ask
+    for codec=h264, which is transcoded on first request; until it lands
+    the segment is returned without a URL.
+    """
     route = db.query(Route).join(Device).filter(
         Route.fullname == route_name,
         Device.owner_id == current_user.id
@@ -147,8 +227,159 @@ async def stream_video(
             detail="Route not found"
         )
 
-    # TODO: Implement video streaming from MinIO
-    return {"message": "Video streaming not yet implemented"}
+    query = db.query(RouteSegment).filter(
+        RouteSegment.route_id == route.id,
+        RouteSegment.video_path.isnot(None)
+    )
+    if segment is not None:
+        query = query.filter(RouteSegment.segment_number == segment)
+    segments = query.order_by(RouteSegment.segment_number).all()
+
+    if not segments:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Video not found"
+        )
+
+    urls = []
+    for route_segment in segments:
+        renditions = route_segment.renditions or {}
+        segment_codec = codec or next((name for name in VIDEO_CODECS if name in renditions), VIDEO_CODECS[0])
+        rendition = renditions.get(segment_codec)
+        url = None
+        if rendition:
+            url = presigner.presign('GET', rendition["bucket"], rendition["key"], expires_in=VIDEO_URL_EXPIRATION)
+        elif codec == "h264" and renditions:
+            # The segment has been processed, but only to HEVC
+            processing.request_transcode(route_segment)
+        urls.append({
+            "segment_number": route_segment.segment_number,
+            "codec": segment_codec,
+            "url": url
+        })
+
+    return {
+        "route_name": route_name,
+        "codec": codec,
+        "expires_in": VIDEO_URL_EXPIRATION,
+        "segments": urls
+    }
+
+def _hls_segments(db: Session, route: Route) -> List[RouteSegment]:
+    """Segments of a route that have been packaged for HLS, in order.
+
+    Packaging encodes the H.264 ladder, so it only runs once a route is
+    played: segments with video but no HLS renditions are queued for it here.
+    """
+    segments = db.query(RouteSegment).filter(
+        RouteSegment.route_id == route.id,
+        RouteSegment.video_path.isnot(None)
+    ).order_by(RouteSegment.segment_number).all()
+
+    if not segments:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Video not found"
+        )
+
+    packaged = []
+    for segment in segments:
+        if "hls" in (segment.renditions or {}):
+            packaged.append(segment)
+        else:
+            processing.request_hls(segment)
+
+    if not packaged:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Video is being packaged for streaming",
+            headers={"Retry-After": str(HLS_PACKAGING_RETRY)}
+        )
+
+    return packaged
+
+def _owned_route(db: Session, route_name: str, user_id) -> Route:
+    """A route of one of the user's devices, or 404"""
+    route = db.query(Route).join(Device).filter(
+        Route.fullname == route_name,
+        Device.owner_id == user_id
+    ).first()
+
+    if not route:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Route not found"
+        )
+
+    return route
+
+@router.get("/{route_name}/hls", response_model=RouteHLSResponse)
+async def get_hls_url(
+    route_name: str,
+    request: Request,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Get the URL of a route's HLS master playlist, authorized by a media token in its query.
+
+    Native players (Safari, iOS) fetch the playlist themselves and cannot
+    send the Authorization header.
+    """
+    _owned_route(db, route_name, current_user.id)
+    token = create_media_token(str(current_user.id), route_name, timedelta(seconds=HLS_URL_EXPIRATION))
+    url = request.url_for("get_hls_master_playlist", route_name=route_name)
+    return {
+        "route_name": route_name,
+        "expires_in": HLS_URL_EXPIRATION,
+        "url": f"{url}?{urlencode({'token': token})}"
+    }
+
+@router.get("/{route_name}/hls/master.m3u8")
+async def get_hls_master_playlist(
+    route_name: str,
+    user_id: str = Depends(get_media_user_id),
+    db: Session = Depends(get_db)
+):
+    """Get the HLS master playlist of a route, one variant per rendition of the ladder.
+
+    Authorized by the Authorization header or by the media token of the URL
+    from /hls. Players fetch the variant playlists without the header, so
+    each variant URI carries a token for this route too.
+    """
+    route = _owned_route(db, route_name, user_id)
+
+    # Players fetch a variant when they switch to it, so the token lives as long as the media URLs
+    token = create_media_token(user_id, route_name, timedelta(seconds=HLS_URL_EXPIRATION))
+    playlist = hls.master_playlist(_hls_segments(db, route), urlencode({"token": token}))
+    return Response(playlist, media_type=HLS_MEDIA_TYPE)
+
+@router.get("/{route_name}/hls/{variant}.m3u8")
+async def get_hls_media_playlist(
+    route_name: str,
+    variant: str,
+    token: str,
+    db: Session = Depends(get_db)
+):
+    """Get the HLS media playlist of one rendition, spanning all segments of a route.
+
+    Authorized by the media token in the URI the master playlist gave out.
+    """
+    user_id = verify_media_token(token, route_name)
+    route = _owned_route(db, route_name, user_id)
+
+    segments = _hls_segments(db, route)
+    if variant not in hls.playable_variants(segments):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Rendition not found"
+        )
+
+    playlist = hls.media_playlist(
+        segments,
+        variant,
+        lambda bucket, key: presigner.presign('GET', bucket, key, expires_in=HLS_URL_EXPIRATION)
+    )
+    return Response(playlist, media_type=HLS_MEDIA_TYPE)
 
 @router.get("/{route_name}/log")
 async def download_log(
@@ -172,14 +403,14 @@ async def download_log(
     # TODO: Implement log download from MinIO
     return {"message": "Log download not yet implemented"}
 
-@router.get("/{route_name}/thumbnail")
+@router.get("/{route_name}/thumbnail", response_model=RouteThumbnailResponse)
 async def get_thumbnail(
     route_name: str,
     segment: Optional[int] = None,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Get thumbnail for a route"""
+    """Get the thumbnail URL of a segment, by default the first one that has a thumbnail"""
     route = db.query(Route).join(Device).filter(
         Route.fullname == route_name,
         Device.owner_id == current_user.id
@@ -191,8 +422,153 @@ async def get_thumbnail(
             detail="Route not found"
         )
 
-    # TODO: Implement thumbnail retrieval from MinIO
-    return {"message": "Thumbnail not yet implemented"}
+    query = db.query(RouteSegment).filter(
+        RouteSegment.route_id == route.id,
+        RouteSegment.thumbnail_path.isnot(None)
+    )
+    if segment is not None:
+        query = query.filter(RouteSegment.segment_number == segment)
+    route_segment = query.order_by(RouteSegment.segment_number).first()
+
+    if not route_segment:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Thumbnail not found"
+        )
+
+    return {
+        "route_name": route_name,
+        "segment_number": route_segment.segment_number,
+        "expires_in": IMAGE_URL_EXPIRATION,
+        "url": presigner.presign('GET', THUMBNAIL_BUCKET, route_segment.thumbnail_path, expires_in=IMAGE_URL_EXPIRATION)
+    }
+
+@router.get("/{route_name}/sprites", response_model=RouteSpritesResponse)
+async def get_sprites(
+    route_name: str,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Get the timeline sprite sheets of a whole route, for hover previews while scrubbing.
+
+    Segments without sheets yet are left out; a drive's segments come from
+    the same camera, so they share one tile size and grid.
+    """
+    route = db.query(Route).join(Device).filter(
+        Route.fullname == route_name,
+        Device.owner_id == current_user.id
+    ).first()
+
+    if not route:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Route not found"
+        )
+
+    segments = db.query(RouteSegment).filter(
+        RouteSegment.route_id == route.id,
+        RouteSegment.renditions.has_key("sprites")
+    ).order_by(RouteSegment.segment_number).all()
+
+    if not segments:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Sprites not found"
+        )
+
+    first = segments[0].renditions["sprites"]
+    return {
+        "route_name": route_name,
+        "interval": first["interval"],
+        "tile_width": first["tile_width"],
+        "tile_height": first["tile_height"],
+        "columns": first["columns"],
+        "rows": first["rows"],
+        "expires_in": IMAGE_URL_EXPIRATION,
+        "segments": [
+            {
+                "segment_number": route_segment.segment_number,
+                "count": route_segment.renditions["sprites"]["count"],
+                "sheets": [
+                    presigner.presign('GET', route_segment.renditions["sprites"]["bucket"], key, expires_in=IMAGE_URL_EXPIRATION)
+                    for key in route_segment.renditions["sprites"]["sheets"]
+                ]
+            }
+            for route_segment in segments
+        ]
+    }
+
+@router.get("/{route_name}/geometry", response_model=RouteGeometryResponse)
+async def get_geometry(
+    route_name: str,
+    zoom: int = Query(MAX_ZOOM, ge=0, le=MAX_ZOOM),
+    format: str = Query("polyline", pattern="^(polyline|binary)$"),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Get a route's path simplified for a map zoom level.
+
+    format=binary returns the polyline's zigzag deltas as LEB128 varints
+    (latitude, longitude pairs in 1e-5 degrees) instead of JSON.
+    """
+    route = db.query(Route).join(Device).filter(
+        Route.fullname == route_name,
+        Device.owner_id == current_user.id
+    ).first()
+
+    if not route:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Route not found"
+        )
+
+    geometry = _geometry_for_zoom(db, [route.id], zoom).get(route.id)
+    if not geometry:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Geometry not found"
+        )
+
+    if format == "binary":
+        return Response(
+            content=geometry.packed,
+            media_type=PACKED_MEDIA_TYPE,
+            headers={"X-Geometry-Points": str(geometry.point_count), "X-Geometry-Max-Zoom": str(geometry.max_zoom)}
+        )
+    return _geometry_response(route_name, geometry)
+
+@router.get("/{route_name}/preview", response_model=RoutePreviewResponse)
+async def get_preview(
+    route_name: str,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Get the time-lapse preview of a route, built once all its segments are processed"""
+    route = db.query(Route).join(Device).filter(
+        Route.fullname == route_name,
+        Device.owner_id == current_user.id
+    ).first()
+
+    if not route:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Route not found"
+        )
+
+    if not route.previews:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Preview not found"
+        )
+
+    previews = route.previews
+    return {
+        "route_name": route_name,
+        "segments": previews["segments"],
+        "expires_in": IMAGE_URL_EXPIRATION,
+        "video_url": presigner.presign('GET', previews["video"]["bucket"], previews["video"]["key"], expires_in=IMAGE_URL_EXPIRATION),
+        "gif_url": presigner.presign('GET', previews["gif"]["bucket"], previews["gif"]["key"], expires_in=IMAGE_URL_EXPIRATION)
+    }
 
 @router.post("/{route_name}/share")
 async def share_route(
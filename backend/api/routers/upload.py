@@ -1,54 +1,122 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response, Header
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
-from typing import Optional
-import boto3
-from botocore.client import Config
+from typing import Optional, List, Dict
+from datetime import datetime
+import asyncio
+import base64
+import binascii
+from botocore.exceptions import ClientError, ConnectionError as S3ConnectionError, HTTPClientError, UnseekableStreamError
+from botocore.utils import conditionally_calculate_md5
+import hashlib
+import math
 import os
 import uuid
 
 from database import get_db
-from models import User, Device, Route, RouteSegment
-from schemas import UploadInitRequest, UploadInitResponse, UploadCompleteRequest
+from models import User, Device, Route, RouteSegment, SegmentFile
+from schemas import (
+    UploadInitRequest,
+    UploadInitResponse,
+    BulkUploadInitRequest,
+    BulkUploadInitResponse,
+    BatchPresignRequest,
+    BatchPresignResponse,
+    PresignedCompleteRequest,
+    PresignedCompleteResponse,
+    UploadPartsRequest,
+    UploadPartsResponse,
+    UploadCompleteRequest,
+    UploadCompleteResponse,
+    UploadResumeResponse
+)
 from auth import get_current_active_user
+from presign import presigner
+from shared.storage import ObjectStorage
+import processing
+import upload_scheduler
+import upload_sessions
 
 router = APIRouter()
 
 # MinIO configuration
-MINIO_ENDPOINT = os.getenv("MINIO_ENDPOINT", "minio:9000")
-MINIO_ACCESS_KEY = os.getenv("MINIO_ACCESS_KEY", "admin")
-MINIO_SECRET_KEY = os.getenv("MINIO_SECRET_KEY", "password")
 MINIO_BUCKET = os.getenv("MINIO_BUCKET", "comma-uploads")
 
-# Initialize MinIO client
-s3_client = boto3.client(
-    's3',
-    endpoint_url=f'http://{MINIO_ENDPOINT}',
-    aws_access_key_id=MINIO_ACCESS_KEY,
-    aws_secret_access_key=MINIO_SECRET_KEY,
-    config=Config(signature_version='s3v4'),
-    region_name='us-east-1'
-)
+# Multipart upload configuration
+CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 10485760))  # 10MB
+MIN_PART_SIZE = 5242880  # S3 minimum for every part but the last
+MAX_UPLOAD_PARTS = 10000  # S3 maximum parts per upload
+MAX_PART_SIZE = 5368709120  # S3 maximum part size (5GB)
+PRESIGNED_URL_WINDOW = int(os.getenv("UPLOAD_URL_WINDOW", 64))
+PRESIGNED_URL_EXPIRATION = 3600
+# Parts streamed through the API at once; each holds a thread for as long as
+# the device takes to send it, so they get their own pool
+UPLOAD_STREAM_CONCURRENCY = int(os.getenv("UPLOAD_STREAM_CONCURRENCY", 32))
+# How long a complete waits for a concurrent complete of the same upload to finish
+COMPLETE_WAIT = float(os.getenv("UPLOAD_COMPLETE_WAIT", 30))
+COMPLETE_POLL_INTERVAL = 0.25
 
-@router.post("/init", response_model=UploadInitResponse)
-async def initialize_upload(
-    upload_data: UploadInitRequest,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
-):
-    """Initialize a multipart upload session"""
-    # Parse route name (format: dongle_id|timestamp)
+# MinIO client; handlers run its blocking calls through storage.run()
+storage = ObjectStorage.from_env()
+# Client for parts streamed from request bodies, with its own thread pool so
+# slow devices never hold up the short control calls above. A body cannot be
+# rewound, so the part is never retried here; the device resends it instead
+stream_storage = ObjectStorage.from_env(max_attempts=1, max_pool_connections=UPLOAD_STREAM_CONCURRENCY)
+stream_slots = asyncio.Semaphore(UPLOAD_STREAM_CONCURRENCY)
+# botocore would otherwise MD5 every streamed part up front, which needs a seekable body
+stream_storage.client.meta.events.unregister('before-call.s3.UploadPart', conditionally_calculate_md5)
+
+class _RequestBodyReader:
+    """Blocking file-like view of a streamed request body.
+
+    boto3 reads it from a storage thread; each read pulls the next chunk from
+    the event loop, so at most one read's worth of the body is held in memory.
+    """
+
+    def __init__(self, request: Request):
+        self._chunks = request.stream()
+        self._loop = asyncio.get_running_loop()
+        self._buffer = b""
+        self._eof = False
+
+    async def _receive(self) -> bytes:
+        try:
+            return await self._chunks.__anext__()
+        except StopAsyncIteration:
+            return b""
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            chunk = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+            if not chunk:
+                self._eof = True
+            self._buffer += chunk
+
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+def _route_dongle_id(route_name: str) -> str:
+    """Get the dongle id from a route name (format: dongle_id|timestamp)"""
     try:
-        dongle_id, timestamp = upload_data.route_name.split('|')
+        dongle_id, timestamp = route_name.split('|')
     except ValueError:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid route name format"
         )
+    return dongle_id
 
-    # Verify device ownership
+def _get_owned_device(db: Session, user: User, route_name: str) -> Device:
+    """Parse a route name and verify device ownership"""
+    return _get_device(db, user, _route_dongle_id(route_name))
+
+def _get_device(db: Session, user: User, dongle_id: str) -> Device:
+    """Get a device owned by the user"""
     device = db.query(Device).filter(
         Device.dongle_id == dongle_id,
-        Device.owner_id == current_user.id
+        Device.owner_id == user.id
     ).first()
 
     if not device:
@@ -57,91 +125,762 @@ async def initialize_upload(
             detail="Device not found"
         )
 
-    # Get or create route
-    route = db.query(Route).filter(Route.fullname == upload_data.route_name).first()
-    if not route:
-        from datetime import datetime
-        route = Route(
-            device_id=device.id,
-            fullname=upload_data.route_name,
-            start_time=datetime.fromisoformat(timestamp.replace('--', ':'))
+    return device
+
+def _object_key(dongle_id: str, route_name: str, segment_number: int, file_type: str) -> str:
+    """Build the object key for a segment file"""
+    return f"{dongle_id}/{route_name}/{segment_number}/{file_type}"
+
+def _part_layout(file_size: int, chunk_size: Optional[int] = None) -> tuple:
+    """Return (chunk_size, part_count) for a file.
+
+    A chunk size chosen by the device is validated against the S3 limits;
+    the default grows when it would exceed the S3 part limit.
+    """
+    if chunk_size is not None:
+        if not MIN_PART_SIZE <= chunk_size <= MAX_PART_SIZE or file_size > chunk_size * MAX_UPLOAD_PARTS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Chunk size must be between {MIN_PART_SIZE} and {MAX_PART_SIZE} bytes "
+                       f"and split the file into at most {MAX_UPLOAD_PARTS} parts"
+            )
+    else:
+        chunk_size = max(CHUNK_SIZE, MIN_PART_SIZE)
+        if file_size > chunk_size * MAX_UPLOAD_PARTS:
+            chunk_size = math.ceil(file_size / MAX_UPLOAD_PARTS)
+    part_count = max(1, math.ceil(file_size / chunk_size))
+    return chunk_size, part_count
+
+def _md5_hex(md5: str) -> str:
+    """Convert a base64 MD5 (Content-MD5 format) to the hex form S3 uses in ETags"""
+    try:
+        digest = base64.b64decode(md5, validate=True)
+    except binascii.Error:
+        digest = b""
+    if len(digest) != 16:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid MD5: {md5}"
         )
-        db.add(route)
-        db.commit()
-        db.refresh(route)
+    return digest.hex()
 
-    # Get or create segment
-    segment = db.query(RouteSegment).filter(
-        RouteSegment.route_id == route.id,
-        RouteSegment.segment_number == upload_data.segment_number
-    ).first()
+def _multipart_etag(md5s: Dict[int, str]) -> str:
+    """Compute the ETag S3 assigns to a completed multipart upload:
+    the MD5 of the concatenated part MD5s, suffixed with the part count"""
+    digests = b"".join(base64.b64decode(md5s[part_number]) for part_number in sorted(md5s))
+    return f"{hashlib.md5(digests).hexdigest()}-{len(md5s)}"
+
+def _route_start_time(route_name: str) -> datetime:
+    """Parse the start time from a route name (openpilot format: dongle_id|2024-01-31--13-45-00)"""
+    timestamp = route_name.split('|')[1]
+    try:
+        return datetime.strptime(timestamp, "%Y-%m-%d--%H-%M-%S")
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(timestamp.replace('--', ':'))
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid route timestamp"
+        )
+
+def _upsert_route_segments(db: Session, device: Device, route_name: str, segment_numbers: List[int]) -> Dict[int, uuid.UUID]:
+    """Get or create a route and its segments in a single transaction.
+
+    Returns {segment_number: segment_id}.
+    """
+    route_insert = insert(Route).values(
+        device_id=device.id,
+        fullname=route_name,
+        start_time=_route_start_time(route_name)
+    )
+    # The no-op update makes RETURNING yield the id of an existing route too
+    route_id = db.execute(
+        route_insert.on_conflict_do_update(
+            index_elements=[Route.fullname],
+            set_={'fullname': route_insert.excluded.fullname}
+        ).returning(Route.id)
+    ).scalar_one()
+
+    segment_insert = insert(RouteSegment).values([
+        {
+            'route_id': route_id,
+            'segment_number': segment_number,
+            'canonical_name': f"{route_name}--{segment_number}"
+        }
+        for segment_number in sorted(set(segment_numbers))
+    ])
+    rows = db.execute(
+        segment_insert.on_conflict_do_update(
+            index_elements=[RouteSegment.route_id, RouteSegment.segment_number],
+            set_={'canonical_name': segment_insert.excluded.canonical_name}
+        ).returning(RouteSegment.segment_number, RouteSegment.id)
+    ).all()
+
+    db.commit()
+    return {segment_number: segment_id for segment_number, segment_id in rows}
+
+def _get_upload_session(upload_id: str, user: User) -> dict:
+    """Get an upload session owned by the user"""
+    session = upload_sessions.get_session(upload_id)
+    if not session or session["user_id"] != str(user.id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload not found"
+        )
+    return session
+
+def _check_part_numbers(session: dict, part_numbers: List[int]) -> None:
+    """Reject part numbers outside of the upload's part range"""
+    if min(part_numbers) < 1 or max(part_numbers) > session["part_count"]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Part numbers must be between 1 and {session['part_count']}"
+        )
+
+def _part_size(session: dict, part_number: int) -> int:
+    """Expected size of a part, the last one holding the remainder"""
+    if part_number == session["part_count"]:
+        return session["file_size"] - session["chunk_size"] * (session["part_count"] - 1)
+    return session["chunk_size"]
+
+def _list_uploaded_parts(session: dict, md5s: Dict[int, str]) -> dict:
+    """List the parts S3 has stored for an upload as {part_number: etag},
+    dropping parts whose size or checksum does not match the upload layout"""
+    parts = {}
+    kwargs = {
+        'Bucket': MINIO_BUCKET,
+        'Key': session["object_key"],
+        'UploadId': session["upload_id"]
+    }
+
+    while True:
+        response = storage.client.list_parts(**kwargs)
+        for part in response.get('Parts', []):
+            part_number = part['PartNumber']
+            etag = part['ETag'].strip('"')
+            if part['Size'] != _part_size(session, part_number):
+                continue
+            if part_number in md5s and etag != _md5_hex(md5s[part_number]):
+                continue
+            parts[part_number] = etag
+
+        if not response.get('IsTruncated'):
+            break
+        kwargs['PartNumberMarker'] = response['NextPartNumberMarker']
 
-    if not segment:
-        canonical_name = f"{upload_data.route_name}--{upload_data.segment_number}"
-        segment = RouteSegment(
-            route_id=route.id,
-            segment_number=upload_data.segment_number,
-            canonical_name=canonical_name
+    return parts
+
+def _raise_for_s3_error(e: ClientError, action: str):
+    """Translate an S3 error into an HTTP error"""
+    error_code = e.response.get('Error', {}).get('Code')
+    if error_code == 'NoSuchUpload':
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload not found"
         )
-        db.add(segment)
-        db.commit()
-        db.refresh(segment)
+    if error_code in ('InvalidPart', 'InvalidPartOrder', 'EntityTooSmall'):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid parts: {error_code}"
+        )
+    raise HTTPException(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        detail=f"Failed to {action}: {str(e)}"
+    )
+
+def _raise_for_stream_error(e: Exception) -> None:
+    """Translate a failed streamed part upload into an HTTP error; transient failures become 503s"""
+    if isinstance(e, ClientError) and e.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 500) < 500:
+        _raise_for_s3_error(e, "upload chunk")
+    raise HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=f"Storage unavailable, retry the part: {str(e)}",
+        headers={"Retry-After": str(upload_scheduler.RETRY_AFTER)}
+    )
+
+def _presign_part(object_key: str, upload_id: str, part_number: int, md5: Optional[str] = None) -> str:
+    """Generate a presigned upload_part URL, binding the part's MD5 when declared"""
+    # The signed Content-MD5 header makes S3 reject a part whose body does not match
+    return presigner.presign(
+        'PUT',
+        MINIO_BUCKET,
+        object_key,
+        expires_in=PRESIGNED_URL_EXPIRATION,
+        params={'partNumber': part_number, 'uploadId': upload_id},
+        headers={'Content-MD5': md5} if md5 else None
+    )
+
+def _presign_parts(object_key: str, upload_id: str, part_numbers: List[int], md5s: Optional[Dict[int, str]] = None) -> List[dict]:
+    """Generate presigned upload_part URLs for the given part numbers"""
+    md5s = md5s or {}
+    return [
+        {
+            "part_number": part_number,
+            "presigned_url": _presign_part(object_key, upload_id, part_number, md5s.get(part_number))
+        }
+        for part_number in part_numbers
+    ]
+
+def _upload_layout(object_key: str, upload_data) -> tuple:
+    """Validate an upload request and return (chunk_size, part_count, md5s)"""
+    chunk_size, part_count = _part_layout(upload_data.file_size, upload_data.chunk_size)
+
+    md5s = {}
+    if upload_data.part_md5s is not None:
+        if len(upload_data.part_md5s) != part_count:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Expected {part_count} part MD5s for {object_key}"
+            )
+        for md5 in upload_data.part_md5s:
+            _md5_hex(md5)
+        md5s = dict(enumerate(upload_data.part_md5s, start=1))
+
+    return chunk_size, part_count, md5s
 
-    # Generate upload ID and presigned URL
-    upload_id = str(uuid.uuid4())
-    object_key = f"{dongle_id}/{upload_data.route_name}/{upload_data.segment_number}/{upload_data.file_type}"
+def _abort_upload(object_key: str, upload_id: str) -> None:
+    """Abort a multipart upload in S3 and forget its session"""
+    try:
+        storage.client.abort_multipart_upload(Bucket=MINIO_BUCKET, Key=object_key, UploadId=upload_id)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'NoSuchUpload':
+            raise
+    finally:
+        upload_sessions.delete_session(upload_id)
 
-    # Create multipart upload
+def _abandon_upload(dongle_id: str, object_key: str, upload_id: str) -> None:
+    """Undo a partly started upload: abort it in S3, forget its session and free its slot"""
     try:
-        multipart = s3_client.create_multipart_upload(
+        _abort_upload(object_key, upload_id)
+    finally:
+        upload_scheduler.release(dongle_id, object_key)
+
+def _resumed_upload(session: dict, user: User, upload_data, layout: tuple) -> Optional[dict]:
+    """Describe an object's unfinished upload for a retried init, like /resume does.
+
+    Returns None when the upload cannot be continued: another user started
+    it, it has a different layout because the file changed, or S3 no longer
+    has it. It is aborted then, and the caller starts a new one.
+    """
+    chunk_size, part_count, md5s = layout
+    upload_id = session["upload_id"]
+    same_layout = (
+        (session["file_size"], session["chunk_size"], session["part_count"]) == (upload_data.file_size, chunk_size, part_count)
+        and upload_sessions.get_part_md5s(upload_id) == md5s
+    )
+    if session["user_id"] != str(user.id) or not same_layout:
+        _abort_upload(session["object_key"], upload_id)
+        return None
+
+    try:
+        uploaded = _list_uploaded_parts(session, md5s)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'NoSuchUpload':
+            raise
+        upload_sessions.delete_session(upload_id)
+        return None
+    upload_sessions.replace_parts(upload_id, uploaded)
+
+    missing_parts = [part_number for part_number in range(1, part_count + 1) if part_number not in uploaded]
+    parts = _presign_parts(session["object_key"], upload_id, missing_parts[:PRESIGNED_URL_WINDOW], md5s)
+    return {
+        "upload_id": upload_id,
+        "presigned_url": parts[0]["presigned_url"] if missing_parts[:1] == [1] else None,
+        "object_key": session["object_key"],
+        "segment_number": session["segment_number"],
+        "file_type": session["file_type"],
+        "chunk_size": chunk_size,
+        "part_count": part_count,
+        "parts": parts
+    }
+
+def _start_upload(user: User, dongle_id: str, route_name: str, upload_data, layout: tuple) -> dict:
+    """Create a multipart upload, register its session and presign the first window of parts.
+
+    The upload must already hold a scheduler slot. A retried init continues
+    the object's unfinished upload instead of orphaning it in S3. If any step
+    fails, the upload is abandoned (see _abandon_upload) before the error is
+    raised.
+    """
+    segment_number = upload_data.segment_number
+    file_type = upload_data.file_type
+    file_size = upload_data.file_size
+    object_key = _object_key(dongle_id, route_name, segment_number, file_type)
+    chunk_size, part_count, md5s = layout
+
+    try:
+        existing = upload_sessions.find_session(object_key)
+        if existing and existing["status"] == "uploading":
+            resumed = _resumed_upload(existing, user, upload_data, layout)
+            if resumed:
+                return resumed
+
+        multipart = storage.client.create_multipart_upload(
             Bucket=MINIO_BUCKET,
             Key=object_key
         )
+    except Exception:
+        upload_scheduler.release(dongle_id, object_key)
+        raise
 
-        # Generate presigned URL for upload
-        presigned_url = s3_client.generate_presigned_url(
-            'upload_part',
-            Params={
-                'Bucket': MINIO_BUCKET,
-                'Key': object_key,
-                'UploadId': multipart['UploadId'],
-                'PartNumber': 1
-            },
-            ExpiresIn=3600
+    try:
+        upload_sessions.create_session(
+            multipart['UploadId'],
+            user_id=user.id,
+            dongle_id=dongle_id,
+            route_name=route_name,
+            segment_number=segment_number,
+            file_type=file_type,
+            object_key=object_key,
+            file_size=file_size,
+            chunk_size=chunk_size,
+            part_count=part_count,
+            content_hash=upload_data.content_hash or ""
         )
+        if md5s:
+            upload_sessions.set_part_md5s(multipart['UploadId'], md5s)
 
-        return {
-            "upload_id": multipart['UploadId'],
-            "presigned_url": presigned_url,
-            "chunk_size": 10485760  # 10MB
-        }
+        # Presign the first window of parts so the device can upload them in parallel
+        window = range(1, min(part_count, PRESIGNED_URL_WINDOW) + 1)
+        parts = _presign_parts(object_key, multipart['UploadId'], list(window), md5s)
+    except Exception:
+        try:
+            _abandon_upload(dongle_id, object_key, multipart['UploadId'])
+        except Exception:
+            pass  # The original error is the one worth reporting
+        raise
+
+    return {
+        "upload_id": multipart['UploadId'],
+        "presigned_url": parts[0]["presigned_url"],
+        "object_key": object_key,
+        "segment_number": segment_number,
+        "file_type": file_type,
+        "chunk_size": chunk_size,
+        "part_count": part_count,
+        "parts": parts
+    }
+
+def _deferred_upload(dongle_id: str, route_name: str, upload_data, retry_after: int, error: Optional[str] = None) -> dict:
+    """Describe an upload the scheduler did not admit yet, or that failed to start"""
+    return {
+        "object_key": _object_key(dongle_id, route_name, upload_data.segment_number, upload_data.file_type),
+        "segment_number": upload_data.segment_number,
+        "file_type": upload_data.file_type,
+        "part_count": 0,
+        "retry_after": retry_after,
+        "error": error
+    }
+
+def _duplicate_upload(segment_file: SegmentFile, upload_data) -> dict:
+    """Describe an upload that is skipped because its content is already stored"""
+    return {
+        "object_key": segment_file.object_key,
+        "segment_number": upload_data.segment_number,
+        "file_type": upload_data.file_type,
+        "part_count": 0,
+        "duplicate": True
+    }
+
+@router.post("/init", response_model=UploadInitResponse)
+async def initialize_upload(
+    upload_data: UploadInitRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Initialize a multipart upload session"""
+    device = _get_owned_device(db, current_user, upload_data.route_name)
+    segment_ids = _upsert_route_segments(db, device, upload_data.route_name, [upload_data.segment_number])
 
+    # Re-uploads of stored content are skipped, along with their processing
+    duplicates = processing.find_duplicates(db, segment_ids, [upload_data])
+    if duplicates:
+        return _duplicate_upload(duplicates[(upload_data.segment_number, upload_data.file_type)], upload_data)
+
+    object_key = _object_key(device.dongle_id, upload_data.route_name, upload_data.segment_number, upload_data.file_type)
+    layout = _upload_layout(object_key, upload_data)
+    retry_after = upload_scheduler.admit(device.dongle_id, upload_data.file_type, object_key)
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Upload capacity exhausted, retry later",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+    try:
+        return await storage.run(
+            _start_upload,
+            current_user,
+            device.dongle_id,
+            upload_data.route_name,
+            upload_data,
+            layout
+        )
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to initialize upload: {str(e)}"
         )
 
+@router.post("/init/bulk", response_model=BulkUploadInitResponse)
+async def initialize_bulk_upload(
+    bulk_data: BulkUploadInitRequest,
+    response: Response,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Initialize uploads for many files of a route at once.
+
+    Files are admitted in priority order; those over the device or server
+    limits are returned with retry_after instead of an upload, and so are
+    those whose upload failed to start, with the error.
+    """
+    files = {(f.segment_number, f.file_type): f for f in bulk_data.files}
+    if len(files) != len(bulk_data.files):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Duplicate segment and file type"
+        )
+
+    device = _get_owned_device(db, current_user, bulk_data.route_name)
+    segment_ids = _upsert_route_segments(db, device, bulk_data.route_name, [f.segment_number for f in bulk_data.files])
+    duplicates = processing.find_duplicates(db, segment_ids, bulk_data.files)
+
+    layouts = {
+        key: _upload_layout(_object_key(device.dongle_id, bulk_data.route_name, *key), f)
+        for key, f in files.items()
+        if key not in duplicates
+    }
+
+    deferred = {}
+    admitted = []
+    for segment_number, file_type in sorted(layouts, key=lambda key: (upload_scheduler.priority(key[1]), key[0])):
+        key = (segment_number, file_type)
+        object_key = _object_key(device.dongle_id, bulk_data.route_name, segment_number, file_type)
+        retry_after = upload_scheduler.admit(device.dongle_id, file_type, object_key)
+        if retry_after:
+            deferred[key] = retry_after
+        else:
+            admitted.append(key)
+
+    # S3 round trips run concurrently in the storage thread pool. A file that
+    # fails has been abandoned by _start_upload, so it holds no slot, session
+    # or open multipart upload, and the others still go ahead
+    results = await asyncio.gather(*[
+        storage.run(
+            _start_upload,
+            current_user,
+            device.dongle_id,
+            bulk_data.route_name,
+            files[key],
+            layouts[key]
+        )
+        for key in admitted
+    ], return_exceptions=True)
+    started = {}
+    failed = {}
+    for key, result in zip(admitted, results):
+        if isinstance(result, Exception):
+            failed[key] = f"Failed to initialize upload: {str(result)}"
+            deferred[key] = upload_scheduler.RETRY_AFTER
+        else:
+            started[key] = result
+
+    uploads = []
+    for key, f in files.items():
+        if key in duplicates:
+            uploads.append(_duplicate_upload(duplicates[key], f))
+        elif key in deferred:
+            uploads.append(_deferred_upload(device.dongle_id, bulk_data.route_name, f, deferred[key], failed.get(key)))
+        else:
+            uploads.append(started[key])
+
+    if deferred:
+        response.headers["Retry-After"] = str(min(deferred.values()))
+
+    return {
+        "route_name": bulk_data.route_name,
+        "uploads": uploads
+    }
+
+@router.post("/parts", response_model=UploadPartsResponse)
+async def get_part_urls(
+    parts_data: UploadPartsRequest,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Presign upload URLs for further parts of a multipart upload"""
+    session = _get_upload_session(parts_data.upload_id, current_user)
+
+    part_numbers = sorted(set(parts_data.part_numbers))
+    _check_part_numbers(session, part_numbers)
+    if len(part_numbers) > PRESIGNED_URL_WINDOW:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {PRESIGNED_URL_WINDOW} parts can be requested at once"
+        )
+    # Only a valid request keeps the upload's slot alive
+    upload_scheduler.refresh(session["dongle_id"], session["object_key"])
+
+    return {
+        "upload_id": parts_data.upload_id,
+        "parts": _presign_parts(
+            session["object_key"],
+            parts_data.upload_id,
+            part_numbers,
+            upload_sessions.get_part_md5s(parts_data.upload_id)
+        )
+    }
+
+@router.post("/resume", response_model=UploadResumeResponse)
+async def resume_upload(
+    upload_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Get the parts still missing from an interrupted upload"""
+    session = _get_upload_session(upload_id, current_user)
+
+    md5s = upload_sessions.get_part_md5s(upload_id)
+
+    if session["status"] == "completed":
+        missing_parts = []
+    else:
+        # S3 is the source of truth for which parts actually arrived
+        try:
+            uploaded = await storage.run(_list_uploaded_parts, session, md5s)
+        except ClientError as e:
+            _raise_for_s3_error(e, "list uploaded parts")
+        upload_sessions.replace_parts(upload_id, uploaded)
+        upload_scheduler.refresh(session["dongle_id"], session["object_key"])
+        missing_parts = [
+            part_number
+            for part_number in range(1, session["part_count"] + 1)
+            if part_number not in uploaded
+        ]
+
+    return {
+        "upload_id": upload_id,
+        "object_key": session["object_key"],
+        "chunk_size": session["chunk_size"],
+        "part_count": session["part_count"],
+        "missing_parts": missing_parts,
+        "parts": _presign_parts(session["object_key"], upload_id, missing_parts[:PRESIGNED_URL_WINDOW], md5s)
+    }
+
 @router.post("/chunk")
 async def upload_chunk(
-    file: UploadFile = File(...),
-    upload_id: str = None,
-    part_number: int = None,
+    request: Request,
+    upload_id: str,
+    part_number: int,
+    content_length: Optional[int] = Header(None),
+    content_md5: Optional[str] = Header(None),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Upload a file chunk"""
-    # TODO: Implement chunk upload
-    return {"message": "Chunk uploaded successfully"}
+    """Upload a file chunk, streaming the raw request body through to S3"""
+    session = _get_upload_session(upload_id, current_user)
+    _check_part_numbers(session, [part_number])
+
+    # S3 checks the body against the declared MD5 while it streams through
+    md5 = upload_sessions.get_part_md5s(upload_id).get(part_number)
+    if md5 and content_md5 and _md5_hex(content_md5) != _md5_hex(md5):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Content-MD5 does not match the MD5 declared for part {part_number}"
+        )
+    md5 = md5 or content_md5
+    if md5:
+        _md5_hex(md5)
+    checksum = {'ContentMD5': md5} if md5 else {}
+
+    if content_length is None:
+        raise HTTPException(
+            status_code=status.HTTP_411_LENGTH_REQUIRED,
+            detail="Content-Length is required"
+        )
+    if content_length != _part_size(session, part_number):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Part {part_number} must be {_part_size(session, part_number)} bytes"
+        )
+
+    # A part waiting for a thread would hold its connection open for nothing
+    if stream_slots.locked():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many parts uploading, retry later",
+            headers={"Retry-After": str(upload_scheduler.RETRY_AFTER)}
+        )
+
+    # The blocking S3 call runs in a stream thread and pulls the body as it sends
+    async with stream_slots:
+        try:
+            result = await stream_storage.run(
+                stream_storage.client.upload_part,
+                Bucket=MINIO_BUCKET,
+                Key=session["object_key"],
+                UploadId=upload_id,
+                PartNumber=part_number,
+                ContentLength=content_length,
+                Body=_RequestBodyReader(request),
+                **checksum
+            )
+        except (ClientError, S3ConnectionError, HTTPClientError, UnseekableStreamError) as e:
+            _raise_for_stream_error(e)
+
+    etag = result['ETag'].strip('"')
+    upload_sessions.record_part(upload_id, part_number, etag)
+    upload_scheduler.refresh(session["dongle_id"], session["object_key"])
+
+    return {
+        "upload_id": upload_id,
+        "part_number": part_number,
+        "etag": etag
+    }
+
+async def _claim_completion(upload_id: str, user: User) -> tuple:
+    """Wait until this request may complete the upload, or another one has.
+
+    Returns (session, claimed). A request that loses the race to a concurrent
+    complete gets the session as the winner stored it, rather than the
+    NoSuchUpload of an upload S3 already assembled.
+    """
+    deadline = asyncio.get_running_loop().time() + COMPLETE_WAIT
+    while True:
+        session = _get_upload_session(upload_id, user)
+        if session["status"] == "completed":
+            return session, False
+        if upload_sessions.claim_completion(upload_id):
+            # The previous holder may have finished between the two reads
+            session = _get_upload_session(upload_id, user)
+            if session["status"] == "completed":
+                upload_sessions.release_completion(upload_id)
+                return session, False
+            return session, True
+        if asyncio.get_running_loop().time() >= deadline:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Upload is being completed by another request",
+                headers={"Retry-After": str(upload_scheduler.RETRY_AFTER)}
+            )
+        await asyncio.sleep(COMPLETE_POLL_INTERVAL)
+
+async def _complete_claimed(session: dict, complete_data: UploadCompleteRequest) -> dict:
+    """Assemble a claimed upload in S3, verify it and mark its session completed"""
+    md5s = upload_sessions.get_part_md5s(session["upload_id"])
+    try:
+        if complete_data.parts:
+            parts = {part.part_number: part.etag.strip('"') for part in complete_data.parts}
+            if len(parts) != len(complete_data.parts):
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Duplicate part numbers"
+                )
+            mismatched = [
+                part_number
+                for part_number, etag in sorted(parts.items())
+                if part_number in md5s and etag != _md5_hex(md5s[part_number])
+            ]
+            if mismatched:
+                raise HTTPException(
+                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    detail=f"Checksum mismatch for parts: {mismatched}"
+                )
+        else:
+            parts = await storage.run(_list_uploaded_parts, session, md5s)
+
+        missing_parts = set(range(1, session["part_count"] + 1)) - set(parts)
+        if missing_parts:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Missing parts: {sorted(missing_parts)}"
+            )
+
+        result = await storage.run(
+            storage.client.complete_multipart_upload,
+            Bucket=MINIO_BUCKET,
+            Key=session["object_key"],
+            UploadId=session["upload_id"],
+            MultipartUpload={
+                'Parts': [
+                    {'PartNumber': part_number, 'ETag': parts[part_number]}
+                    for part_number in sorted(parts)
+                ]
+            }
+        )
+    except ClientError as e:
+        # A holder whose claim expired mid-call may still have finished the upload
+        stored = upload_sessions.get_session(session["upload_id"])
+        if e.response.get('Error', {}).get('Code') == 'NoSuchUpload' and stored and stored["status"] == "completed":
+            return stored
+        _raise_for_s3_error(e, "complete upload")
+
+    session["etag"] = result['ETag'].strip('"')
+
+    # The multipart ETag is derived from the part MD5s, so the whole object
+    # is verified without reading it back
+    session["verified"] = str(len(md5s) == session["part_count"])
+    if md5s and session["etag"] != _multipart_etag(md5s):
+        await storage.run(storage.client.delete_object, Bucket=MINIO_BUCKET, Key=session["object_key"])
+        upload_sessions.delete_session(session["upload_id"])
+        upload_scheduler.release(session["dongle_id"], session["object_key"])
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Uploaded object does not match the declared checksums"
+        )
+
+    upload_sessions.update_session(
+        session["upload_id"],
+        status="completed",
+        etag=session["etag"],
+        verified=session["verified"]
+    )
+    upload_scheduler.release(session["dongle_id"], session["object_key"])
+
+    return session
 
-@router.post("/complete")
+@router.post("/complete", response_model=UploadCompleteResponse)
 async def complete_upload(
     complete_data: UploadCompleteRequest,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Complete multipart upload"""
-    # TODO: Implement upload completion
-    return {"message": "Upload completed successfully"}
+    # Retried and concurrent completes skip straight to recording and
+    # enqueueing, which are idempotent
+    session, claimed = await _claim_completion(complete_data.upload_id, current_user)
+    if claimed:
+        try:
+            session = await _complete_claimed(session, complete_data)
+        finally:
+            upload_sessions.release_completion(complete_data.upload_id)
+
+    # Hand the file to the worker as soon as it lands
+    segment = processing.record_upload(
+        db,
+        session["route_name"],
+        session["segment_number"],
+        session["file_type"],
+        session["object_key"],
+        session["etag"],
+        session["file_size"],
+        session.get("content_hash") or None
+    )
+    tasks = []
+    if segment:
+        tasks = processing.enqueue_processing(segment, session["file_type"], session["object_key"], session["etag"])
+
+    return {
+        "upload_id": complete_data.upload_id,
+        "object_key": session["object_key"],
+        "etag": session["etag"],
+        "part_count": session["part_count"],
+        "verified": session.get("verified") == "True",
+        "tasks": tasks
+    }
 
 @router.post("/cancel")
 async def cancel_upload(
@@ -149,7 +888,23 @@ async def cancel_upload(
     current_user: User = Depends(get_current_active_user)
 ):
     """Cancel an upload"""
-    # TODO: Implement upload cancellation
+    session = _get_upload_session(upload_id, current_user)
+
+    if session["status"] != "completed":
+        try:
+            await storage.run(
+                storage.client.abort_multipart_upload,
+                Bucket=MINIO_BUCKET,
+                Key=session["object_key"],
+                UploadId=upload_id
+            )
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'NoSuchUpload':
+                _raise_for_s3_error(e, "cancel upload")
+
+    upload_sessions.delete_session(upload_id)
+    upload_scheduler.release(session["dongle_id"], session["object_key"])
+
     return {"message": "Upload cancelled"}
 
 @router.get("/presigned")
@@ -157,42 +912,37 @@ async def get_presigned_url(
     route_name: str,
     segment_number: int,
     file_type: str,
+    content_md5: Optional[str] = None,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Get a presigned URL for direct S3 upload"""
-    # Parse route name
-    try:
-        dongle_id, timestamp = route_name.split('|')
-    except ValueError:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Invalid route name format"
-        )
+    """Get a presigned URL for direct S3 upload; report it with /presigned/complete once stored.
 
-    # Verify device ownership
-    device = db.query(Device).filter(
-        Device.dongle_id == dongle_id,
-        Device.owner_id == current_user.id
-    ).first()
+    The upload takes a scheduler slot like a multipart one, held until it is
+    reported or its lease runs out.
+    """
+    device = _get_owned_device(db, current_user, route_name)
 
-    if not device:
+    # Generate presigned URL
+    object_key = _object_key(device.dongle_id, route_name, segment_number, file_type)
+    if content_md5:
+        _md5_hex(content_md5)
+
+    retry_after = upload_scheduler.admit(device.dongle_id, file_type, object_key)
+    if retry_after:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Device not found"
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Upload capacity exhausted, retry later",
+            headers={"Retry-After": str(retry_after)}
         )
 
-    # Generate presigned URL
-    object_key = f"{dongle_id}/{route_name}/{segment_number}/{file_type}"
-
     try:
-        presigned_url = s3_client.generate_presigned_url(
-            'put_object',
-            Params={
-                'Bucket': MINIO_BUCKET,
-                'Key': object_key
-            },
-            ExpiresIn=3600
+        presigned_url = presigner.presign(
+            'PUT',
+            MINIO_BUCKET,
+            object_key,
+            expires_in=3600,
+            headers={'Content-MD5': content_md5} if content_md5 else None
         )
 
         return {
@@ -201,7 +951,128 @@ async def get_presigned_url(
         }
 
     except Exception as e:
+        upload_scheduler.release(device.dongle_id, object_key)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to generate presigned URL: {str(e)}"
         )
+
+@router.post("/presigned/batch", response_model=BatchPresignResponse)
+async def get_presigned_urls(
+    batch_data: BatchPresignRequest,
+    response: Response,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Get presigned URLs for many files of one device, authorizing it once.
+
+    Files are admitted in priority order, as for /init/bulk; those over the
+    device or server limits are returned with retry_after instead of a URL.
+    """
+    device = _get_device(db, current_user, batch_data.dongle_id)
+
+    for f in batch_data.files:
+        if _route_dongle_id(f.route_name) != device.dongle_id:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Route {f.route_name} does not belong to device {device.dongle_id}"
+            )
+        if f.content_md5:
+            _md5_hex(f.content_md5)
+
+    object_keys = [_object_key(device.dongle_id, f.route_name, f.segment_number, f.file_type) for f in batch_data.files]
+    deferred = {}
+    for i in sorted(range(len(batch_data.files)), key=lambda i: (upload_scheduler.priority(batch_data.files[i].file_type), i)):
+        retry_after = upload_scheduler.admit(device.dongle_id, batch_data.files[i].file_type, object_keys[i])
+        if retry_after:
+            deferred[i] = retry_after
+
+    urls = []
+    for i, (f, object_key) in enumerate(zip(batch_data.files, object_keys)):
+        url = {
+            "route_name": f.route_name,
+            "segment_number": f.segment_number,
+            "file_type": f.file_type,
+            "object_key": object_key,
+            "presigned_url": None,
+            "retry_after": deferred.get(i)
+        }
+        if i not in deferred:
+            url["presigned_url"] = presigner.presign(
+                'PUT',
+                MINIO_BUCKET,
+                object_key,
+                expires_in=PRESIGNED_URL_EXPIRATION,
+                headers={'Content-MD5': f.content_md5} if f.content_md5 else None
+            )
+        urls.append(url)
+
+    if deferred:
+        response.headers["Retry-After"] = str(min(deferred.values()))
+
+    return {
+        "dongle_id": device.dongle_id,
+        "expires_in": PRESIGNED_URL_EXPIRATION,
+        "urls": urls
+    }
+
+@router.post("/presigned/complete", response_model=PresignedCompleteResponse)
+async def complete_presigned_upload(
+    complete_data: PresignedCompleteRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Record a file uploaded with a presigned PUT and enqueue its processing.
+
+    Safe to call again for the same object; recording and enqueueing are idempotent.
+    """
+    device = _get_owned_device(db, current_user, complete_data.route_name)
+    object_key = _object_key(device.dongle_id, complete_data.route_name, complete_data.segment_number, complete_data.file_type)
+
+    try:
+        head = await storage.run(storage.client.head_object, Bucket=MINIO_BUCKET, Key=object_key)
+    except ClientError as e:
+        # HEAD responses have no body, so a missing key comes back as a bare 404
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey'):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Uploaded object not found"
+            )
+        _raise_for_s3_error(e, "complete upload")
+
+    # The PUT is over either way; free its slot
+    upload_scheduler.release(device.dongle_id, object_key)
+
+    # A single PUT's ETag is the hex MD5 of the object
+    etag = head['ETag'].strip('"')
+    verified = False
+    if complete_data.content_md5:
+        verified = etag == _md5_hex(complete_data.content_md5)
+        if not verified:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Uploaded object does not match the declared checksum"
+            )
+
+    _upsert_route_segments(db, device, complete_data.route_name, [complete_data.segment_number])
+    segment = processing.record_upload(
+        db,
+        complete_data.route_name,
+        complete_data.segment_number,
+        complete_data.file_type,
+        object_key,
+        etag,
+        head['ContentLength'],
+        complete_data.content_hash
+    )
+    tasks = []
+    if segment:
+        tasks = processing.enqueue_processing(segment, complete_data.file_type, object_key, etag)
+
+    return {
+        "object_key": object_key,
+        "etag": etag,
+        "file_size": head['ContentLength'],
+        "verified": verified,
+        "tasks": tasks
+    }
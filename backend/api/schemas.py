@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import AliasChoices, BaseModel, EmailStr, Field
 from typing import Optional, List
 from datetime import datetime
 from uuid import UUID
@@ -119,12 +119,72 @@ class RouteSegmentResponse(BaseModel):
     def has_log(self) -> bool:
         return self.log_path is not None
 
+class SegmentVideoURL(BaseModel):
+    segment_number: int
+    codec: str
+    url: Optional[str] = None  # None while the rendition is being produced
+
+class RouteVideoResponse(BaseModel):
+    route_name: str
+    codec: Optional[str] = None  # Codec asked for; None when each segment offers what it has
+    expires_in: int
+    segments: List[SegmentVideoURL]
+
+class SegmentSprites(BaseModel):
+    segment_number: int
+    count: int  # Tiles, the last sheet may be partly filled
+    sheets: List[str]
+
+class RouteSpritesResponse(BaseModel):
+    """Timeline sprite sheets of a route; tile n of a segment covers n * interval seconds"""
+    route_name: str
+    interval: int
+    tile_width: int
+    tile_height: int
+    columns: int
+    rows: int
+    expires_in: int
+    segments: List[SegmentSprites]
+
+class RouteThumbnailResponse(BaseModel):
+    route_name: str
+    segment_number: int
+    expires_in: int
+    url: str
+
+class RouteGeometryResponse(BaseModel):
+    """A route's path at the detail of a map zoom level, as a Google encoded polyline (1e-5 degrees)"""
+    route_name: str
+    max_zoom: int  # Highest zoom the simplification is meant for
+    tolerance_meters: float
+    points: int
+    polyline: str
+
+class RouteGeometryListResponse(BaseModel):
+    zoom: int
+    routes: List[RouteGeometryResponse]
+
+class RouteHLSResponse(BaseModel):
+    """Master playlist of a route, with a media token for players that cannot send headers"""
+    route_name: str
+    expires_in: int
+    url: str
+
+class RoutePreviewResponse(BaseModel):
+    """Time-lapse of a whole route, as an MP4 and a GIF"""
+    route_name: str
+    segments: int  # Segments the preview was built from
+    expires_in: int
+    video_url: str
+    gif_url: str
+
 # Event Schemas
 class EventResponse(BaseModel):
     id: UUID
     event_type: str
     timestamp: datetime
-    metadata: Optional[dict] = None
+    # Event.metadata_ on the model, since declarative classes reserve metadata
+    metadata: Optional[dict] = Field(None, validation_alias=AliasChoices("metadata_", "metadata"))
 
     class Config:
         from_attributes = True
@@ -132,18 +192,114 @@ class EventResponse(BaseModel):
 # Upload Schemas
 class UploadInitRequest(BaseModel):
     route_name: str
-    segment_number: int
+    segment_number: int = Field(..., ge=0)
     file_type: str  # 'log', 'video', 'qlog', 'qcamera'
-    file_size: int
+    file_size: int = Field(..., ge=0)
+    chunk_size: Optional[int] = None  # Part size chosen by the device, defaults to the server's
+    part_md5s: Optional[List[str]] = None  # Base64 MD5 of every part, bound into the part URLs
+    content_hash: Optional[str] = Field(None, pattern=r'^[0-9a-f]{64}$')  # Hex SHA-256 of the whole file
 
-class UploadInitResponse(BaseModel):
-    upload_id: str
+class UploadPartURL(BaseModel):
+    part_number: int
     presigned_url: str
+
+class UploadInitResponse(BaseModel):
+    upload_id: Optional[str] = None  # None when the file is a duplicate
+    presigned_url: Optional[str] = None  # URL for part 1, kept for single-part clients
+    object_key: str
+    segment_number: int
+    file_type: str
     chunk_size: int = 10485760  # 10MB
+    part_count: int = 1
+    parts: List[UploadPartURL] = []  # First window of part URLs, refresh with /parts
+    duplicate: bool = False  # Same content already stored for this segment and file type, skip uploading
+    retry_after: Optional[int] = None  # Seconds to wait before initializing again when the upload was deferred
+    error: Optional[str] = None  # Why a bulk upload failed to start; initialize it again after retry_after
+
+class BulkUploadFile(BaseModel):
+    segment_number: int = Field(..., ge=0)
+    file_type: str
+    file_size: int = Field(..., ge=0)
+    chunk_size: Optional[int] = None
+    part_md5s: Optional[List[str]] = None
+    content_hash: Optional[str] = Field(None, pattern=r'^[0-9a-f]{64}$')
+
+class BulkUploadInitRequest(BaseModel):
+    route_name: str
+    files: List[BulkUploadFile] = Field(..., min_length=1, max_length=1000)
+
+class BulkUploadInitResponse(BaseModel):
+    route_name: str
+    uploads: List[UploadInitResponse]
+
+class PresignFile(BaseModel):
+    route_name: str
+    segment_number: int = Field(..., ge=0)
+    file_type: str
+    content_md5: Optional[str] = None
+
+class BatchPresignRequest(BaseModel):
+    dongle_id: str
+    files: List[PresignFile] = Field(..., min_length=1, max_length=1000)
+
+class PresignedFileURL(BaseModel):
+    route_name: str
+    segment_number: int
+    file_type: str
+    object_key: str
+    presigned_url: Optional[str] = None  # None when the upload was deferred
+    retry_after: Optional[int] = None  # Seconds to wait before asking again when the upload was deferred
+
+class BatchPresignResponse(BaseModel):
+    dongle_id: str
+    expires_in: int
+    urls: List[PresignedFileURL]
+
+class PresignedCompleteRequest(BaseModel):
+    route_name: str
+    segment_number: int = Field(..., ge=0)
+    file_type: str
+    content_md5: Optional[str] = None  # Base64 MD5 the URL was presigned with
+    content_hash: Optional[str] = Field(None, pattern=r'^[0-9a-f]{64}$')  # Hex SHA-256 of the whole file
+
+class PresignedCompleteResponse(BaseModel):
+    object_key: str
+    etag: str
+    file_size: int
+    verified: bool = False  # ETag matched the declared content MD5
+    tasks: List[str] = []  # Ids of the processing tasks enqueued by this call
+
+class UploadPartsRequest(BaseModel):
+    upload_id: str
+    part_numbers: List[int] = Field(..., min_length=1)
+
+class UploadPartsResponse(BaseModel):
+    upload_id: str
+    parts: List[UploadPartURL]
+
+class CompletedPart(BaseModel):
+    part_number: int = Field(..., ge=1)
+    etag: str
 
 class UploadCompleteRequest(BaseModel):
     upload_id: str
-    parts: List[dict]
+    parts: List[CompletedPart] = []  # Empty to complete with the parts stored in S3
+
+class UploadResumeResponse(BaseModel):
+    upload_id: str
+    object_key: str
+    chunk_size: int
+    part_count: int
+    missing_parts: List[int]
+    parts: List[UploadPartURL] = []  # First window of URLs for the missing parts
+
+class UploadCompleteResponse(BaseModel):
+    upload_id: str
+    object_key: str
+    etag: str
+    part_count: int
+    verified: bool = False  # ETag matched the composite of the declared part MD5s
+    tasks: List[str] = []  # Ids of the processing tasks enqueued by this call
 
 # Health Check
 class HealthResponse(BaseModel):
@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+# Tests import the service's modules the way it runs them, from backend/api
+# with backend/shared alongside (the image copies it to /app/shared)
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(API_DIR))
+sys.path.insert(0, API_DIR)
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    """An in-memory Redis (with Lua scripting) behind every module that talks to the API's Redis"""
+    fakeredis = pytest.importorskip("fakeredis")
+    import processing
+    import upload_scheduler
+    import upload_sessions
+
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(upload_sessions, "redis_client", client)
+    monkeypatch.setattr(upload_scheduler, "redis_client", client)
+    monkeypatch.setattr(upload_scheduler, "admit_script", client.register_script(upload_scheduler.ADMIT_SCRIPT))
+    monkeypatch.setattr(processing, "redis_client", client)
+    return client
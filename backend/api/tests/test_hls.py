@@ -0,0 +1,68 @@
+"""HLS playlists stitched from per-segment renditions"""
+from types import SimpleNamespace
+
+import hls
+
+def segment(variants: dict, bucket: str = "comma-data") -> SimpleNamespace:
+    return SimpleNamespace(renditions={"hls": {"bucket": bucket, "variants": variants}})
+
+def variant(prefix: str, durations: list, bandwidth: int = 800000) -> dict:
+    return {
+        "bandwidth": bandwidth,
+        "resolution": "576x360",
+        "codecs": "avc1.64001e",
+        "init": f"{prefix}/init.mp4",
+        "segments": [[f"{prefix}/{i}.m4s", duration] for i, duration in enumerate(durations)],
+    }
+
+def sign(bucket: str, key: str) -> str:
+    return f"https://minio.test/{bucket}/{key}?sig"
+
+def test_media_playlist_single_segment():
+    playlist = hls.media_playlist([segment({"360p": variant("r/0/360p", [4.0, 4.0, 2.5])})], "360p", sign)
+    assert playlist == "\n".join([
+        "#EXTM3U",
+        "#EXT-X-VERSION:7",
+        "#EXT-X-TARGETDURATION:4",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+        "#EXT-X-PLAYLIST-TYPE:VOD",
+        "#EXT-X-INDEPENDENT-SEGMENTS",
+        '#EXT-X-MAP:URI="https://minio.test/comma-data/r/0/360p/init.mp4?sig"',
+        "#EXTINF:4.000,",
+        "https://minio.test/comma-data/r/0/360p/0.m4s?sig",
+        "#EXTINF:4.000,",
+        "https://minio.test/comma-data/r/0/360p/1.m4s?sig",
+        "#EXTINF:2.500,",
+        "https://minio.test/comma-data/r/0/360p/2.m4s?sig",
+        "#EXT-X-ENDLIST",
+    ]) + "\n"
+
+def test_media_playlist_stitches_segments_with_discontinuities():
+    segments = [
+        segment({"360p": variant("r/0/360p", [4.0, 4.0])}),
+        segment({"360p": variant("r/1/360p", [4.2, 1.0])}, bucket="other"),
+    ]
+    lines = hls.media_playlist(segments, "360p", sign).splitlines()
+
+    # Target duration is the longest segment, rounded up
+    assert "#EXT-X-TARGETDURATION:5" in lines
+    assert lines.count("#EXT-X-DISCONTINUITY") == 1
+    discontinuity = lines.index("#EXT-X-DISCONTINUITY")
+    # Each segment's own init segment, from its own bucket, after the discontinuity
+    assert lines[discontinuity + 1] == '#EXT-X-MAP:URI="https://minio.test/other/r/1/360p/init.mp4?sig"'
+    assert lines[discontinuity - 1] == "https://minio.test/comma-data/r/0/360p/1.m4s?sig"
+    assert lines[-1] == "#EXT-X-ENDLIST"
+    assert sum(line.startswith("#EXTINF:") for line in lines) == 4
+
+def test_master_playlist_offers_variants_of_every_segment():
+    segments = [
+        segment({"360p": variant("r/0/360p", [4.0]), "720p": variant("r/0/720p", [4.0], 2500000)}),
+        segment({"360p": variant("r/1/360p", [4.0], 900000)}),
+    ]
+    lines = hls.master_playlist(segments, "token=abc").splitlines()
+
+    # 720p is missing from the second segment; 360p takes the peak bandwidth
+    assert lines[3:] == [
+        '#EXT-X-STREAM-INF:BANDWIDTH=900000,RESOLUTION=576x360,CODECS="avc1.64001e"',
+        "360p.m3u8?token=abc",
+    ]
@@ -0,0 +1,34 @@
+"""Media tokens, for the playlists native players fetch without headers"""
+import asyncio
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from auth import create_access_token, create_media_token, get_media_user_id, verify_media_token
+
+ROUTE = "a1b2c3d4e5f60708|2024-05-01--12-30-00"
+
+def test_media_token_round_trip():
+    token = create_media_token("user-1", ROUTE, timedelta(minutes=5))
+    assert verify_media_token(token, ROUTE) == "user-1"
+
+@pytest.mark.parametrize("token", [
+    create_media_token("user-1", "a1b2c3d4e5f60708|2024-05-02--08-00-00", timedelta(minutes=5)),
+    create_media_token("user-1", ROUTE, timedelta(minutes=-1)),
+    create_access_token({"sub": "user-1"}),
+    "not a token",
+], ids=["other-route", "expired", "access-token", "garbage"])
+def test_media_token_rejected(token):
+    with pytest.raises(HTTPException) as excinfo:
+        verify_media_token(token, ROUTE)
+    assert excinfo.value.status_code == 401
+
+def test_media_user_from_token():
+    token = create_media_token("user-1", ROUTE, timedelta(minutes=5))
+    assert asyncio.run(get_media_user_id(ROUTE, token=token, credentials=None, db=None)) == "user-1"
+
+def test_media_user_needs_token_or_header():
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(get_media_user_id(ROUTE, token=None, credentials=None, db=None))
+    assert excinfo.value.status_code == 401
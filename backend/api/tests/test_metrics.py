@@ -0,0 +1,28 @@
+"""The API's Prometheus endpoint, readable only with the scrape token"""
+import pytest
+from fastapi.testclient import TestClient
+
+import auth
+import main
+import processing
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(processing, "queue_depths", lambda: {"video": 3, "logs": 0})
+    return TestClient(main.app)
+
+def test_metrics_disabled_without_token(monkeypatch, client):
+    monkeypatch.setattr(auth, "METRICS_TOKEN", "")
+    assert client.get("/metrics").status_code == 404
+
+def test_metrics_require_the_token(monkeypatch, client):
+    monkeypatch.setattr(auth, "METRICS_TOKEN", "scrape")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+
+def test_queue_depths(monkeypatch, client):
+    monkeypatch.setattr(auth, "METRICS_TOKEN", "scrape")
+    response = client.get("/metrics", headers={"Authorization": "Bearer scrape"})
+    assert response.status_code == 200
+    assert 'celery_queue_length{queue="video"} 3' in response.text.splitlines()
+    assert 'celery_queue_length{queue="logs"} 0' in response.text.splitlines()
@@ -0,0 +1,98 @@
+"""SigV4Presigner against botocore's own presigning, with the clock frozen"""
+import datetime
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+import boto3
+import pytest
+from botocore.config import Config
+
+from presign import SigV4Presigner
+
+ENDPOINT = "http://minio:9000"
+ACCESS_KEY = "admin"
+SECRET_KEY = "password"
+NOW = datetime.datetime(2024, 5, 1, 23, 59, 30)
+CONTENT_MD5 = "XrY7u+Ae7tCTyyK7j1rNww=="
+
+KEYS = [
+    "a1b2c3d4e5f60708/2024-05-01--12-30-00--3/fcamera.hevc",
+    "a1b2c3d4e5f60708|2024-05-01--12-30-00/3/rlog.bz2",
+    "dongle/route with spaces/0/qcamera.ts",
+    "dongle/trajet-été/0/ünïcödé ✓.hevc",
+    "/leading//double//slashes/",
+]
+
+@pytest.fixture
+def boto_client():
+    return boto3.client(
+        "s3",
+        endpoint_url=ENDPOINT,
+        aws_access_key_id=ACCESS_KEY,
+        aws_secret_access_key=SECRET_KEY,
+        region_name="us-east-1",
+        config=Config(signature_version="s3v4", s3={"addressing_style": "path"})
+    )
+
+def boto_presign(client, operation: str, params: dict, expires_in: int, now=NOW) -> str:
+    class FrozenDatetime(datetime.datetime):
+        @classmethod
+        def utcnow(cls):
+            return now
+
+    with mock.patch("botocore.auth.datetime.datetime", FrozenDatetime):
+        return client.generate_presigned_url(operation, Params=params, ExpiresIn=expires_in)
+
+def assert_same_url(ours: str, theirs: str):
+    ours, theirs = urlsplit(ours), urlsplit(theirs)
+    assert (ours.scheme, ours.netloc, ours.path) == (theirs.scheme, theirs.netloc, theirs.path)
+    assert parse_qs(ours.query, keep_blank_values=True) == parse_qs(theirs.query, keep_blank_values=True)
+
+@pytest.mark.parametrize("content_md5", [None, CONTENT_MD5], ids=["plain", "content-md5"])
+@pytest.mark.parametrize("key", KEYS)
+def test_put_object_matches_botocore(boto_client, key, content_md5):
+    presigner = SigV4Presigner(ENDPOINT, ACCESS_KEY, SECRET_KEY)
+    params = {"Bucket": "comma-data", "Key": key}
+    headers = None
+    if content_md5:
+        params["ContentMD5"] = content_md5
+        headers = {"Content-MD5": content_md5}
+
+    ours = presigner.presign("PUT", "comma-data", key, expires_in=900, headers=headers, now=NOW)
+    assert_same_url(ours, boto_presign(boto_client, "put_object", params, 900))
+
+@pytest.mark.parametrize("content_md5", [None, CONTENT_MD5], ids=["plain", "content-md5"])
+@pytest.mark.parametrize("key", KEYS)
+def test_upload_part_matches_botocore(boto_client, key, content_md5):
+    presigner = SigV4Presigner(ENDPOINT, ACCESS_KEY, SECRET_KEY)
+    params = {"Bucket": "comma-data", "Key": key, "UploadId": "2~abc/def+ghi=", "PartNumber": 7}
+    headers = None
+    if content_md5:
+        params["ContentMD5"] = content_md5
+        headers = {"Content-MD5": content_md5}
+
+    ours = presigner.presign(
+        "PUT", "comma-data", key,
+        expires_in=3600,
+        params={"uploadId": "2~abc/def+ghi=", "partNumber": 7},
+        headers=headers,
+        now=NOW
+    )
+    assert_same_url(ours, boto_presign(boto_client, "upload_part", params, 3600))
+
+@pytest.mark.parametrize("key", KEYS)
+def test_get_object_matches_botocore(boto_client, key):
+    presigner = SigV4Presigner(ENDPOINT, ACCESS_KEY, SECRET_KEY)
+    ours = presigner.presign("GET", "comma-data", key, expires_in=3600, now=NOW)
+    theirs = boto_presign(boto_client, "get_object", {"Bucket": "comma-data", "Key": key}, 3600)
+    assert_same_url(ours, theirs)
+
+def test_signing_key_is_rederived_across_midnight(boto_client):
+    presigner = SigV4Presigner(ENDPOINT, ACCESS_KEY, SECRET_KEY)
+    key = KEYS[0]
+    presigner.presign("GET", "comma-data", key, now=NOW)
+
+    tomorrow = NOW + datetime.timedelta(minutes=1)
+    ours = presigner.presign("GET", "comma-data", key, now=tomorrow)
+    theirs = boto_presign(boto_client, "get_object", {"Bucket": "comma-data", "Key": key}, 3600, now=tomorrow)
+    assert_same_url(ours, theirs)
@@ -0,0 +1,69 @@
+"""Enqueueing worker tasks once per uploaded object"""
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+import processing
+
+class FakeCelery:
+    def __init__(self, fail=False):
+        self.sent = []
+        self.fail = fail
+
+    def send_task(self, name, args=None, task_id=None):
+        if self.fail:
+            raise ConnectionError("broker unavailable")
+        self.sent.append((name, args, task_id))
+
+@pytest.fixture
+def celery_app(monkeypatch, redis_client):
+    app = FakeCelery()
+    monkeypatch.setattr(processing, "celery_app", app)
+    return app
+
+@pytest.fixture
+def segment():
+    return SimpleNamespace(id=uuid.uuid4(), route_id=uuid.uuid4(), video_path="dongle/route/0/fcamera.hevc")
+
+def test_send_once_dedupes_on_marker(celery_app, redis_client):
+    task_id = processing._send_once("tasks.x", "processing:marker", ["a"])
+    assert task_id == str(uuid.uuid5(uuid.NAMESPACE_URL, "processing:marker"))
+    assert processing._send_once("tasks.x", "processing:marker", ["a"]) is None
+    assert celery_app.sent == [("tasks.x", ["a"], task_id)]
+    assert 0 < redis_client.ttl("processing:marker") <= processing.ENQUEUE_DEDUP_TTL
+
+def test_send_failure_clears_marker(monkeypatch, celery_app, redis_client):
+    monkeypatch.setattr(celery_app, "fail", True)
+    with pytest.raises(ConnectionError):
+        processing._send_once("tasks.x", "processing:marker", ["a"])
+    assert not redis_client.exists("processing:marker")
+
+    monkeypatch.setattr(celery_app, "fail", False)
+    assert processing._send_once("tasks.x", "processing:marker", ["a"])
+
+def test_enqueue_processing_once_per_etag(celery_app, segment):
+    args = [str(segment.route_id), str(segment.id), "key"]
+    assert len(processing.enqueue_processing(segment, "qlog.bz2", "key", "etag1")) == 1
+    assert processing.enqueue_processing(segment, "qlog.bz2", "key", "etag1") == []
+    # A re-upload with different content is processed again
+    assert len(processing.enqueue_processing(segment, "qlog.bz2", "key", "etag2")) == 1
+    assert celery_app.sent[0][:2] == ("tasks.parse_log_file", args)
+    assert len(celery_app.sent) == 2
+
+def test_enqueue_processing_by_file_type(celery_app, segment):
+    processing.enqueue_processing(segment, "fcamera.hevc", segment.video_path, "etag")
+    assert [name for name, _, _ in celery_app.sent] == ["tasks.process_video"]
+    assert processing.enqueue_processing(segment, "qcamera.ts", "key", "etag") == []
+    assert processing.enqueue_processing(segment, "unknown", "key", "etag") == []
+
+@pytest.mark.parametrize("request_task, task_name, ttl", [
+    (processing.request_transcode, "tasks.transcode_video", "TRANSCODE_REQUEST_TTL"),
+    (processing.request_hls, "tasks.package_hls", "HLS_REQUEST_TTL"),
+])
+def test_on_demand_requests(celery_app, redis_client, segment, request_task, task_name, ttl):
+    assert request_task(segment)
+    assert request_task(segment) is None
+    assert [name for name, _, _ in celery_app.sent] == [task_name]
+    marker = f"processing:{task_name}:{segment.video_path}"
+    assert 0 < redis_client.ttl(marker) <= getattr(processing, ttl)
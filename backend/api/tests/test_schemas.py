@@ -0,0 +1,16 @@
+"""Request validation of the upload schemas"""
+import pytest
+from pydantic import ValidationError
+
+from schemas import UploadInitRequest
+
+def init_request(**overrides) -> dict:
+    return {"route_name": "a1b2c3d4e5f60708|2024-05-01--12-30-00", "segment_number": 0,
+            "file_type": "qlog", "file_size": 1024, **overrides}
+
+def test_upload_init_accepts_first_segment():
+    assert UploadInitRequest(**init_request()).segment_number == 0
+
+def test_upload_init_rejects_negative_segment():
+    with pytest.raises(ValidationError):
+        UploadInitRequest(**init_request(segment_number=-1))
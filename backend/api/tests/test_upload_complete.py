@@ -0,0 +1,118 @@
+"""Completing a multipart upload once, however many completes race for it"""
+import asyncio
+import base64
+import hashlib
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from botocore.exceptions import ClientError
+from fastapi import HTTPException
+
+import processing
+import upload_sessions
+from routers import upload
+from schemas import UploadCompleteRequest
+
+UPLOAD_ID = "upload-1"
+PARTS = [b"a" * 16, b"b" * 8]
+MD5S = {n: base64.b64encode(hashlib.md5(data).digest()).decode() for n, data in enumerate(PARTS, 1)}
+ETAG = upload._multipart_etag(MD5S)
+
+class FakeS3:
+    def __init__(self):
+        self.completed = []
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.completed.append(UploadId)
+        return {'ETag': f'"{ETAG}"'}
+
+class FakeStorage:
+    """Runs calls inline after yielding to the event loop, as a slow S3 would"""
+    def __init__(self, client):
+        self.client = client
+
+    async def run(self, func, *args, **kwargs):
+        await asyncio.sleep(0.02)
+        return func(*args, **kwargs)
+
+@pytest.fixture
+def user():
+    return SimpleNamespace(id=uuid.uuid4())
+
+@pytest.fixture
+def s3(monkeypatch, redis_client, user):
+    client = FakeS3()
+    monkeypatch.setattr(upload, "storage", FakeStorage(client))
+    monkeypatch.setattr(upload, "COMPLETE_POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(processing, "record_upload", lambda db, *args: SimpleNamespace(args=args))
+    monkeypatch.setattr(processing, "enqueue_processing", lambda segment, file_type, key, etag: [f"task:{etag}"])
+
+    upload_sessions.create_session(
+        UPLOAD_ID,
+        user_id=user.id,
+        dongle_id="dongle",
+        route_name="dongle|2024-01-01--00-00-00",
+        segment_number=0,
+        file_type="qlog.bz2",
+        object_key="dongle/route/0/qlog.bz2",
+        file_size=sum(map(len, PARTS)),
+        chunk_size=16,
+        part_count=len(PARTS),
+        content_hash=""
+    )
+    upload_sessions.set_part_md5s(UPLOAD_ID, MD5S)
+    return client
+
+def complete(user):
+    request = UploadCompleteRequest(upload_id=UPLOAD_ID, parts=[
+        {"part_number": n, "etag": base64.b64decode(md5).hex()} for n, md5 in MD5S.items()
+    ])
+    return upload.complete_upload(request, current_user=user, db=None)
+
+def test_complete(s3, user):
+    result = asyncio.run(complete(user))
+    assert result["etag"] == ETAG
+    assert result["verified"]
+    assert result["tasks"] == [f"task:{ETAG}"]
+    assert upload_sessions.get_session(UPLOAD_ID)["status"] == "completed"
+
+def test_concurrent_completes_assemble_once(s3, user):
+    async def race():
+        return await asyncio.gather(complete(user), complete(user), complete(user))
+
+    results = asyncio.run(race())
+    assert s3.completed == [UPLOAD_ID]
+    assert {result["etag"] for result in results} == {ETAG}
+    # The losers still record and enqueue, which are idempotent
+    assert all(result["tasks"] == [f"task:{ETAG}"] for result in results)
+
+def test_retried_complete_returns_the_stored_result(s3, user):
+    asyncio.run(complete(user))
+    assert asyncio.run(complete(user))["etag"] == ETAG
+    assert s3.completed == [UPLOAD_ID]
+
+def test_held_claim_times_out_with_retry_after(monkeypatch, s3, user):
+    monkeypatch.setattr(upload, "COMPLETE_WAIT", 0.05)
+    assert upload_sessions.claim_completion(UPLOAD_ID)
+
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(complete(user))
+    assert e.value.status_code == 409
+    assert "Retry-After" in e.value.headers
+    assert s3.completed == []
+
+def test_upload_finished_by_an_expired_holder(monkeypatch, s3, user):
+    def complete_multipart_upload(**kwargs):
+        # The previous holder's call landed after its claim expired
+        upload_sessions.update_session(UPLOAD_ID, status="completed", etag=ETAG, verified=True)
+        raise ClientError({'Error': {'Code': 'NoSuchUpload'}}, 'CompleteMultipartUpload')
+
+    monkeypatch.setattr(s3, "complete_multipart_upload", complete_multipart_upload)
+    assert asyncio.run(complete(user))["etag"] == ETAG
+
+def test_other_users_cannot_complete(s3):
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(complete(SimpleNamespace(id=uuid.uuid4())))
+    assert e.value.status_code == 404
+    assert s3.completed == []
@@ -0,0 +1,85 @@
+"""Multipart layout and checksum helpers of the upload router"""
+import base64
+import hashlib
+
+import pytest
+from fastapi import HTTPException
+
+from routers.upload import (
+    CHUNK_SIZE,
+    MAX_PART_SIZE,
+    MAX_UPLOAD_PARTS,
+    MIN_PART_SIZE,
+    _md5_hex,
+    _multipart_etag,
+    _part_layout,
+)
+
+MiB = 1024 * 1024
+
+# A 10 MiB + 1 KiB object uploaded as two 5 MiB parts and a 1 KiB tail,
+# with the part MD5s and the ETag S3 reports for it
+KNOWN_PART_MD5S = {
+    1: "ebKBBg0ze5srhMzzkK3PdA==",
+    2: "dIQ6OrGTo4m87YmUAtmdXw==",
+    3: "I2Pl5jQ6Lyr9HgxzPysQ9A==",
+}
+KNOWN_ETAG = "c43647d2543bbb0984bac6210ff0eb6a-3"
+
+def test_multipart_etag_of_known_object():
+    assert _multipart_etag(KNOWN_PART_MD5S) == KNOWN_ETAG
+
+def test_multipart_etag_matches_part_contents():
+    parts = [b"a" * (5 * MiB), b"b" * (5 * MiB), b"c" * 1024]
+    md5s = {i + 1: base64.b64encode(hashlib.md5(part).digest()).decode() for i, part in enumerate(parts)}
+    assert md5s == KNOWN_PART_MD5S
+
+def test_multipart_etag_orders_parts_by_number():
+    shuffled = {number: KNOWN_PART_MD5S[number] for number in (3, 1, 2)}
+    assert _multipart_etag(shuffled) == KNOWN_ETAG
+
+def test_md5_hex():
+    assert _md5_hex("ebKBBg0ze5srhMzzkK3PdA==") == "79b281060d337b9b2b84ccf390adcf74"
+    assert _md5_hex(base64.b64encode(hashlib.md5(b"").digest()).decode()) == hashlib.md5(b"").hexdigest()
+
+@pytest.mark.parametrize("md5", [
+    "not base64!",
+    base64.b64encode(b"too short").decode(),
+    base64.b64encode(bytes(32)).decode(),
+    "",
+])
+def test_md5_hex_rejects_invalid(md5):
+    with pytest.raises(HTTPException) as excinfo:
+        _md5_hex(md5)
+    assert excinfo.value.status_code == 400
+
+@pytest.mark.parametrize("file_size, parts", [
+    (0, 1),
+    (1, 1),
+    (CHUNK_SIZE, 1),
+    (CHUNK_SIZE + 1, 2),
+    (10 * CHUNK_SIZE, 10),
+])
+def test_part_layout_default_chunk_size(file_size, parts):
+    assert _part_layout(file_size) == (CHUNK_SIZE, parts)
+
+def test_part_layout_grows_chunks_past_part_limit():
+    file_size = CHUNK_SIZE * MAX_UPLOAD_PARTS + 1
+    chunk_size, parts = _part_layout(file_size)
+    assert chunk_size > CHUNK_SIZE
+    assert parts == MAX_UPLOAD_PARTS
+    assert chunk_size * parts >= file_size
+
+def test_part_layout_device_chunk_size():
+    assert _part_layout(12 * MiB, MIN_PART_SIZE) == (MIN_PART_SIZE, 3)
+    assert _part_layout(12 * MiB, MAX_PART_SIZE) == (MAX_PART_SIZE, 1)
+
+@pytest.mark.parametrize("file_size, chunk_size", [
+    (12 * MiB, MIN_PART_SIZE - 1),
+    (12 * MiB, MAX_PART_SIZE + 1),
+    (MIN_PART_SIZE * MAX_UPLOAD_PARTS + 1, MIN_PART_SIZE),
+])
+def test_part_layout_rejects_device_chunk_size(file_size, chunk_size):
+    with pytest.raises(HTTPException) as excinfo:
+        _part_layout(file_size, chunk_size)
+    assert excinfo.value.status_code == 400
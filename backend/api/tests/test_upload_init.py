@@ -0,0 +1,134 @@
+"""Starting uploads: retried inits and presigned PUTs under the upload scheduler"""
+import asyncio
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from botocore.exceptions import ClientError
+from fastapi import HTTPException, Response
+
+import upload_scheduler
+import upload_sessions
+from routers import upload
+from schemas import BatchPresignRequest, UploadInitRequest
+
+ROUTE = "dongle|2024-01-01--00-00-00"
+MiB = 1024 * 1024
+
+class FakeS3:
+    """Multipart uploads in memory: {upload_id: {part_number: size}}"""
+
+    def __init__(self):
+        self.uploads = {}
+        self.aborted = []
+        self.created = 0
+
+    def create_multipart_upload(self, Bucket, Key):
+        self.created += 1
+        upload_id = f"upload-{self.created}"
+        self.uploads[upload_id] = {}
+        return {'UploadId': upload_id}
+
+    def list_parts(self, Bucket, Key, UploadId):
+        if UploadId not in self.uploads:
+            raise ClientError({'Error': {'Code': 'NoSuchUpload'}}, 'ListParts')
+        return {'Parts': [
+            {'PartNumber': n, 'ETag': f'"etag-{n}"', 'Size': size} for n, size in self.uploads[UploadId].items()
+        ]}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted.append(UploadId)
+        self.uploads.pop(UploadId, None)
+
+class FakePresigner:
+    def presign(self, method, bucket, key, expires_in, params=None, headers=None):
+        return f"https://minio.test/{bucket}/{key}?{params}"
+
+@pytest.fixture
+def s3(monkeypatch, redis_client):
+    client = FakeS3()
+    monkeypatch.setattr(upload, "storage", SimpleNamespace(client=client))
+    monkeypatch.setattr(upload, "presigner", FakePresigner())
+    monkeypatch.setattr(upload_scheduler, "DEVICE_CONCURRENCY", 2)
+    monkeypatch.setattr(upload_scheduler, "DEVICE_BURST", 100)
+    return client
+
+@pytest.fixture
+def user():
+    return SimpleNamespace(id=uuid.uuid4())
+
+def start(user, file_size=12 * MiB, segment_number=0):
+    upload_data = UploadInitRequest(
+        route_name=ROUTE, segment_number=segment_number, file_type="qlog.bz2", file_size=file_size, chunk_size=5 * MiB
+    )
+    object_key = upload._object_key("dongle", ROUTE, segment_number, "qlog.bz2")
+    assert upload_scheduler.admit("dongle", upload_data.file_type, object_key) is None
+    return upload._start_upload(user, "dongle", ROUTE, upload_data, upload._upload_layout(object_key, upload_data))
+
+def test_retried_init_continues_the_upload(s3, user):
+    first = start(user)
+    assert [part["part_number"] for part in first["parts"]] == [1, 2, 3]
+    s3.uploads[first["upload_id"]][1] = 5 * MiB
+
+    retried = start(user)
+    assert retried["upload_id"] == first["upload_id"]
+    assert [part["part_number"] for part in retried["parts"]] == [2, 3]
+    assert retried["presigned_url"] is None
+    assert len(s3.uploads) == 1 and s3.aborted == []
+    assert upload_sessions.get_parts(first["upload_id"]) == {1: "etag-1"}
+
+def test_changed_file_replaces_the_upload(s3, user):
+    first = start(user)
+    second = start(user, file_size=11 * MiB)
+    assert second["upload_id"] != first["upload_id"]
+    assert s3.aborted == [first["upload_id"]]
+    assert upload_sessions.get_session(first["upload_id"]) is None
+    # The object keeps its scheduler slot
+    assert upload_scheduler.admit("dongle", "qlog.bz2", second["object_key"]) is None
+
+def test_another_users_upload_is_replaced(s3, user):
+    first = start(user)
+    second = start(SimpleNamespace(id=uuid.uuid4()))
+    assert second["upload_id"] != first["upload_id"]
+    assert s3.aborted == [first["upload_id"]]
+
+def test_upload_gone_from_s3_is_restarted(s3, user):
+    first = start(user)
+    del s3.uploads[first["upload_id"]]
+    assert start(user)["upload_id"] != first["upload_id"]
+
+def test_completed_upload_is_not_continued(s3, user):
+    first = start(user)
+    upload_sessions.update_session(first["upload_id"], status="completed")
+    assert start(user)["upload_id"] != first["upload_id"]
+    assert s3.aborted == []
+
+@pytest.fixture
+def device(monkeypatch):
+    device = SimpleNamespace(dongle_id="dongle")
+    monkeypatch.setattr(upload, "_get_device", lambda db, user, dongle_id: device)
+    return device
+
+def test_presigned_put_takes_a_slot(s3, user, device):
+    for segment_number in (0, 1):
+        asyncio.run(upload.get_presigned_url(ROUTE, segment_number, "qlog.bz2", current_user=user, db=None))
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(upload.get_presigned_url(ROUTE, 2, "qlog.bz2", current_user=user, db=None))
+    assert e.value.status_code == 429
+    assert e.value.headers["Retry-After"] == str(upload_scheduler.RETRY_AFTER)
+
+def test_presigned_batch_defers_files_over_the_limits(s3, user, device):
+    batch = BatchPresignRequest(dongle_id="dongle", files=[
+        {"route_name": ROUTE, "segment_number": 0, "file_type": "fcamera.hevc"},
+        {"route_name": ROUTE, "segment_number": 0, "file_type": "qlog.bz2"},
+        {"route_name": ROUTE, "segment_number": 1, "file_type": "qlog.bz2"},
+    ])
+    response = Response()
+    result = asyncio.run(upload.get_presigned_urls(batch, response, current_user=user, db=None))
+
+    # qlogs go first; the fcamera waits for a slot
+    fcamera, *qlogs = result["urls"]
+    assert all(url["presigned_url"] for url in qlogs)
+    assert fcamera["presigned_url"] is None
+    assert fcamera["retry_after"] == upload_scheduler.RETRY_AFTER * 4
+    assert response.headers["Retry-After"] == str(fcamera["retry_after"])
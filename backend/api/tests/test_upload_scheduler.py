@@ -0,0 +1,108 @@
+"""Upload admission: priority shares, per-device and global limits, token buckets (Lua in Redis)"""
+from types import SimpleNamespace
+
+import pytest
+
+import upload_scheduler
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Frozen time.time() of the scheduler, advanced by hand"""
+    clock = SimpleNamespace(now=1_700_000_000.0)
+    monkeypatch.setattr(upload_scheduler, "time", SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+@pytest.fixture
+def limits(monkeypatch, redis_client, clock):
+    """Small limits, with buckets deep enough not to interfere unless a test lowers them"""
+    for name, value in {
+        "DEVICE_CONCURRENCY": 2,
+        "GLOBAL_CONCURRENCY": 4,
+        "DEVICE_RATE": 1.0,
+        "DEVICE_BURST": 100,
+        "GLOBAL_RATE": 10.0,
+        "GLOBAL_BURST": 1000,
+        "SLOT_TTL": 60,
+        "RETRY_AFTER": 5,
+    }.items():
+        monkeypatch.setattr(upload_scheduler, name, value)
+    return upload_scheduler
+
+def test_priority():
+    assert upload_scheduler.priority("qlog.bz2") == 0
+    assert upload_scheduler.priority("qcamera.ts") == 1
+    assert upload_scheduler.priority("rlog.zst") == 2
+    assert upload_scheduler.priority("fcamera.hevc") == 3
+    assert upload_scheduler.priority("dcamera.hevc") == upload_scheduler.LOWEST_PRIORITY
+
+def test_device_concurrency(limits):
+    assert limits.admit("dongle", "qlog", "a") is None
+    assert limits.admit("dongle", "qlog", "b") is None
+    assert limits.admit("dongle", "qlog", "c") == limits.RETRY_AFTER
+    # Lower priorities are told to back off longer
+    assert limits.admit("dongle", "fcamera", "d") == limits.RETRY_AFTER * 4
+    assert limits.admit("other", "qlog", "c") is None
+
+def test_retried_init_keeps_its_slot(limits, redis_client):
+    assert limits.admit("dongle", "qlog", "a") is None
+    assert limits.admit("dongle", "qlog", "b") is None
+    assert limits.admit("dongle", "qlog", "a") is None
+    assert redis_client.zcard(limits.GLOBAL_SLOTS_KEY) == 2
+
+def test_release_frees_the_slot(limits):
+    limits.admit("dongle", "qlog", "a")
+    limits.admit("dongle", "qlog", "b")
+    limits.release("dongle", "a")
+    assert limits.admit("dongle", "qlog", "c") is None
+
+def test_priority_shares_of_global_slots(limits):
+    # fcameras may use half of the 4 global slots, qlogs all of them
+    assert limits.admit("d1", "fcamera", "f1") is None
+    assert limits.admit("d2", "fcamera", "f2") is None
+    assert limits.admit("d3", "fcamera", "f3") == limits.RETRY_AFTER * 4
+    assert limits.admit("d3", "rlog", "r1") is None
+    assert limits.admit("d4", "rlog", "r2") == limits.RETRY_AFTER * 3
+    assert limits.admit("d4", "qlog", "q1") is None
+    assert limits.admit("d5", "qlog", "q2") == limits.RETRY_AFTER
+
+def test_expired_leases_are_reclaimed(limits, clock):
+    limits.admit("dongle", "qlog", "a")
+    limits.admit("dongle", "qlog", "b")
+    clock.now += limits.SLOT_TTL + 1
+    assert limits.admit("dongle", "qlog", "c") is None
+
+def test_refresh_extends_only_held_leases(limits, clock, redis_client):
+    limits.admit("dongle", "qlog", "a")
+    limits.admit("dongle", "qlog", "b")
+    clock.now += limits.SLOT_TTL - 1
+    limits.refresh("dongle", "a")
+    limits.refresh("dongle", "never-admitted")
+    clock.now += 2
+    # b ran out, a was extended
+    assert limits.admit("dongle", "qlog", "c") is None
+    assert limits.admit("dongle", "qlog", "d") == limits.RETRY_AFTER
+    assert redis_client.zscore(limits.GLOBAL_SLOTS_KEY, "never-admitted") is None
+
+def test_device_token_bucket(limits, monkeypatch, clock):
+    monkeypatch.setattr(limits, "DEVICE_CONCURRENCY", 100)
+    monkeypatch.setattr(limits, "GLOBAL_CONCURRENCY", 100)
+    monkeypatch.setattr(limits, "DEVICE_BURST", 2)
+    monkeypatch.setattr(limits, "DEVICE_RATE", 0.5)
+    assert limits.admit("dongle", "qlog", "a") is None
+    assert limits.admit("dongle", "qlog", "b") is None
+    # One token refills in 1 / 0.5 seconds
+    assert limits.admit("dongle", "qlog", "c") == 2
+    clock.now += 2
+    assert limits.admit("dongle", "qlog", "c") is None
+
+def test_global_bucket_holds_back_tokens_for_higher_priorities(limits, monkeypatch, clock):
+    monkeypatch.setattr(limits, "GLOBAL_CONCURRENCY", 100)
+    monkeypatch.setattr(limits, "DEVICE_CONCURRENCY", 100)
+    monkeypatch.setattr(limits, "GLOBAL_BURST", 4)
+    monkeypatch.setattr(limits, "GLOBAL_RATE", 1.0)
+    # An fcamera needs 1 + 4 * (1 - 0.5) = 3 tokens left in the bucket
+    assert limits.admit("d1", "fcamera", "f1") is None
+    assert limits.admit("d2", "fcamera", "f2") is None
+    assert limits.admit("d3", "fcamera", "f3") == 1
+    assert limits.admit("d3", "qlog", "q1") is None
+    assert limits.admit("d4", "qlog", "q2") is None
@@ -0,0 +1,62 @@
+"""Redis registry of multipart upload sessions"""
+import upload_sessions
+
+def test_session_round_trip(redis_client):
+    upload_sessions.create_session(
+        "up-1", user_id="user-1", object_key="dongle/route/0/qlog.bz2",
+        segment_number=0, file_size=1024, chunk_size=512, part_count=2
+    )
+    session = upload_sessions.get_session("up-1")
+    assert session["upload_id"] == "up-1"
+    assert session["status"] == "uploading"
+    assert (session["segment_number"], session["file_size"], session["chunk_size"], session["part_count"]) == (0, 1024, 512, 2)
+    assert 0 < redis_client.ttl("upload:up-1") <= upload_sessions.UPLOAD_SESSION_TTL
+
+    upload_sessions.update_session("up-1", status="completed", etag="abc-2")
+    assert upload_sessions.get_session("up-1")["status"] == "completed"
+
+def test_missing_session(redis_client):
+    assert upload_sessions.get_session("nope") is None
+
+def test_parts(redis_client):
+    upload_sessions.create_session("up-1", user_id="user-1")
+    upload_sessions.record_part("up-1", 2, "etag-2")
+    upload_sessions.record_part("up-1", 1, "etag-1")
+    assert upload_sessions.get_parts("up-1") == {1: "etag-1", 2: "etag-2"}
+
+    upload_sessions.replace_parts("up-1", {3: "etag-3"})
+    assert upload_sessions.get_parts("up-1") == {3: "etag-3"}
+    upload_sessions.replace_parts("up-1", {})
+    assert upload_sessions.get_parts("up-1") == {}
+
+def test_part_md5s(redis_client):
+    upload_sessions.set_part_md5s("up-1", {1: "md5-1", 2: "md5-2"})
+    assert upload_sessions.get_part_md5s("up-1") == {1: "md5-1", 2: "md5-2"}
+
+def test_completion_claim_is_exclusive(redis_client):
+    assert upload_sessions.claim_completion("up-1")
+    assert not upload_sessions.claim_completion("up-1")
+    assert 0 < redis_client.ttl("upload:up-1:completing") <= upload_sessions.COMPLETION_CLAIM_TTL
+    upload_sessions.release_completion("up-1")
+    assert upload_sessions.claim_completion("up-1")
+
+def test_delete_session_removes_everything(redis_client):
+    upload_sessions.create_session("up-1", user_id="user-1")
+    upload_sessions.record_part("up-1", 1, "etag-1")
+    upload_sessions.set_part_md5s("up-1", {1: "md5-1"})
+    upload_sessions.claim_completion("up-1")
+    upload_sessions.delete_session("up-1")
+    assert redis_client.keys("upload:up-1*") == []
+
+def test_find_session_by_object_key(redis_client):
+    assert upload_sessions.find_session("dongle/route/0/qlog.bz2") is None
+    upload_sessions.create_session("up-1", user_id="user-1", object_key="dongle/route/0/qlog.bz2")
+    upload_sessions.create_session("up-2", user_id="user-1", object_key="dongle/route/0/qlog.bz2")
+    assert upload_sessions.find_session("dongle/route/0/qlog.bz2")["upload_id"] == "up-2"
+
+    # Deleting an older upload leaves the object's newer one findable
+    upload_sessions.delete_session("up-1")
+    assert upload_sessions.find_session("dongle/route/0/qlog.bz2")["upload_id"] == "up-2"
+    upload_sessions.delete_session("up-2")
+    assert upload_sessions.find_session("dongle/route/0/qlog.bz2") is None
+    assert redis_client.keys("upload:*") == []
@@ -0,0 +1,157 @@
+from typing import Optional
+import math
+import os
+import time
+
+from processing import file_type_base
+from upload_sessions import redis_client
+
+# Concurrent multipart uploads, per device and across all devices
+DEVICE_CONCURRENCY = int(os.getenv("UPLOAD_DEVICE_CONCURRENCY", 4))
+GLOBAL_CONCURRENCY = int(os.getenv("UPLOAD_GLOBAL_CONCURRENCY", 200))
+
+# Token buckets limiting how fast uploads are admitted (uploads per second, burst size)
+DEVICE_RATE = float(os.getenv("UPLOAD_DEVICE_RATE", 1))
+DEVICE_BURST = int(os.getenv("UPLOAD_DEVICE_BURST", 20))
+GLOBAL_RATE = float(os.getenv("UPLOAD_GLOBAL_RATE", 50))
+GLOBAL_BURST = int(os.getenv("UPLOAD_GLOBAL_BURST", 500))
+
+# A slot is released on complete or cancel, or when its lease runs out
+SLOT_TTL = int(os.getenv("UPLOAD_SLOT_TTL", 900))
+
+# Back-off when no slot is free, multiplied by the priority rank
+RETRY_AFTER = int(os.getenv("UPLOAD_RETRY_AFTER", 5))
+
+# Lower rank is admitted first: the dashboard needs qlogs and qcameras before full logs and video
+PRIORITIES = {
+    'qlog': 0,
+    'qcamera': 1,
+    'rlog': 2,
+    'log': 2,
+    'fcamera': 3,
+    'video': 3,
+}
+LOWEST_PRIORITY = 3
+
+# Share of the global slots and tokens each rank may use; the rest is held back
+# for higher ranks, so a congested server refuses fcameras long before qlogs
+PRIORITY_SHARES = (1.0, 0.9, 0.75, 0.5)
+
+# KEYS: device slots, global slots, device bucket, global bucket
+# ARGV: now, member, lease expiry, device cap, global cap, share,
+#       device rate, device burst, global rate, global burst, concurrency retry
+# Returns 0 when admitted, otherwise the seconds to wait
+ADMIT_SCRIPT = """
+local now = tonumber(ARGV[1])
+local member = ARGV[2]
+local expires = tonumber(ARGV[3])
+local share = tonumber(ARGV[6])
+
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+
+-- A retried init of the same file keeps its slot
+if redis.call('ZSCORE', KEYS[2], member) then
+    redis.call('ZADD', KEYS[1], expires, member)
+    redis.call('ZADD', KEYS[2], expires, member)
+    return 0
+end
+
+local global_cap = math.max(1, math.floor(tonumber(ARGV[5]) * share))
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[4]) or redis.call('ZCARD', KEYS[2]) >= global_cap then
+    return tonumber(ARGV[11])
+end
+
+local function tokens(key, rate, burst)
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local available = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    return math.min(burst, available + math.max(0, now - ts) * rate)
+end
+
+local device_rate, device_burst = tonumber(ARGV[7]), tonumber(ARGV[8])
+local global_rate, global_burst = tonumber(ARGV[9]), tonumber(ARGV[10])
+local device_tokens = tokens(KEYS[3], device_rate, device_burst)
+local global_tokens = tokens(KEYS[4], global_rate, global_burst)
+local global_needed = 1 + global_burst * (1 - share)
+
+local wait = 0
+if device_tokens < 1 then
+    wait = math.max(wait, (1 - device_tokens) / device_rate)
+end
+if global_tokens < global_needed then
+    wait = math.max(wait, (global_needed - global_tokens) / global_rate)
+end
+if wait > 0 then
+    return math.ceil(wait)
+end
+
+redis.call('HSET', KEYS[3], 'tokens', device_tokens - 1, 'ts', now)
+redis.call('EXPIRE', KEYS[3], math.ceil(device_burst / device_rate) + 1)
+redis.call('HSET', KEYS[4], 'tokens', global_tokens - 1, 'ts', now)
+redis.call('EXPIRE', KEYS[4], math.ceil(global_burst / global_rate) + 1)
+redis.call('ZADD', KEYS[1], expires, member)
+redis.call('ZADD', KEYS[2], expires, member)
+return 0
+"""
+
+admit_script = redis_client.register_script(ADMIT_SCRIPT)
+
+GLOBAL_SLOTS_KEY = "upload_slots:global"
+GLOBAL_BUCKET_KEY = "upload_bucket:global"
+
+def _device_slots_key(dongle_id: str) -> str:
+    return f"upload_slots:device:{dongle_id}"
+
+def _device_bucket_key(dongle_id: str) -> str:
+    return f"upload_bucket:device:{dongle_id}"
+
+def priority(file_type: str) -> int:
+    """Get the priority rank of a file type, 0 being the most urgent"""
+    return PRIORITIES.get(file_type_base(file_type), LOWEST_PRIORITY)
+
+def admit(dongle_id: str, file_type: str, object_key: str) -> Optional[int]:
+    """Take an upload slot for a file.
+
+    Returns None when admitted, otherwise the number of seconds the device
+    should wait before asking again.
+    """
+    rank = priority(file_type)
+    now = time.time()
+    retry_after = admit_script(
+        keys=[
+            _device_slots_key(dongle_id),
+            GLOBAL_SLOTS_KEY,
+            _device_bucket_key(dongle_id),
+            GLOBAL_BUCKET_KEY
+        ],
+        args=[
+            now,
+            object_key,
+            now + SLOT_TTL,
+            DEVICE_CONCURRENCY,
+            GLOBAL_CONCURRENCY,
+            PRIORITY_SHARES[rank],
+            DEVICE_RATE,
+            DEVICE_BURST,
+            GLOBAL_RATE,
+            GLOBAL_BURST,
+            RETRY_AFTER * (rank + 1)
+        ]
+    )
+    return int(retry_after) or None
+
+def refresh(dongle_id: str, object_key: str) -> None:
+    """Extend the lease of a slot while its upload makes progress"""
+    expires = math.ceil(time.time() + SLOT_TTL)
+    pipe = redis_client.pipeline()
+    pipe.zadd(_device_slots_key(dongle_id), {object_key: expires}, xx=True)
+    pipe.zadd(GLOBAL_SLOTS_KEY, {object_key: expires}, xx=True)
+    pipe.execute()
+
+def release(dongle_id: str, object_key: str) -> None:
+    """Free the slot of a finished or cancelled upload"""
+    pipe = redis_client.pipeline()
+    pipe.zrem(_device_slots_key(dongle_id), object_key)
+    pipe.zrem(GLOBAL_SLOTS_KEY, object_key)
+    pipe.execute()
@@ -0,0 +1,115 @@
+from datetime import datetime
+from typing import Dict, Optional
+import os
+
+import redis
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+
+# Sessions live as long as an unfinished multipart upload is worth resuming
+UPLOAD_SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", 7 * 86400))
+# A completion claim outlives any complete_multipart_upload call, in case its holder dies
+COMPLETION_CLAIM_TTL = int(os.getenv("UPLOAD_COMPLETION_CLAIM_TTL", 300))
+
+INT_FIELDS = ("segment_number", "file_size", "chunk_size", "part_count")
+
+redis_client = redis.from_url(REDIS_URL, decode_responses=True)
+
+def _session_key(upload_id: str) -> str:
+    return f"upload:{upload_id}"
+
+def _parts_key(upload_id: str) -> str:
+    return f"upload:{upload_id}:parts"
+
+def _md5s_key(upload_id: str) -> str:
+    return f"upload:{upload_id}:md5"
+
+def _completion_key(upload_id: str) -> str:
+    return f"upload:{upload_id}:completing"
+
+def _object_key_index(object_key: str) -> str:
+    return f"upload:by-key:{object_key}"
+
+def create_session(upload_id: str, **fields) -> None:
+    """Register a new multipart upload, keyed by its S3 UploadId"""
+    fields.setdefault("status", "uploading")
+    fields["created_at"] = datetime.utcnow().isoformat()
+
+    pipe = redis_client.pipeline()
+    pipe.hset(_session_key(upload_id), mapping={k: str(v) for k, v in fields.items()})
+    pipe.expire(_session_key(upload_id), UPLOAD_SESSION_TTL)
+    if "object_key" in fields:
+        pipe.set(_object_key_index(fields["object_key"]), upload_id, ex=UPLOAD_SESSION_TTL)
+    pipe.execute()
+
+def get_session(upload_id: str) -> Optional[dict]:
+    """Get an upload session, or None if it does not exist or has expired"""
+    session = redis_client.hgetall(_session_key(upload_id))
+    if not session:
+        return None
+
+    for field in INT_FIELDS:
+        if field in session:
+            session[field] = int(session[field])
+    session["upload_id"] = upload_id
+    return session
+
+def find_session(object_key: str) -> Optional[dict]:
+    """Get the latest upload session of an object, or None if it has none"""
+    upload_id = redis_client.get(_object_key_index(object_key))
+    return get_session(upload_id) if upload_id else None
+
+def update_session(upload_id: str, **fields) -> None:
+    """Update fields of an existing upload session"""
+    redis_client.hset(_session_key(upload_id), mapping={k: str(v) for k, v in fields.items()})
+
+def record_part(upload_id: str, part_number: int, etag: str) -> None:
+    """Record that a part has been received"""
+    pipe = redis_client.pipeline()
+    pipe.hset(_parts_key(upload_id), part_number, etag)
+    pipe.expire(_parts_key(upload_id), UPLOAD_SESSION_TTL)
+    pipe.expire(_session_key(upload_id), UPLOAD_SESSION_TTL)
+    pipe.execute()
+
+def get_parts(upload_id: str) -> Dict[int, str]:
+    """Get the received parts of an upload as {part_number: etag}"""
+    parts = redis_client.hgetall(_parts_key(upload_id))
+    return {int(part_number): etag for part_number, etag in parts.items()}
+
+def replace_parts(upload_id: str, parts: Dict[int, str]) -> None:
+    """Replace the recorded parts, e.g. with the authoritative list from S3"""
+    pipe = redis_client.pipeline()
+    pipe.delete(_parts_key(upload_id))
+    if parts:
+        pipe.hset(_parts_key(upload_id), mapping=parts)
+        pipe.expire(_parts_key(upload_id), UPLOAD_SESSION_TTL)
+    pipe.execute()
+
+def set_part_md5s(upload_id: str, md5s: Dict[int, str]) -> None:
+    """Store the declared base64 MD5 of each part"""
+    pipe = redis_client.pipeline()
+    pipe.hset(_md5s_key(upload_id), mapping=md5s)
+    pipe.expire(_md5s_key(upload_id), UPLOAD_SESSION_TTL)
+    pipe.execute()
+
+def get_part_md5s(upload_id: str) -> Dict[int, str]:
+    """Get the declared part MD5s of an upload as {part_number: base64 md5}"""
+    md5s = redis_client.hgetall(_md5s_key(upload_id))
+    return {int(part_number): md5 for part_number, md5 in md5s.items()}
+
+def claim_completion(upload_id: str) -> bool:
+    """Take the right to complete an upload; False if another request holds it"""
+    return bool(redis_client.set(_completion_key(upload_id), "1", nx=True, ex=COMPLETION_CLAIM_TTL))
+
+def release_completion(upload_id: str) -> None:
+    """Give up the right to complete an upload"""
+    redis_client.delete(_completion_key(upload_id))
+
+def delete_session(upload_id: str) -> None:
+    """Remove an upload session and its part records"""
+    keys = [_session_key(upload_id), _parts_key(upload_id), _md5s_key(upload_id), _completion_key(upload_id)]
+    object_key = redis_client.hget(_session_key(upload_id), "object_key")
+    # The object may already have a newer upload
+    if object_key and redis_client.get(_object_key_index(object_key)) == upload_id:
+        keys.append(_object_key_index(object_key))
+    redis_client.delete(*keys)
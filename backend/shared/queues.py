@@ -0,0 +1,45 @@
+import os
+import time
+
+from celery.signals import before_task_publish
+from kombu import Queue
+
+# Worker tasks by queue. Each queue is consumed by its own worker pool, so
+# multi-minute video jobs never hold up log parsing or route aggregation
+QUEUES = {
+    # CPU-bound ffmpeg work, minutes per task
+    'video': ('tasks.process_video', 'tasks.transcode_video', 'tasks.package_hls', 'tasks.build_route_preview'),
+    # Downloading and parsing logs, mostly waiting on storage
+    'logs': ('tasks.parse_log_file',),
+    # Database aggregation for routes, milliseconds to seconds
+    'aggregation': ('tasks.extract_route_metadata', 'tasks.generate_statistics', 'tasks.cleanup_old_data'),
+}
+DEFAULT_QUEUE = 'aggregation'
+
+TASK_ROUTES = {task: {'queue': queue} for queue, tasks in QUEUES.items() for task in tasks}
+
+# Redis redelivers a task nobody acknowledged after this long; acks_late
+# tasks are acknowledged when they finish, so it must outlast the longest one
+VISIBILITY_TIMEOUT = int(os.getenv("CELERY_VISIBILITY_TIMEOUT", 2 * 3600))
+
+def configure(app) -> None:
+    """Declare the queues and routes on a Celery app, producer or worker"""
+    app.conf.update(
+        task_queues=[Queue(name) for name in QUEUES],
+        task_default_queue=DEFAULT_QUEUE,
+        task_routes=TASK_ROUTES,
+        broker_transport_options={'visibility_timeout': VISIBILITY_TIMEOUT}
+    )
+
+def queue_depths(broker) -> dict:
+    """Tasks waiting in each queue, from a Redis client on the broker database"""
+    pipeline = broker.pipeline()
+    for name in QUEUES:
+        pipeline.llen(name)
+    return dict(zip(QUEUES, pipeline.execute()))
+
+@before_task_publish.connect
+def _stamp_sent_at(headers=None, **kwargs) -> None:
+    """Record when a task was queued, so workers can measure how long it waited"""
+    if headers is not None:
+        headers['sent_at'] = time.time()
@@ -0,0 +1,151 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Optional
+import asyncio
+import io
+import os
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.client import Config
+
+# Connections kept open to MinIO; also the number of threads async callers are served by
+MAX_POOL_CONNECTIONS = int(os.getenv("STORAGE_MAX_POOL_CONNECTIONS", 50))
+CONNECT_TIMEOUT = float(os.getenv("STORAGE_CONNECT_TIMEOUT", 5))
+READ_TIMEOUT = float(os.getenv("STORAGE_READ_TIMEOUT", 60))
+# Attempts per request, including the first, for throttling, 5xx and connection errors
+MAX_ATTEMPTS = int(os.getenv("STORAGE_MAX_ATTEMPTS", 5))
+
+# Multipart settings for whole-file transfers
+TRANSFER_CHUNK_SIZE = int(os.getenv("STORAGE_TRANSFER_CHUNK_SIZE", 16 * 1024 * 1024))
+TRANSFER_CONCURRENCY = int(os.getenv("STORAGE_TRANSFER_CONCURRENCY", 8))
+
+class ObjectStorage:
+    """S3 client for MinIO shared by the API and the worker.
+
+    Calls fail fast on an unresponsive server and are retried with backoff.
+    Async code runs blocking calls through run(), on the storage's own
+    thread pool, so slow storage never holds up the event loop or the
+    threads serving other requests.
+    """
+
+    def __init__(
+        self,
+        endpoint_url: str,
+        access_key: str,
+        secret_key: str,
+        region: str = "us-east-1",
+        max_pool_connections: int = MAX_POOL_CONNECTIONS,
+        max_attempts: int = MAX_ATTEMPTS
+    ):
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+            config=Config(
+                signature_version='s3v4',
+                max_pool_connections=max_pool_connections,
+                connect_timeout=CONNECT_TIMEOUT,
+                read_timeout=READ_TIMEOUT,
+                retries={'total_max_attempts': max_attempts, 'mode': 'standard'},
+                tcp_keepalive=True,
+                # Unsigned payloads let request bodies stream through without being hashed first
+                s3={'payload_signing_enabled': False}
+            ),
+            region_name=region
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=TRANSFER_CHUNK_SIZE,
+            multipart_chunksize=TRANSFER_CHUNK_SIZE,
+            max_concurrency=TRANSFER_CONCURRENCY
+        )
+        self._executor = ThreadPoolExecutor(max_workers=max_pool_connections, thread_name_prefix="storage")
+
+    @classmethod
+    def from_env(cls, **options) -> "ObjectStorage":
+        """Create a client from the MINIO_* environment variables, with options for the constructor"""
+        return cls(
+            f"http://{os.getenv('MINIO_ENDPOINT', 'minio:9000')}",
+            os.getenv("MINIO_ACCESS_KEY", "admin"),
+            os.getenv("MINIO_SECRET_KEY", "password"),
+            **options
+        )
+
+    async def run(self, func: Callable, *args, **kwargs):
+        """Run a blocking storage call (or a function making several) in the storage thread pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    def etag(self, bucket: str, key: str) -> str:
+        """ETag of an object, which changes whenever its content is replaced"""
+        return self.client.head_object(Bucket=bucket, Key=key)['ETag'].strip('"')
+
+    def download(self, bucket: str, key: str, path: str) -> None:
+        """Download an object to a local file, in parallel ranges when it is large"""
+        self.client.download_file(bucket, key, path, Config=self.transfer_config)
+
+    def upload(self, path: str, bucket: str, key: str, content_type: Optional[str] = None) -> None:
+        """Upload a local file, in parallel parts when it is large"""
+        extra_args = {'ContentType': content_type} if content_type else None
+        self.client.upload_file(path, bucket, key, ExtraArgs=extra_args, Config=self.transfer_config)
+
+    def open(self, bucket: str, key: str):
+        """Stream an object's content; the returned body is read as it arrives"""
+        return self.client.get_object(Bucket=bucket, Key=key)['Body']
+
+    def upload_stream(self, fileobj, bucket: str, key: str, content_type: Optional[str] = None) -> None:
+        """Upload from a readable of unknown length, in parts as it is read.
+
+        Only a bounded number of parts is held in memory; if reading fails,
+        the multipart upload is aborted and nothing is stored.
+        """
+        extra_args = {'ContentType': content_type} if content_type else None
+        self.client.upload_fileobj(fileobj, bucket, key, ExtraArgs=extra_args, Config=self.transfer_config)
+
+    def read_range(self, bucket: str, key: str, start: int, end: int) -> bytes:
+        """Bytes start to end (exclusive) of an object"""
+        response = self.client.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end - 1}")
+        return response['Body'].read()
+
+    def open_seekable(self, bucket: str, key: str, buffer_size: int = 1024 * 1024) -> io.BufferedReader:
+        """Open an object as a seekable file that fetches only the ranges read from it.
+
+        Suits formats read from their end or in scattered parts, such as
+        Parquet footers and column chunks.
+        """
+        size = self.client.head_object(Bucket=bucket, Key=key)['ContentLength']
+        return io.BufferedReader(_RangeReader(self, bucket, key, size), buffer_size=buffer_size)
+
+class _RangeReader(io.RawIOBase):
+    """Raw seekable file over an object, each read a ranged GET"""
+
+    def __init__(self, storage: ObjectStorage, bucket: str, key: str, size: int):
+        self.storage = storage
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: self.size}[whence]
+        self.position = max(0, base + offset)
+        return self.position
+
+    def readinto(self, buffer) -> int:
+        end = min(self.position + len(buffer), self.size)
+        if end <= self.position:
+            return 0
+        data = self.storage.read_range(self.bucket, self.key, self.position, end)
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
@@ -0,0 +1,142 @@
+"""process_video throughput benchmark.
+
+Runs the worker's process_video task over synthetic one minute camera
+segments (generated once with ffmpeg testsrc2 and cached), against a
+filesystem stand-in for MinIO, for each processing configuration. Each
+configuration runs in its own process and reports segments per minute,
+CPU seconds per segment (ffmpeg included) and the peak RSS of the process
+tree. Needs ffmpeg with libx265 and libx264, and the worker requirements.
+
+A configuration is mode[:preset][+stills][+stream]: remux or transcode,
+the x264 preset of H.264 renditions, +stills for VIDEO_STILLS and +stream
+for VIDEO_STREAMING.
+
+Usage (from backend/worker):
+    python benchmarks/bench_pipeline.py [--segments 4] [--seconds 60]
+        [--configs remux,remux+stills,remux+stream,transcode:veryfast,transcode:medium]
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fixtures import LocalStorage, camera_segment
+
+DEFAULT_CONFIGS = "remux,remux+stills,remux+stream,transcode:veryfast,transcode:medium"
+FIXTURE_DIR = os.path.join(tempfile.gettempdir(), "comma-bench-fixtures")
+
+class MemoryCheckpoint:
+    """In-process stand-in for checkpoints.Checkpoint; every run starts fresh"""
+
+    def __init__(self, task: str, source_key: str, etag: str):
+        self.stages = {}
+
+    def has(self, *stages: str) -> bool:
+        return all(stage in self.stages for stage in stages)
+
+    def get(self, stage: str, default=None):
+        return self.stages.get(stage, default)
+
+    def done(self, stage: str, result=None) -> None:
+        self.stages[stage] = result
+
+    def run(self, stage: str, func, *args, **kwargs):
+        if stage not in self.stages:
+            self.done(stage, func(*args, **kwargs))
+        return self.stages[stage]
+
+def parse_config(config: str) -> dict:
+    """Worker environment of a configuration string"""
+    base, *flags = config.split("+")
+    mode, _, preset = base.partition(":")
+    return {
+        "VIDEO_PROCESSING_MODE": mode,
+        "VIDEO_H264_PRESET": preset or "medium",
+        "VIDEO_STILLS": "true" if "stills" in flags else "false",
+        "VIDEO_STREAMING": "true" if "stream" in flags else "false",
+    }
+
+def _cpu_seconds() -> float:
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+def run_child(fixtures: list) -> None:
+    """Process the fixtures with process_video and print wall and CPU time as JSON"""
+    workdir = tempfile.mkdtemp(prefix="comma-bench-")
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = os.path.join(workdir, "metrics")
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"])
+    try:
+        import tasks
+
+        # Storage and bookkeeping stay local; the video work is the real task
+        storage = LocalStorage(workdir)
+        tasks.storage = storage
+        tasks.Checkpoint = MemoryCheckpoint
+        tasks._update_segment_video = lambda *args, **kwargs: None
+        tasks._schedule_for_route = lambda *args, **kwargs: None
+
+        keys = []
+        for i, fixture in enumerate(fixtures):
+            key = f"bench/{i}/fcamera.hevc"
+            shutil.copyfile(fixture, storage._path(tasks.MINIO_BUCKET, key))
+            keys.append(key)
+
+        start, cpu = time.perf_counter(), _cpu_seconds()
+        for i, key in enumerate(keys):
+            tasks.process_video("bench", f"bench-{i}", key)
+        print(json.dumps({"wall": time.perf_counter() - start, "cpu": _cpu_seconds() - cpu}))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def bench(config: str, fixtures: list) -> None:
+    env = {**os.environ, **parse_config(config)}
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--child", *fixtures],
+        env=env,
+        stdout=subprocess.PIPE
+    )
+    stdout = process.stdout.read()
+    # wait4 reports the peak RSS of the child and of every process it waited for, ffmpeg included
+    _, status, usage = os.wait4(process.pid, 0)
+    if status != 0:
+        print(f"{config:<28} failed (status {status})")
+        return
+    result = json.loads(stdout.decode().strip().splitlines()[-1])
+    count = len(fixtures)
+    print(
+        f"{config:<28} {count / result['wall'] * 60:>10.2f} seg/min"
+        f"  {result['cpu'] / count:>8.2f} cpu-s/seg"
+        f"  {usage.ru_maxrss / 1024:>8.0f} MB peak RSS"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--segments", type=int, default=4)
+    parser.add_argument("--seconds", type=int, default=60, help="length of each synthetic segment")
+    parser.add_argument("--configs", default=DEFAULT_CONFIGS)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("fixtures", nargs="*", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.fixtures)
+        return
+
+    print(f"Generating {args.segments} synthetic {args.seconds}s segments in {FIXTURE_DIR}")
+    fixtures = [
+        camera_segment(os.path.join(FIXTURE_DIR, f"{args.seconds}s-{seed}.hevc"), args.seconds, seed)
+        for seed in range(args.segments)
+    ]
+    for config in args.configs.split(","):
+        bench(config, fixtures)
+
+if __name__ == "__main__":
+    main()
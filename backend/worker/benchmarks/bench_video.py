@@ -0,0 +1,130 @@
+"""Per-segment video processing benchmark.
+
+Times, and counts the CPU seconds of, each way of making a segment's
+video and stills:
+
+- remux: the HEVC copy with its thumbnail from a seeked read (the
+  default), the same followed by the optional stills pass (previews and
+  time-lapse, VIDEO_STILLS), and the previous single run that split the
+  stills off a decode made alongside the copy.
+- transcode: the old two-pass job (encode, then decode the output again
+  for the thumbnail) against the single-decode graph that writes the video
+  and every still in one ffmpeg run.
+
+Needs ffmpeg on PATH; without a raw camera segment (fcamera.hevc) a
+synthetic one is used.
+
+Usage (from backend/worker):
+    python benchmarks/bench_video.py [path/to/fcamera.hevc] [--runs 3] [--previews 2]
+"""
+import argparse
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+import ffmpeg
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import video
+from fixtures import camera_segment
+
+def _stills(workdir: str, preview_interval: int) -> dict:
+    return {
+        "preview_pattern": os.path.join(workdir, "preview_%03d.jpg") if preview_interval else None,
+        "preview_interval": preview_interval or 10,
+        "timelapse_path": os.path.join(workdir, "timelapse.mp4")
+    }
+
+def copy_only(input_path: str, workdir: str, preview_interval: int) -> None:
+    """The remux and its seeked thumbnail"""
+    video.remux_hevc(input_path, os.path.join(workdir, "output.mp4"), os.path.join(workdir, "thumb.jpg"))
+
+def copy_then_stills(input_path: str, workdir: str, preview_interval: int) -> None:
+    """The remux, then the stills pass"""
+    copy_only(input_path, workdir, preview_interval)
+    video.stills(input_path, **_stills(workdir, preview_interval))
+
+def copy_with_split_stills(input_path: str, workdir: str, preview_interval: int) -> None:
+    """The previous remux graph: the copy plus every still split off a decode in the same run"""
+    source = video._camera_input(input_path)
+    stills = {"thumbnail_path": os.path.join(workdir, "thumb.jpg"), **_stills(workdir, preview_interval)}
+    video._run(
+        'remux',
+        video._remux_output(source, os.path.join(workdir, "output.mp4"), video.FRAGMENTED_MP4_FLAGS),
+        *video._stills(video._split(source.video, video._still_count(**stills)), **stills)
+    )
+
+def transcode_two_pass(input_path: str, workdir: str, preview_interval: int) -> None:
+    """The video, then a second ffmpeg run over the output for the stills"""
+    output_path = os.path.join(workdir, "output.mp4")
+    video.transcode_h264(input_path, output_path)
+    thumbnail = (
+        ffmpeg
+        .input(output_path, ss=1)
+        .filter('scale', video.THUMBNAIL_WIDTH, -1)
+        .output(os.path.join(workdir, "thumb.jpg"), vframes=1)
+    )
+    outputs = [thumbnail]
+    if preview_interval:
+        outputs.append(
+            ffmpeg
+            .input(output_path)
+            .filter('fps', fps=f"1/{preview_interval}")
+            .filter('scale', video.PREVIEW_WIDTH, -1)
+            .output(os.path.join(workdir, "preview_%03d.jpg"), format='image2')
+        )
+    for output in outputs:
+        output.overwrite_output().run(capture_stdout=True, capture_stderr=True)
+
+def transcode_single_decode(input_path: str, workdir: str, preview_interval: int) -> None:
+    """The video and stills from one ffmpeg run"""
+    video.transcode_h264(
+        input_path,
+        os.path.join(workdir, "output.mp4"),
+        thumbnail_path=os.path.join(workdir, "thumb.jpg"),
+        preview_pattern=os.path.join(workdir, "preview_%03d.jpg") if preview_interval else None,
+        preview_interval=preview_interval or 10
+    )
+
+def _cpu_seconds() -> float:
+    """CPU time of the ffmpeg processes run so far"""
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return children.ru_utime + children.ru_stime
+
+def bench(name: str, job, args) -> float:
+    timings = []
+    cpu = []
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as workdir:
+            start, cpu_start = time.perf_counter(), _cpu_seconds()
+            job(args.input, workdir, args.previews)
+            timings.append(time.perf_counter() - start)
+            cpu.append(_cpu_seconds() - cpu_start)
+    median = statistics.median(timings)
+    print(f"{name:<28} {args.runs:>3} runs  median {median:8.3f}s  cpu {statistics.median(cpu):8.3f}s")
+    return median
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", nargs="?", help="raw HEVC camera segment")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--previews", type=int, default=2, help="seconds between preview frames, 0 for none")
+    args = parser.parse_args()
+    if not args.input:
+        args.input = camera_segment(os.path.join(tempfile.gettempdir(), "comma-bench-fixtures", "60s-0.hevc"))
+
+    copy = bench("remux copy + thumbnail", copy_only, args)
+    bench("remux, then stills pass", copy_then_stills, args)
+    split = bench("remux with split stills", copy_with_split_stills, args)
+    print(f"remux copy-only speedup over split stills: {split / copy:.1f}x")
+
+    before = bench("transcode two-pass", transcode_two_pass, args)
+    after = bench("transcode single-decode", transcode_single_decode, args)
+    print(f"transcode speedup: {before / after:.2f}x")
+
+if __name__ == "__main__":
+    main()
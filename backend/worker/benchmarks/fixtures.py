@@ -0,0 +1,89 @@
+"""Synthetic camera segments and a filesystem object store for benchmarks."""
+import hashlib
+import os
+import shutil
+
+import ffmpeg
+
+# openpilot road camera (AR0231): 1928x1208 HEVC at 20 fps, one minute per segment
+CAMERA_WIDTH = 1928
+CAMERA_HEIGHT = 1208
+CAMERA_FPS = 20
+CAMERA_BITRATE = '10M'
+SEGMENT_SECONDS = 60
+
+def frame_count(path: str) -> int:
+    """Frames in a raw HEVC stream, from framecrc's line per packet, without decoding"""
+    out, _ = (
+        ffmpeg
+        .input(path, format='hevc', r=CAMERA_FPS)
+        .output('-', format='framecrc', c='copy')
+        .run(capture_stdout=True, capture_stderr=True)
+    )
+    return sum(1 for line in out.decode().splitlines() if line and not line.startswith('#'))
+
+def camera_segment(path: str, seconds: int = SEGMENT_SECONDS, seed: int = 0) -> str:
+    """Write a raw HEVC elementary stream shaped like an fcamera.hevc, unless it exists.
+
+    testsrc2 moves every frame, so the encoders get real work; seed offsets
+    the pattern so segments differ. A cached segment without exactly
+    CAMERA_FPS frames per second is written again.
+    """
+    frames = seconds * CAMERA_FPS
+    if os.path.exists(path) and frame_count(path) != frames:
+        os.remove(path)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        (
+            ffmpeg
+            .input(f"testsrc2=size={CAMERA_WIDTH}x{CAMERA_HEIGHT}:rate={CAMERA_FPS}", format='lavfi', t=seconds + seed)
+            .trim(start=seed)
+            .setpts('PTS-STARTPTS')
+            .output(
+                path,
+                format='hevc',
+                vcodec='libx265',
+                video_bitrate=CAMERA_BITRATE,
+                preset='ultrafast',
+                # Raw HEVC has no timestamps; without a rate ffmpeg pads the stream to 25 fps
+                r=CAMERA_FPS,
+                # The camera encodes one keyframe per second
+                g=CAMERA_FPS,
+                **{'x265-params': 'log-level=error'}
+            )
+            .overwrite_output()
+            .run(capture_stdout=True, capture_stderr=True)
+        )
+        written = frame_count(path)
+        if written != frames:
+            os.remove(path)
+            raise RuntimeError(f"Synthetic segment has {written} frames, expected {frames}")
+    return path
+
+class LocalStorage:
+    """Filesystem stand-in for ObjectStorage, one directory per bucket"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, bucket: str, key: str) -> str:
+        path = os.path.join(self.root, bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def etag(self, bucket: str, key: str) -> str:
+        stat = os.stat(self._path(bucket, key))
+        return hashlib.md5(f"{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()
+
+    def download(self, bucket: str, key: str, path: str) -> None:
+        shutil.copyfile(self._path(bucket, key), path)
+
+    def upload(self, path: str, bucket: str, key: str, content_type=None) -> None:
+        shutil.copyfile(path, self._path(bucket, key))
+
+    def open(self, bucket: str, key: str):
+        return open(self._path(bucket, key), 'rb')
+
+    def upload_stream(self, fileobj, bucket: str, key: str, content_type=None) -> None:
+        with open(self._path(bucket, key), 'wb') as f:
+            shutil.copyfileobj(fileobj, f, 1024 * 1024)
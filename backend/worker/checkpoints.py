@@ -0,0 +1,55 @@
+from typing import Callable
+import json
+import os
+
+import redis
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/2")
+
+# Checkpoints outlive every retry and redelivery of a task; afterwards a rerun starts over
+CHECKPOINT_TTL = int(os.getenv("CHECKPOINT_TTL", 7 * 86400))
+
+redis_client = redis.from_url(REDIS_URL, decode_responses=True)
+
+class Checkpoint:
+    """Stages a task has completed on one version of a source object.
+
+    Stages are recorded in a Redis hash with their JSON result, next to the
+    source's ETag. Opening the checkpoint with a different ETag means the
+    object was uploaded again, so every stage is forgotten and runs anew.
+    """
+
+    def __init__(self, task: str, source_key: str, etag: str):
+        self.key = f"checkpoint:{task}:{source_key}"
+        self.etag = etag
+        stages = redis_client.hgetall(self.key)
+        if stages.pop("etag", None) != etag:
+            pipe = redis_client.pipeline()
+            pipe.delete(self.key)
+            pipe.hset(self.key, "etag", etag)
+            pipe.expire(self.key, CHECKPOINT_TTL)
+            pipe.execute()
+            stages = {}
+        self.stages = {stage: json.loads(result) for stage, result in stages.items()}
+
+    def has(self, *stages: str) -> bool:
+        """Whether all of the stages are complete"""
+        return all(stage in self.stages for stage in stages)
+
+    def get(self, stage: str, default=None):
+        """The result a complete stage recorded"""
+        return self.stages.get(stage, default)
+
+    def done(self, stage: str, result=None) -> None:
+        """Record a stage as complete, with its JSON serializable result"""
+        self.stages[stage] = result
+        pipe = redis_client.pipeline()
+        pipe.hset(self.key, stage, json.dumps(result))
+        pipe.expire(self.key, CHECKPOINT_TTL)
+        pipe.execute()
+
+    def run(self, stage: str, func: Callable, *args, **kwargs):
+        """Run a stage unless it is complete, returning its result either way"""
+        if stage not in self.stages:
+            self.done(stage, func(*args, **kwargs))
+        return self.stages[stage]
@@ -0,0 +1,150 @@
+"""Driving event detection over a segment's telemetry arrays.
+
+Detectors take the columns of the telemetry tables as NumPy arrays and
+find events with windowed array operations: signals are smoothed with a
+moving average, thresholded, and runs of samples over the threshold for
+long enough become events. Nothing loops over samples in Python, so
+rlog-rate (100 Hz) car state costs the same as a qlog's.
+"""
+from typing import Optional
+import os
+
+import numpy as np
+
+# Deceleration (m/s², negative) that counts as hard braking, held for HARD_BRAKE_DURATION seconds
+HARD_BRAKE_ACCEL = float(os.getenv("EVENT_HARD_BRAKE_ACCEL", "-3.5"))
+HARD_BRAKE_DURATION = float(os.getenv("EVENT_HARD_BRAKE_DURATION", "0.5"))
+# Lateral acceleration (m/s²) that counts as hard cornering, held for LATERAL_ACCEL_DURATION seconds
+LATERAL_ACCEL_LIMIT = float(os.getenv("EVENT_LATERAL_ACCEL", "3.0"))
+LATERAL_ACCEL_DURATION = float(os.getenv("EVENT_LATERAL_ACCEL_DURATION", "0.5"))
+# Below this speed (m/s) accelerations are parking manoeuvres and sensor noise
+MIN_SPEED = float(os.getenv("EVENT_MIN_SPEED", "3.0"))
+# Signals are averaged over this many seconds before thresholding
+SMOOTHING_WINDOW = float(os.getenv("EVENT_SMOOTHING_WINDOW", "0.3"))
+# Events of one kind closer together than this (seconds) are one event
+MERGE_GAP = float(os.getenv("EVENT_MERGE_GAP", "2.0"))
+# Alert statuses reported as events; 'normal' alerts are informational
+ALERT_STATUSES = ('userPrompt', 'critical')
+
+def _samples(mono_time: np.ndarray, seconds: float) -> int:
+    """Number of samples spanning seconds at the signal's median rate"""
+    if len(mono_time) < 2:
+        return 1
+    period = np.median(np.diff(mono_time)) / 1e9
+    return max(1, int(round(seconds / period))) if period > 0 else 1
+
+def moving_average(values: np.ndarray, window: int) -> np.ndarray:
+    """Centered moving average, shrinking the window at the ends"""
+    if window <= 1 or len(values) == 0:
+        return values.astype(np.float64)
+    sums = np.concatenate(([0.0], np.cumsum(values, dtype=np.float64)))
+    index = np.arange(len(values))
+    start = np.clip(index - window // 2, 0, len(values))
+    end = np.clip(index + (window + 1) // 2, 0, len(values))
+    return (sums[end] - sums[start]) / (end - start)
+
+def runs(mask: np.ndarray) -> tuple:
+    """Start and end (exclusive) indices of the runs of True in mask"""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+def _merge(mono_time: np.ndarray, starts: np.ndarray, ends: np.ndarray, gap: float) -> tuple:
+    """Join runs separated by less than gap seconds"""
+    if len(starts) < 2:
+        return starts, ends
+    apart = (mono_time[starts[1:]] - mono_time[ends[:-1] - 1]) / 1e9 >= gap
+    return starts[np.concatenate(([True], apart))], ends[np.concatenate((apart, [True]))]
+
+def _threshold_events(
+    event_type: str,
+    mono_time: np.ndarray,
+    signal: np.ndarray,
+    mask: np.ndarray,
+    duration: float,
+    peak: str,
+    v_ego: np.ndarray
+) -> list:
+    """Events where mask holds for duration seconds, with the signal's peak over each.
+
+    Runs are held to the duration on their own, then merged, so blips
+    within MERGE_GAP of each other never add up to an event.
+    """
+    starts, ends = runs(mask)
+    if not len(starts):
+        return []
+    long_enough = (mono_time[ends - 1] - mono_time[starts]) / 1e9 >= duration
+    starts, ends = _merge(mono_time, starts[long_enough], ends[long_enough], MERGE_GAP)
+    if not len(starts):
+        return []
+    # Peak per run, with reduceat over the run boundaries
+    bounds = np.column_stack((starts, ends)).ravel()
+    reduce = np.minimum if peak == 'min' else np.maximum
+    peaks = reduce.reduceat(signal, bounds[:-1] if bounds[-1] == len(signal) else bounds)[::2]
+    return [
+        {
+            "event_type": event_type,
+            "mono_time": int(mono_time[start]),
+            "metadata": {
+                "duration_seconds": round(float((mono_time[end - 1] - mono_time[start]) / 1e9), 2),
+                "peak": round(float(value), 2),
+                "speed": round(float(v_ego[start]), 2),
+            }
+        }
+        for start, end, value in zip(starts.tolist(), ends.tolist(), peaks)
+    ]
+
+def hard_braking(car: dict) -> list:
+    """Runs of smoothed a_ego below HARD_BRAKE_ACCEL while moving; peak is the strongest deceleration"""
+    mono_time = car['mono_time']
+    accel = moving_average(car['a_ego'], _samples(mono_time, SMOOTHING_WINDOW))
+    mask = (accel <= HARD_BRAKE_ACCEL) & (car['v_ego'] >= MIN_SPEED)
+    return _threshold_events('hard_braking', mono_time, accel, mask, HARD_BRAKE_DURATION, 'min', car['v_ego'])
+
+def lateral_acceleration(car: dict) -> list:
+    """Runs of smoothed |v_ego * yaw_rate| above LATERAL_ACCEL_LIMIT while moving"""
+    mono_time = car['mono_time']
+    lateral = moving_average(np.abs(car['v_ego'] * car['yaw_rate']), _samples(mono_time, SMOOTHING_WINDOW))
+    mask = (lateral >= LATERAL_ACCEL_LIMIT) & (car['v_ego'] >= MIN_SPEED)
+    return _threshold_events('high_lateral_accel', mono_time, lateral, mask, LATERAL_ACCEL_DURATION, 'max', car['v_ego'])
+
+def disengagements(car: dict) -> list:
+    """Samples where openpilot goes from engaged to not, with what the driver did"""
+    engaged = car['engaged']
+    index = np.flatnonzero(engaged[:-1] & ~engaged[1:]) + 1
+    cause = np.where(
+        car['brake_pressed'][index], 'brake',
+        np.where(car['gas_pressed'][index], 'gas', 'other')
+    )
+    return [
+        {
+            "event_type": "disengagement",
+            "mono_time": int(mono_time),
+            "metadata": {"cause": str(reason), "speed": round(float(speed), 2)}
+        }
+        for mono_time, reason, speed in zip(car['mono_time'][index].tolist(), cause, car['v_ego'][index].tolist())
+    ]
+
+def alerts(table: dict) -> list:
+    """Alerts asking for the driver's attention, as they first appear"""
+    index = np.flatnonzero(np.isin(table['alert_status'], ALERT_STATUSES) & (table['alert_type'] != ''))
+    return [
+        {
+            "event_type": "alert",
+            "mono_time": int(table['mono_time'][i]),
+            "metadata": {
+                "alert_type": str(table['alert_type'][i]),
+                "text": str(table['alert_text'][i]),
+                "status": str(table['alert_status'][i]),
+            }
+        }
+        for i in index.tolist()
+    ]
+
+def detect(car: Optional[dict], alert_table: Optional[dict]) -> list:
+    """Every event of a segment, in time order, from its car state and alert columns"""
+    events = []
+    if car is not None and len(car['mono_time']):
+        events += disengagements(car) + hard_braking(car) + lateral_acceleration(car)
+    if alert_table is not None and len(alert_table['mono_time']):
+        events += alerts(alert_table)
+    return sorted(events, key=lambda event: event["mono_time"])
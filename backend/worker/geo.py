@@ -0,0 +1,206 @@
+"""Vectorized geometry over GPS tracks.
+
+Tracks are parallel NumPy arrays (mono_time in nanoseconds, latitude and
+longitude in degrees); every function works on whole arrays at once.
+"""
+from typing import Optional
+import struct
+
+import numpy as np
+
+EARTH_RADIUS = 6371008.8  # Mean radius, meters
+
+# Fixes less accurate than this (meters) are dropped
+MAX_ACCURACY = 50.0
+# A fix implying a faster move than this (m/s) from its neighbours is a jump
+MAX_JUMP_SPEED = 90.0
+# Rejecting a jump can expose another next to it; a few passes catch runs of them
+JUMP_PASSES = 3
+# Longest run of bad fixes taken for a jump, rather than a real move
+MAX_JUMP_FIXES = 50
+
+# Path simplifications stored per route, as (max map zoom, tolerance in meters);
+# each tolerance is about a screen pixel at its highest zoom
+GEOMETRY_LEVELS = ((8, 500.0), (11, 60.0), (14, 8.0), (22, 1.0))
+
+def haversine(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Great-circle distances in meters between arrays of points"""
+    lat1, lon1, lat2, lon2 = (np.radians(a) for a in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+def steps(lat, lon) -> np.ndarray:
+    """Distances between consecutive points of a track"""
+    return haversine(lat[:-1], lon[:-1], lat[1:], lon[1:])
+
+def valid_fixes(lat, lon, accuracy: Optional[np.ndarray] = None, max_accuracy: float = MAX_ACCURACY) -> np.ndarray:
+    """Mask of fixes with a plausible position; an accuracy of 0 means the receiver gave none"""
+    mask = np.isfinite(lat) & np.isfinite(lon) & (np.abs(lat) <= 90) & (np.abs(lon) <= 180)
+    # Receivers without a fix report 0, 0
+    mask &= (lat != 0) | (lon != 0)
+    if accuracy is not None:
+        mask &= accuracy <= max_accuracy
+    return mask
+
+def reject_jumps(mono_time, lat, lon, max_speed: float = MAX_JUMP_SPEED, passes: int = JUMP_PASSES) -> np.ndarray:
+    """Mask of fixes that are not jumps.
+
+    A jump is a run of up to MAX_JUMP_FIXES fixes entered and left faster
+    than max_speed, where going straight from the fix before the run to
+    the one after it is plausible: a detour of bad fixes, not a real move.
+    """
+    keep = np.ones(len(lat), dtype=bool)
+    for _ in range(passes):
+        index = np.flatnonzero(keep)
+        if len(index) < 3:
+            break
+        dt = np.maximum(np.diff(mono_time[index]) / 1e9, 1e-3)
+        # Step k goes from kept fix k to k + 1
+        fast = np.flatnonzero(steps(lat[index], lon[index]) / dt > max_speed)
+        if len(fast) < 2:
+            break
+        enter, leave = fast[:-1], fast[1:]
+        before, after = index[enter], index[leave + 1]
+        bridge = haversine(lat[before], lon[before], lat[after], lon[after])
+        bridge_time = np.maximum((mono_time[after] - mono_time[before]) / 1e9, 1e-3)
+        runs = (bridge / bridge_time <= max_speed) & (leave - enter <= MAX_JUMP_FIXES)
+        if not runs.any():
+            break
+        # Kept fixes enter + 1 .. leave of every run are dropped
+        marks = np.zeros(len(index) + 1, dtype=np.int64)
+        np.add.at(marks, enter[runs] + 1, 1)
+        np.add.at(marks, leave[runs] + 1, -1)
+        keep[index[np.cumsum(marks[:-1]) > 0]] = False
+    return keep
+
+def clean_track(mono_time, lat, lon, accuracy: Optional[np.ndarray] = None) -> np.ndarray:
+    """Indices of the usable fixes of a track, in time order with duplicates dropped"""
+    order = np.argsort(mono_time, kind='stable')
+    order = order[valid_fixes(lat[order], lon[order], None if accuracy is None else accuracy[order])]
+    if len(order):
+        # Fixes logged twice (e.g. in overlapping segments) count once
+        order = order[np.concatenate(([True], np.diff(mono_time[order]) > 0))]
+    return order[reject_jumps(mono_time[order], lat[order], lon[order])]
+
+def track_metrics(mono_time, lat, lon, speed: Optional[np.ndarray] = None) -> dict:
+    """Distance, duration and speed statistics of a clean track.
+
+    speed is the receiver's own speed per fix; without it speeds are
+    derived from the distance between fixes. The mean is time-weighted.
+    """
+    if len(lat) < 2:
+        return {"distance_meters": 0.0, "duration_seconds": 0.0, "max_speed": 0.0, "mean_speed": 0.0}
+    distance = steps(lat, lon)
+    dt = np.diff(mono_time) / 1e9
+    duration = float(dt.sum())
+    if speed is None:
+        speed = distance / np.maximum(dt, 1e-3)
+    else:
+        # Each step is travelled at the speed reported at its end
+        speed = speed[1:]
+    return {
+        "distance_meters": float(distance.sum()),
+        "duration_seconds": duration,
+        "max_speed": float(speed.max()),
+        "mean_speed": float(np.average(speed, weights=dt)) if duration > 0 else 0.0,
+    }
+
+def linestring_wkb(lat, lon) -> bytes:
+    """Little-endian WKB of a LINESTRING through the points (x = longitude, y = latitude)"""
+    coordinates = np.empty((len(lat), 2), dtype='<f8')
+    coordinates[:, 0] = lon
+    coordinates[:, 1] = lat
+    return struct.pack('<BII', 1, 2, len(lat)) + coordinates.tobytes()
+
+def project(lat, lon) -> tuple:
+    """Planar coordinates in meters, equirectangular about the track's mean latitude"""
+    scale = np.cos(np.radians(np.mean(lat))) if len(lat) else 1.0
+    return np.radians(lon) * EARTH_RADIUS * scale, np.radians(lat) * EARTH_RADIUS
+
+def simplify(lat, lon, tolerance: float) -> np.ndarray:
+    """Indices of the points Douglas-Peucker keeps at tolerance meters, first and last included.
+
+    Every pending span is split in the same pass, so the number of passes
+    is the depth of the recursion and each pass is a few array operations
+    over the points still undecided.
+    """
+    count = len(lat)
+    if count < 3:
+        return np.arange(count)
+    x, y = project(lat, lon)
+    keep = np.zeros(count, dtype=bool)
+    keep[[0, -1]] = True
+    starts, ends = np.array([0]), np.array([count - 1])
+    while True:
+        inner = ends - starts - 1
+        spans = inner > 0
+        starts, ends, inner = starts[spans], ends[spans], inner[spans]
+        if not len(starts):
+            break
+        # Every interior point of every span, with the span it belongs to
+        first = np.cumsum(inner) - inner
+        owner = np.repeat(np.arange(len(starts)), inner)
+        points = starts[owner] + 1 + np.arange(inner.sum()) - first[owner]
+        ax, ay = x[starts][owner], y[starts][owner]
+        dx, dy = x[ends][owner] - ax, y[ends][owner] - ay
+        chord = np.hypot(dx, dy)
+        px, py = x[points] - ax, y[points] - ay
+        # Distance to the chord's line, or to its start when the span is a loop
+        distance = np.where(
+            chord > 0,
+            np.abs(dx * py - dy * px) / np.where(chord > 0, chord, 1),
+            np.hypot(px, py)
+        )
+        farthest = np.maximum.reduceat(distance, first)
+        # First point of each span at its farthest distance
+        at_max = np.flatnonzero(distance == farthest[owner])
+        _, first_max = np.unique(owner[at_max], return_index=True)
+        pivots = points[at_max[first_max]]
+        split = farthest > tolerance
+        pivots = pivots[split]
+        keep[pivots] = True
+        starts = np.concatenate((starts[split], pivots))
+        ends = np.concatenate((pivots, ends[split]))
+    return np.flatnonzero(keep)
+
+def simplify_levels(lat, lon, tolerances) -> list:
+    """simplify() at each tolerance, as index arrays in the order given.
+
+    Each level is simplified from the next finer one instead of the full
+    track, so the coarse levels cost little; their error is at most the
+    sum of the tolerances involved.
+    """
+    levels = {}
+    kept = np.arange(len(lat))
+    for tolerance in sorted(set(tolerances)):
+        kept = kept[simplify(lat[kept], lon[kept], tolerance)]
+        levels[tolerance] = kept
+    return [levels[tolerance] for tolerance in tolerances]
+
+def _zigzag_deltas(lat, lon, precision: int) -> np.ndarray:
+    """Interleaved latitude, longitude deltas at 10^-precision degrees, zigzag encoded"""
+    coordinates = np.round(np.column_stack((lat, lon)) * 10 ** precision).astype(np.int64)
+    deltas = np.diff(coordinates, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    return ((deltas << 1) ^ (deltas >> 63)).astype(np.uint64)
+
+def _varints(values: np.ndarray, bits: int, continuation: int, offset: int) -> bytes:
+    """Values as little-endian groups of bits, flagged with continuation on all but the last group"""
+    if not len(values):
+        return b''
+    groups = max(1, -(-int(values.max()).bit_length() // bits))
+    shifts = np.arange(groups, dtype=np.uint64) * np.uint64(bits)
+    chunks = (values[:, None] >> shifts) & np.uint64((1 << bits) - 1)
+    # Groups a value needs: up to its highest non-zero one, at least one
+    nonzero = chunks != 0
+    counts = np.where(nonzero.any(axis=1), groups - np.argmax(nonzero[:, ::-1], axis=1), 1)
+    columns = np.arange(groups)
+    chunks |= np.where(columns < (counts - 1)[:, None], np.uint64(continuation), np.uint64(0))
+    return (chunks[columns < counts[:, None]] + np.uint64(offset)).astype(np.uint8).tobytes()
+
+def encode_polyline(lat, lon, precision: int = 5) -> str:
+    """Google encoded polyline of the points"""
+    return _varints(_zigzag_deltas(lat, lon, precision), 5, 0x20, 63).decode('ascii')
+
+def encode_packed(lat, lon, precision: int = 5) -> bytes:
+    """Binary form of the polyline: the same zigzag deltas as LEB128 varints"""
+    return _varints(_zigzag_deltas(lat, lon, precision), 7, 0x80, 0)
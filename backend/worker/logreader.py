@@ -0,0 +1,120 @@
+"""Streaming reader for openpilot rlog/qlog files.
+
+A log is a sequence of capnp Event messages, compressed as a whole with
+bz2 or zstd, or not at all. Messages are framed and decoded one at a time
+from the decompressed stream, so memory use is one message plus the
+decompressor's buffers whatever the size of the log.
+"""
+from functools import lru_cache
+from typing import Iterator
+import bz2
+import io
+import os
+import struct
+
+import capnp
+import zstandard
+
+# Directory of the cereal schemas (log.capnp and the files it imports)
+CEREAL_PATH = os.getenv("CEREAL_PATH", "/opt/cereal")
+
+# Compressed bytes pulled from the source per read, and decompressed bytes buffered ahead
+READ_SIZE = 1024 * 1024
+
+BZ2_MAGIC = b'BZh'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# Capnp framing: a segment count, one size per segment in 8-byte words, padded to a word
+WORD = 8
+# Bounds a single message may not exceed; anything larger means the stream is corrupt
+MAX_SEGMENTS = 512
+MAX_MESSAGE_WORDS = 8 * 1024 * 1024
+
+@lru_cache(maxsize=None)
+def schema():
+    """The cereal log schema, loaded on first use"""
+    return capnp.load(os.path.join(CEREAL_PATH, "log.capnp"), imports=[CEREAL_PATH])
+
+class _Prefixed(io.RawIOBase):
+    """Readable replaying bytes already read from a stream before the rest of it"""
+
+    def __init__(self, prefix: bytes, fileobj):
+        self.prefix = prefix
+        self.fileobj = fileobj
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self.prefix:
+            size = min(len(buffer), len(self.prefix))
+            buffer[:size] = self.prefix[:size]
+            self.prefix = self.prefix[size:]
+            return size
+        data = self.fileobj.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+def decompressed(fileobj) -> io.BufferedIOBase:
+    """Decompress a log stream as it is read, detecting bz2 and zstd by their magic bytes"""
+    head = fileobj.read(len(ZSTD_MAGIC))
+    source = _Prefixed(head, fileobj)
+    if head.startswith(BZ2_MAGIC):
+        # BZ2File reads concatenated streams too
+        return bz2.BZ2File(source)
+    if head == ZSTD_MAGIC:
+        reader = zstandard.ZstdDecompressor().stream_reader(source, read_size=READ_SIZE, read_across_frames=True)
+        return io.BufferedReader(reader, buffer_size=READ_SIZE)
+    return io.BufferedReader(source, buffer_size=READ_SIZE)
+
+def _read(stream, size: int) -> bytes:
+    """Read exactly size bytes, or fewer only at the end of the stream"""
+    data = stream.read(size)
+    if len(data) == size or not data:
+        return data
+    chunks = [data]
+    remaining = size - len(data)
+    while remaining:
+        chunk = stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+def messages(stream) -> Iterator[bytes]:
+    """Split a decompressed log into the bytes of its capnp messages.
+
+    A log cut off mid-message (e.g. by the device losing power) ends at its
+    last complete message.
+    """
+    while True:
+        head = _read(stream, 4)
+        if len(head) < 4:
+            return
+        count = struct.unpack('<I', head)[0] + 1
+        if count > MAX_SEGMENTS:
+            raise ValueError(f"Corrupt log: message of {count} segments")
+        # The segment table is padded so the segments start on a word boundary
+        table_size = 4 * count + (4 if count % 2 == 0 else 0)
+        table = _read(stream, table_size)
+        if len(table) < table_size:
+            return
+        words = sum(struct.unpack_from(f'<{count}I', table))
+        if words > MAX_MESSAGE_WORDS:
+            raise ValueError(f"Corrupt log: message of {words} words")
+        body = _read(stream, words * WORD)
+        if len(body) < words * WORD:
+            return
+        yield head + table + body
+
+def events(fileobj) -> Iterator:
+    """Decode the Event messages of a compressed or raw log, one at a time.
+
+    Each event is only valid until the next one is read; copy out what is
+    needed (or call .to_dict()) before advancing.
+    """
+    Event = schema().Event
+    for data in messages(decompressed(fileobj)):
+        with Event.from_bytes(data, traversal_limit_in_words=MAX_MESSAGE_WORDS) as event:
+            yield event
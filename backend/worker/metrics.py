@@ -0,0 +1,131 @@
+from datetime import datetime
+import os
+import resource
+import shutil
+import time
+
+# Every prefork child writes its samples here and the parent serves their sum
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/worker-metrics")
+
+from celery.signals import task_prerun, task_postrun, task_retry, worker_init, worker_process_shutdown
+from prometheus_client import CollectorRegistry, Counter, Histogram, multiprocess, start_http_server
+
+from shared.storage import ObjectStorage
+
+METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", 9808))
+
+# Seconds, from millisecond aggregation up to a long transcode
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 2400, 3600)
+
+TASK_DURATION = Histogram(
+    "worker_task_duration_seconds", "Wall time of a task run", ["task", "state"], buckets=DURATION_BUCKETS
+)
+TASK_CPU = Histogram(
+    "worker_task_cpu_seconds", "CPU time of a task run, including the ffmpeg processes it ran", ["task"],
+    buckets=DURATION_BUCKETS
+)
+QUEUE_WAIT = Histogram(
+    "worker_task_queue_wait_seconds", "Time a task waited in its queue before a worker started it", ["task"],
+    buckets=DURATION_BUCKETS
+)
+TASK_RETRIES = Counter("worker_task_retries_total", "Task runs that ended in a retry", ["task"])
+TRANSFER_BYTES = Counter("worker_storage_bytes_total", "Bytes moved to and from object storage", ["direction"])
+FFMPEG_SPEED = Histogram(
+    "worker_ffmpeg_speed", "ffmpeg processing speed as a multiple of real time", ["operation"],
+    buckets=(0.25, 0.5, 1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+FFMPEG_FPS = Histogram(
+    "worker_ffmpeg_fps", "Frames ffmpeg processed per second", ["operation"],
+    buckets=(5, 10, 20, 40, 80, 160, 320, 640, 1280, 2560)
+)
+
+# Start of the task each process is running, by task id
+_started = {}
+
+def _cpu_seconds() -> float:
+    """CPU used by this process and the child processes it has waited for"""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+@worker_init.connect
+def _serve_metrics(**kwargs) -> None:
+    """Serve the metrics of all pool processes from the main worker process"""
+    directory = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    start_http_server(METRICS_PORT, registry=registry)
+
+@worker_process_shutdown.connect
+def _process_shutdown(pid=None, **kwargs) -> None:
+    multiprocess.mark_process_dead(pid or os.getpid())
+
+@task_prerun.connect
+def _task_started(task_id=None, task=None, **kwargs) -> None:
+    now = time.time()
+    _started[task_id] = (time.perf_counter(), _cpu_seconds())
+
+    sent_at = task.request.get('sent_at')
+    if sent_at:
+        # A retry or countdown is not due until its ETA; only the time after that is queueing
+        eta = task.request.eta
+        due = max(sent_at, datetime.fromisoformat(eta).timestamp()) if eta else sent_at
+        QUEUE_WAIT.labels(task.name).observe(max(now - due, 0))
+
+@task_postrun.connect
+def _task_finished(task_id=None, task=None, state=None, **kwargs) -> None:
+    started = _started.pop(task_id, None)
+    if started:
+        wall, cpu = started
+        TASK_DURATION.labels(task.name, state or 'UNKNOWN').observe(time.perf_counter() - wall)
+        TASK_CPU.labels(task.name).observe(_cpu_seconds() - cpu)
+
+@task_retry.connect
+def _task_retried(sender=None, **kwargs) -> None:
+    TASK_RETRIES.labels(sender.name).inc()
+
+def observe_ffmpeg(operation: str, progress: dict) -> None:
+    """Record the final progress of an ffmpeg run (video.progress_hook)"""
+    if 'speed' in progress:
+        FFMPEG_SPEED.labels(operation).observe(progress['speed'])
+    if 'fps' in progress:
+        FFMPEG_FPS.labels(operation).observe(progress['fps'])
+
+class _CountingReader:
+    """Readable that counts the bytes read through it"""
+
+    def __init__(self, fileobj, direction: str):
+        self.fileobj = fileobj
+        self.direction = direction
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.fileobj.read(size)
+        TRANSFER_BYTES.labels(self.direction).inc(len(data))
+        return data
+
+    def close(self) -> None:
+        self.fileobj.close()
+
+class MeteredStorage(ObjectStorage):
+    """Object storage that counts the bytes the worker transfers"""
+
+    def download(self, bucket: str, key: str, path: str) -> None:
+        super().download(bucket, key, path)
+        TRANSFER_BYTES.labels('download').inc(os.path.getsize(path))
+
+    def upload(self, path: str, bucket: str, key: str, content_type=None) -> None:
+        super().upload(path, bucket, key, content_type)
+        TRANSFER_BYTES.labels('upload').inc(os.path.getsize(path))
+
+    def open(self, bucket: str, key: str):
+        return _CountingReader(super().open(bucket, key), 'download')
+
+    def upload_stream(self, fileobj, bucket: str, key: str, content_type=None) -> None:
+        super().upload_stream(_CountingReader(fileobj, 'upload'), bucket, key, content_type)
+
+    def read_range(self, bucket: str, key: str, start: int, end: int) -> bytes:
+        data = super().read_range(bucket, key, start, end)
+        TRANSFER_BYTES.labels('download').inc(len(data))
+        return data
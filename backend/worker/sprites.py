@@ -0,0 +1,44 @@
+from typing import List
+import math
+
+from PIL import Image
+
+# Pillow format names and content types of the sheet formats offered
+FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+}
+
+def pack(frame_paths: List[str], output_pattern: str, columns: int, rows: int, format: str = 'webp', quality: int = 70) -> dict:
+    """Pack equally sized frames, in order, into grid sprite sheets.
+
+    output_pattern is formatted with the sheet number. Frame n is tile
+    n % (columns * rows) of sheet n // (columns * rows), filled row by row;
+    the last sheet is cropped to the rows it uses. Returns the index: frame
+    count, tile size, grid and the sheet paths.
+    """
+    pil_format, _ = FORMATS[format]
+    per_sheet = columns * rows
+    with Image.open(frame_paths[0]) as first:
+        tile_width, tile_height = first.size
+
+    sheets = []
+    for start in range(0, len(frame_paths), per_sheet):
+        frames = frame_paths[start:start + per_sheet]
+        used_rows = math.ceil(len(frames) / columns)
+        sheet = Image.new('RGB', (tile_width * columns, tile_height * used_rows))
+        for i, path in enumerate(frames):
+            with Image.open(path) as frame:
+                sheet.paste(frame.convert('RGB'), ((i % columns) * tile_width, (i // columns) * tile_height))
+        path = output_pattern % len(sheets)
+        sheet.save(path, pil_format, quality=quality)
+        sheets.append(path)
+
+    return {
+        "count": len(frame_paths),
+        "tile_width": tile_width,
+        "tile_height": tile_height,
+        "columns": columns,
+        "rows": rows,
+        "sheets": sheets
+    }
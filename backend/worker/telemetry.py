@@ -0,0 +1,164 @@
+"""Columnar per-segment telemetry, written while a log is parsed.
+
+Selected signals are copied out of the log's events into typed Parquet
+tables, one per signal group, and stored next to the segment's other
+objects. Replay, statistics and event detection read just the columns
+they need from them, memory-mapped locally or by ranged reads from MinIO,
+and never decode capnp again.
+"""
+from typing import Iterable, Optional
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Rows buffered per table before they are written out as one row group
+ROW_GROUP_SIZE = 64 * 1024
+
+# Every table is keyed by mono_time, the event's logMonoTime in nanoseconds;
+# it is monotonic across all segments of a route
+TABLES = {
+    # GPS fixes, from the external receiver or the modem's
+    'gps': pa.schema([
+        ('mono_time', pa.int64()),
+        ('unix_time_ms', pa.int64()),
+        ('latitude', pa.float64()),
+        ('longitude', pa.float64()),
+        ('altitude', pa.float32()),
+        ('speed', pa.float32()),
+        ('bearing_deg', pa.float32()),
+        ('accuracy', pa.float32()),
+        ('external', pa.bool_()),
+    ]),
+    # Vehicle state decoded from CAN by openpilot, with the engagement at that time
+    'car': pa.schema([
+        ('mono_time', pa.int64()),
+        ('v_ego', pa.float32()),
+        ('a_ego', pa.float32()),
+        ('steering_angle_deg', pa.float32()),
+        ('steering_torque', pa.float32()),
+        ('gas_pressed', pa.bool_()),
+        ('brake_pressed', pa.bool_()),
+        ('left_blinker', pa.bool_()),
+        ('right_blinker', pa.bool_()),
+        ('cruise_speed', pa.float32()),
+        ('yaw_rate', pa.float32()),
+        ('engaged', pa.bool_()),
+    ]),
+    # openpilot alerts, one row each time the alert shown changes ('' when none is)
+    'alerts': pa.schema([
+        ('mono_time', pa.int64()),
+        ('alert_type', pa.string()),
+        ('alert_text', pa.string()),
+        ('alert_status', pa.string()),
+    ]),
+}
+
+GPS_EVENTS = {'gpsLocationExternal': True, 'gpsLocation': False}
+# Engagement and alerts: newer openpilot reports them in selfdriveState; older
+# logs only have them in controlsState, whose fields the current schema names
+# *DEPRECATED. Field names per event, in the order enabled, type, text, status
+STATE_FIELDS = {
+    'selfdriveState': ('enabled', 'alertType', 'alertText1', 'alertStatus'),
+    'controlsState': ('enabledDEPRECATED', 'alertTypeDEPRECATED', 'alertText1DEPRECATED', 'alertStatusDEPRECATED'),
+}
+
+class TelemetryWriter:
+    """Collect the signals of a log's events into local Parquet files, a row group at a time.
+
+    Memory use is at most ROW_GROUP_SIZE rows per table, whatever the
+    length of the log.
+    """
+
+    def __init__(self, directory: str, prefix: str):
+        self.paths = {table: os.path.join(directory, f"{prefix}.{table}.parquet") for table in TABLES}
+        self.columns = {table: [[] for _ in schema] for table, schema in TABLES.items()}
+        self.rows = dict.fromkeys(TABLES, 0)
+        self.writers = {}
+        self.engaged = False
+        self.alert_type = ''
+        # Once a log has selfdriveState, its controlsState carries no engagement
+        self.selfdrive_state = False
+
+    def add(self, event, which: Optional[str] = None) -> None:
+        """Take the signals of one event, if it carries any"""
+        which = which or str(event.which())
+        if which in GPS_EVENTS:
+            gps = getattr(event, which)
+            self._append('gps', (
+                event.logMonoTime, gps.unixTimestampMillis, gps.latitude, gps.longitude,
+                gps.altitude, gps.speed, gps.bearingDeg, gps.accuracy, GPS_EVENTS[which]
+            ))
+        elif which == 'carState':
+            car = event.carState
+            self._append('car', (
+                event.logMonoTime, car.vEgo, car.aEgo, car.steeringAngleDeg, car.steeringTorque,
+                car.gasPressed, car.brakePressed, car.leftBlinker, car.rightBlinker,
+                car.cruiseState.speed, car.yawRate, self.engaged
+            ))
+        elif which in STATE_FIELDS:
+            if which == 'selfdriveState':
+                self.selfdrive_state = True
+            elif self.selfdrive_state:
+                return
+            state = getattr(event, which)
+            enabled, alert_type, alert_text, alert_status = (getattr(state, name) for name in STATE_FIELDS[which])
+            self.engaged = enabled
+            if alert_type != self.alert_type:
+                self.alert_type = alert_type
+                self._append('alerts', (event.logMonoTime, alert_type, alert_text, str(alert_status)))
+
+    def _append(self, table: str, row: tuple) -> None:
+        columns = self.columns[table]
+        for column, value in zip(columns, row):
+            column.append(value)
+        if len(columns[0]) >= ROW_GROUP_SIZE:
+            self._flush(table)
+
+    def _flush(self, table: str) -> None:
+        columns = self.columns[table]
+        if not columns[0]:
+            return
+        schema = TABLES[table]
+        batch = pa.RecordBatch.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+            schema=schema
+        )
+        if table not in self.writers:
+            self.writers[table] = pq.ParquetWriter(self.paths[table], schema, compression='zstd')
+        self.writers[table].write_batch(batch)
+        self.rows[table] += batch.num_rows
+        for values in columns:
+            values.clear()
+
+    def close(self) -> dict:
+        """Write out the remaining rows; returns {table: {"path", "rows"}} of the tables with any"""
+        for table in TABLES:
+            self._flush(table)
+        for writer in self.writers.values():
+            writer.close()
+        return {
+            table: {"path": self.paths[table], "rows": self.rows[table]}
+            for table in self.writers
+        }
+
+def object_key(log_path: str, source: str, table: str) -> str:
+    """Key of a segment's telemetry table (e.g. .../0/rlog.bz2 -> .../0/rlog.car.parquet)"""
+    return f"{os.path.dirname(log_path)}/{source}.{table}.parquet"
+
+def read(path: str, columns: Optional[Iterable[str]] = None) -> pa.Table:
+    """Read columns of a local telemetry file, memory-mapped"""
+    return pq.read_table(path, columns=list(columns) if columns else None, memory_map=True)
+
+def load(storage, index: dict, table: str, columns: Optional[Iterable[str]] = None) -> Optional[pa.Table]:
+    """Read columns of a segment's telemetry table from MinIO.
+
+    index is the segment's telemetry record (route_segments.telemetry).
+    Only the footer and the requested column chunks are fetched. Returns
+    None if the segment has no such table.
+    """
+    entry = (index or {}).get("tables", {}).get(table)
+    if not entry:
+        return None
+    with storage.open_seekable(index["bucket"], entry["key"]) as f:
+        return pq.ParquetFile(f).read(columns=list(columns) if columns else None)
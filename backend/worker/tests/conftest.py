@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+# Tests import the worker's modules the way it runs them, from backend/worker
+# with backend/shared alongside (the image copies it to /app/shared)
+WORKER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(WORKER_DIR))
+sys.path.insert(0, WORKER_DIR)
+
+# metrics keeps samples in prometheus_client's multiprocess files; give tests
+# their own directory before anything imports it
+os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="worker-metrics-")
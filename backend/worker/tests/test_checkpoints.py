@@ -0,0 +1,66 @@
+"""Stage checkpoints kept in Redis per source object version"""
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+import checkpoints
+from checkpoints import Checkpoint
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(checkpoints, "redis_client", client)
+    return client
+
+def test_stages_persist_across_instances(redis_client):
+    checkpoint = Checkpoint("process_video", "key", "etag1")
+    assert not checkpoint.has("remux")
+    checkpoint.done("remux", {"path": "out.mp4"})
+    checkpoint.done("thumbnail")
+
+    reopened = Checkpoint("process_video", "key", "etag1")
+    assert reopened.has("remux", "thumbnail")
+    assert not reopened.has("remux", "sprites")
+    assert reopened.get("remux") == {"path": "out.mp4"}
+    assert reopened.get("thumbnail") is None
+    assert reopened.get("sprites", "missing") == "missing"
+
+def test_new_etag_forgets_every_stage(redis_client):
+    Checkpoint("process_video", "key", "etag1").done("remux", 1)
+
+    reuploaded = Checkpoint("process_video", "key", "etag2")
+    assert not reuploaded.has("remux")
+    assert redis_client.hgetall(reuploaded.key) == {"etag": "etag2"}
+    # Nor does the old version come back
+    assert not Checkpoint("process_video", "key", "etag1").has("remux")
+
+def test_checkpoints_are_per_task_and_source(redis_client):
+    Checkpoint("process_video", "key", "etag").done("remux", 1)
+    assert not Checkpoint("transcode_video", "key", "etag").has("remux")
+    assert not Checkpoint("process_video", "other", "etag").has("remux")
+
+def test_checkpoints_expire(redis_client):
+    checkpoint = Checkpoint("process_video", "key", "etag")
+    assert 0 < redis_client.ttl(checkpoint.key) <= checkpoints.CHECKPOINT_TTL
+    redis_client.expire(checkpoint.key, 1)
+    checkpoint.done("remux", 1)
+    assert redis_client.ttl(checkpoint.key) > 1
+
+def test_run_skips_complete_stages(redis_client):
+    calls = []
+
+    def stage(value):
+        calls.append(value)
+        return value * 2
+
+    assert Checkpoint("process_video", "key", "etag").run("double", stage, 2) == 4
+    assert Checkpoint("process_video", "key", "etag").run("double", stage, 3) == 4
+    assert calls == [2]
+
+def test_failed_stage_is_not_recorded(redis_client):
+    def stage():
+        raise RuntimeError("ffmpeg failed")
+
+    with pytest.raises(RuntimeError):
+        Checkpoint("process_video", "key", "etag").run("remux", stage)
+    assert not Checkpoint("process_video", "key", "etag").has("remux")
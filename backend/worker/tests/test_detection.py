@@ -0,0 +1,103 @@
+"""Driving event thresholds"""
+import numpy as np
+
+import detection
+
+RATE = 100  # Hz, as carState is logged
+
+def car_state(seconds: float = 10.0, speed: float = 20.0) -> dict:
+    count = int(seconds * RATE)
+    return {
+        "mono_time": np.arange(count, dtype=np.int64) * (1_000_000_000 // RATE),
+        "v_ego": np.full(count, speed),
+        "a_ego": np.zeros(count),
+        "yaw_rate": np.zeros(count),
+        "engaged": np.zeros(count, dtype=bool),
+        "brake_pressed": np.zeros(count, dtype=bool),
+        "gas_pressed": np.zeros(count, dtype=bool),
+    }
+
+def window(start: float, seconds: float) -> slice:
+    return slice(int(start * RATE), int((start + seconds) * RATE))
+
+def test_hard_braking_over_threshold_and_duration():
+    car = car_state()
+    car["a_ego"][window(2.0, 1.0)] = detection.HARD_BRAKE_ACCEL - 1.5
+    events = detection.hard_braking(car)
+    assert len(events) == 1
+    assert events[0]["event_type"] == "hard_braking"
+    assert events[0]["metadata"]["peak"] == detection.HARD_BRAKE_ACCEL - 1.5
+    assert abs(events[0]["mono_time"] / 1e9 - 2.0) < detection.SMOOTHING_WINDOW
+
+def test_hard_braking_too_short():
+    car = car_state()
+    car["a_ego"][window(2.0, detection.HARD_BRAKE_DURATION / 2)] = detection.HARD_BRAKE_ACCEL - 1.5
+    assert detection.hard_braking(car) == []
+
+def test_hard_braking_below_threshold():
+    car = car_state()
+    car["a_ego"][window(2.0, 2.0)] = detection.HARD_BRAKE_ACCEL + 0.5
+    assert detection.hard_braking(car) == []
+
+def test_hard_braking_ignored_when_stopped():
+    car = car_state(speed=detection.MIN_SPEED / 2)
+    car["a_ego"][window(2.0, 1.0)] = detection.HARD_BRAKE_ACCEL - 1.5
+    assert detection.hard_braking(car) == []
+
+def test_hard_braking_ignores_spikes():
+    # One-sample spikes are smoothed away
+    car = car_state()
+    car["a_ego"][200:300:10] = detection.HARD_BRAKE_ACCEL * 3
+    assert detection.hard_braking(car) == []
+
+def test_braking_runs_close_together_merge():
+    car = car_state()
+    gap = detection.MERGE_GAP / 2
+    car["a_ego"][window(2.0, 1.0)] = -6.0
+    car["a_ego"][window(3.0 + gap, 1.0)] = -6.0
+    events = detection.hard_braking(car)
+    assert len(events) == 1
+    assert events[0]["metadata"]["duration_seconds"] > 2.0
+
+def test_short_braking_runs_close_together_do_not_add_up():
+    car = car_state()
+    short = detection.HARD_BRAKE_DURATION / 2
+    car["a_ego"][window(2.0, short)] = -6.0
+    car["a_ego"][window(2.0 + short + detection.MERGE_GAP / 2, short)] = -6.0
+    assert detection.hard_braking(car) == []
+
+def test_lateral_acceleration_over_threshold():
+    car = car_state(speed=20.0)
+    car["yaw_rate"][window(4.0, 1.0)] = -(detection.LATERAL_ACCEL_LIMIT + 1.0) / 20.0
+    events = detection.lateral_acceleration(car)
+    assert len(events) == 1
+    assert events[0]["event_type"] == "high_lateral_accel"
+    assert events[0]["metadata"]["peak"] == detection.LATERAL_ACCEL_LIMIT + 1.0
+
+def test_lateral_acceleration_below_threshold():
+    car = car_state(speed=20.0)
+    car["yaw_rate"][window(4.0, 2.0)] = (detection.LATERAL_ACCEL_LIMIT - 0.5) / 20.0
+    assert detection.lateral_acceleration(car) == []
+
+def test_disengagement_cause():
+    car = car_state()
+    car["engaged"][window(1.0, 2.0)] = True
+    car["engaged"][window(5.0, 2.0)] = True
+    car["brake_pressed"][int(3.0 * RATE)] = True
+    events = detection.disengagements(car)
+    assert [event["metadata"]["cause"] for event in events] == ["brake", "other"]
+    assert [event["mono_time"] for event in events] == [3_000_000_000, 7_000_000_000]
+
+def test_detect_orders_events():
+    car = car_state()
+    car["engaged"][window(0.0, 6.0)] = True
+    car["a_ego"][window(2.0, 1.0)] = -6.0
+    alert_table = {
+        "mono_time": np.array([1_000_000_000, 4_000_000_000]),
+        "alert_type": np.array(["steerSaturated", "promptDriverDistracted"]),
+        "alert_text": np.array(["Take Control", "Pay Attention"]),
+        "alert_status": np.array(["normal", "userPrompt"]),
+    }
+    events = detection.detect(car, alert_table)
+    assert [event["event_type"] for event in events] == ["hard_braking", "alert", "disengagement"]
+    assert detection.detect(None, None) == []
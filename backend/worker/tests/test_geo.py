@@ -0,0 +1,51 @@
+"""Track simplification and polyline encoding"""
+import numpy as np
+
+import geo
+
+def test_encode_polyline_reference():
+    # The example of Google's encoded polyline algorithm documentation
+    lat = np.array([38.5, 40.7, 43.252])
+    lon = np.array([-120.2, -120.95, -126.453])
+    assert geo.encode_polyline(lat, lon) == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+
+def test_encode_polyline_empty_and_origin():
+    assert geo.encode_polyline(np.array([]), np.array([])) == ""
+    assert geo.encode_polyline(np.array([0.0]), np.array([0.0])) == "??"
+
+def test_encode_polyline_precision():
+    lat, lon = np.array([38.5]), np.array([-120.2])
+    assert geo.encode_polyline(lat, lon, precision=6) != geo.encode_polyline(lat, lon)
+
+def test_simplify_drops_collinear_points():
+    lat = np.zeros(50)
+    lon = np.linspace(0, 0.01, 50)
+    assert geo.simplify(lat, lon, 1.0).tolist() == [0, 49]
+
+def test_simplify_keeps_points_beyond_tolerance():
+    # A 11 m bump in the middle of a 1.1 km straight line
+    lat = np.array([0.0, 0.0, 0.0001, 0.0, 0.0])
+    lon = np.array([0.0, 0.0025, 0.005, 0.0075, 0.01])
+    assert geo.simplify(lat, lon, 8.0).tolist() == [0, 2, 4]
+    assert geo.simplify(lat, lon, 20.0).tolist() == [0, 4]
+
+def test_simplify_short_tracks():
+    assert geo.simplify(np.array([]), np.array([]), 1.0).tolist() == []
+    assert geo.simplify(np.array([1.0, 2.0]), np.array([1.0, 2.0]), 1.0).tolist() == [0, 1]
+
+def test_simplify_loop():
+    # Back where it started: the farthest point from the start is kept
+    angle = np.linspace(0, 2 * np.pi, 41)
+    lat, lon = 0.001 * np.sin(angle), 0.001 * (1 - np.cos(angle))
+    kept = geo.simplify(lat, lon, 10.0)
+    assert kept[0] == 0 and kept[-1] == 40
+    assert 20 in kept
+
+def test_simplify_levels_coarsen_in_order():
+    rng = np.random.default_rng(0)
+    lat = np.cumsum(rng.normal(0, 1e-4, 500))
+    lon = np.cumsum(rng.normal(0, 1e-4, 500))
+    fine, coarse = geo.simplify_levels(lat, lon, (1.0, 60.0))
+    assert set(coarse) <= set(fine)
+    assert len(coarse) < len(fine)
+    assert fine[0] == coarse[0] == 0 and fine[-1] == coarse[-1] == 499
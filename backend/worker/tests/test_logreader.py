@@ -0,0 +1,76 @@
+"""Log decompression and capnp message framing"""
+import bz2
+import io
+import struct
+
+import pytest
+
+pytest.importorskip("capnp")
+zstandard = pytest.importorskip("zstandard")
+
+import logreader
+
+def frame(*segment_words: int) -> bytes:
+    """A capnp message with segments of the given sizes, filled with a recognizable pattern"""
+    table = struct.pack(f"<I{len(segment_words)}I", len(segment_words) - 1, *segment_words)
+    if len(segment_words) % 2 == 0:
+        table += b"\0" * 4
+    body = bytes(i % 251 for i in range(sum(segment_words) * logreader.WORD))
+    return table + body
+
+MESSAGES = [frame(3), frame(1, 2), frame(0), frame(2, 1, 4), frame(5, 0, 0, 1)]
+
+def test_messages_split_frames():
+    assert list(logreader.messages(io.BytesIO(b"".join(MESSAGES)))) == MESSAGES
+
+def test_messages_header_padding():
+    # Odd segment counts fill the header's last word, even ones are padded
+    assert len(frame(0)) == 8
+    assert len(frame(0, 0)) == 16
+    assert len(frame(0, 0, 0)) == 16
+
+def test_messages_empty_log():
+    assert list(logreader.messages(io.BytesIO(b""))) == []
+
+@pytest.mark.parametrize("cut", [1, 4, 7, 12])
+def test_messages_truncated_log_ends_at_last_complete_message(cut):
+    data = b"".join(MESSAGES)
+    assert list(logreader.messages(io.BytesIO(data[:-cut]))) == MESSAGES[:-1]
+
+def test_messages_short_reads():
+    class Trickle(io.RawIOBase):
+        """Returns at most 3 bytes per read, like a slow decompressor"""
+        def __init__(self, data):
+            self.data = io.BytesIO(data)
+
+        def readable(self):
+            return True
+
+        def readinto(self, buffer):
+            chunk = self.data.read(min(len(buffer), 3))
+            buffer[:len(chunk)] = chunk
+            return len(chunk)
+
+    assert list(logreader.messages(Trickle(b"".join(MESSAGES)))) == MESSAGES
+
+def test_messages_rejects_too_many_segments():
+    data = struct.pack("<I", logreader.MAX_SEGMENTS) + b"\0" * 4096
+    with pytest.raises(ValueError):
+        list(logreader.messages(io.BytesIO(data)))
+
+def test_messages_rejects_oversized_message():
+    data = struct.pack("<II", 0, logreader.MAX_MESSAGE_WORDS + 1)
+    with pytest.raises(ValueError):
+        list(logreader.messages(io.BytesIO(data)))
+
+@pytest.mark.parametrize("compress", [
+    lambda data: data,
+    bz2.compress,
+    lambda data: bz2.compress(data[:20]) + bz2.compress(data[20:]),
+    lambda data: zstandard.ZstdCompressor().compress(data),
+    lambda data: zstandard.ZstdCompressor().compress(data[:20]) + zstandard.ZstdCompressor().compress(data[20:]),
+], ids=["raw", "bz2", "bz2-multistream", "zstd", "zstd-multiframe"])
+def test_decompressed_messages(compress):
+    data = b"".join(MESSAGES)
+    stream = logreader.decompressed(io.BytesIO(compress(data)))
+    assert list(logreader.messages(stream)) == MESSAGES
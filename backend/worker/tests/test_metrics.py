@@ -0,0 +1,77 @@
+"""Task, storage and ffmpeg metrics, as Prometheus reads them from the multiprocess files"""
+import io
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("celery")
+from prometheus_client import CollectorRegistry, multiprocess
+
+import metrics
+from shared import queues
+
+def sample(name: str, **labels) -> float:
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry.get_sample_value(name, labels) or 0.0
+
+class FakeRequest(dict):
+    eta = None
+
+def fake_task(name: str, **headers) -> SimpleNamespace:
+    request = FakeRequest(headers)
+    request.eta = headers.pop("eta", None)
+    return SimpleNamespace(name=name, request=request)
+
+def test_task_duration_by_state():
+    task = fake_task("tasks.test_duration")
+    metrics._task_started(task_id="1", task=task)
+    metrics._task_finished(task_id="1", task=task, state="SUCCESS")
+    assert sample("worker_task_duration_seconds_count", task=task.name, state="SUCCESS") == 1
+    assert sample("worker_task_cpu_seconds_count", task=task.name) == 1
+    # A task that never started records nothing
+    metrics._task_finished(task_id="2", task=task, state="SUCCESS")
+    assert sample("worker_task_duration_seconds_count", task=task.name, state="SUCCESS") == 1
+
+def test_queue_wait_from_sent_at(monkeypatch):
+    monkeypatch.setattr(metrics.time, "time", lambda: 1000.0)
+    task = fake_task("tasks.test_wait", sent_at=990.0)
+    metrics._task_started(task_id="1", task=task)
+    assert sample("worker_task_queue_wait_seconds_sum", task=task.name) == pytest.approx(10.0)
+
+def test_queue_wait_starts_at_eta(monkeypatch):
+    monkeypatch.setattr(metrics.time, "time", lambda: 1000.0)
+    eta = datetime.fromtimestamp(996.0, tz=timezone.utc).isoformat()
+    task = fake_task("tasks.test_eta", sent_at=900.0, eta=eta)
+    metrics._task_started(task_id="1", task=task)
+    assert sample("worker_task_queue_wait_seconds_sum", task=task.name) == pytest.approx(4.0)
+
+def test_tasks_without_sent_at_skip_queue_wait():
+    task = fake_task("tasks.test_unstamped")
+    metrics._task_started(task_id="1", task=task)
+    assert sample("worker_task_queue_wait_seconds_count", task=task.name) == 0
+
+def test_publish_stamps_sent_at():
+    headers = {}
+    queues._stamp_sent_at(headers=headers)
+    assert headers["sent_at"] > 0
+
+def test_retries():
+    metrics._task_retried(sender=SimpleNamespace(name="tasks.test_retry"))
+    assert sample("worker_task_retries_total", task="tasks.test_retry") == 1
+
+def test_ffmpeg_progress():
+    metrics.observe_ffmpeg("test_remux", {"frame": 1200, "fps": 240.0, "speed": 12.0})
+    metrics.observe_ffmpeg("test_remux", {"frame": 1200})
+    assert sample("worker_ffmpeg_speed_count", operation="test_remux") == 1
+    assert sample("worker_ffmpeg_speed_sum", operation="test_remux") == 12.0
+    assert sample("worker_ffmpeg_fps_sum", operation="test_remux") == 240.0
+
+def test_streamed_bytes_are_counted():
+    before = sample("worker_storage_bytes_total", direction="upload")
+    reader = metrics._CountingReader(io.BytesIO(b"x" * 100), "upload")
+    assert reader.read(60) == b"x" * 60
+    assert reader.read() == b"x" * 40
+    assert reader.read() == b""
+    assert sample("worker_storage_bytes_total", direction="upload") - before == 100
@@ -0,0 +1,136 @@
+"""process_video stages, with ffmpeg replaced by fakes that write their outputs"""
+import hashlib
+import os
+import shutil
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("celery")
+
+import checkpoints
+import tasks
+
+VIDEO_PATH = "dongle/route/0/fcamera.hevc"
+
+class DirectoryStorage:
+    """ObjectStorage over a local directory, one folder per bucket"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, bucket: str, key: str) -> str:
+        path = os.path.join(self.root, bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def etag(self, bucket: str, key: str) -> str:
+        with open(self.path(bucket, key), "rb") as f:
+            return hashlib.md5(f.read()).hexdigest()
+
+    def download(self, bucket: str, key: str, path: str) -> None:
+        shutil.copyfile(self.path(bucket, key), path)
+
+    def upload(self, path: str, bucket: str, key: str, content_type: str) -> None:
+        shutil.copyfile(path, self.path(bucket, key))
+
+def touch(path):
+    with open(path, "wb") as f:
+        f.write(b"\0")
+
+class FakeVideo:
+    """Records what process_video asked ffmpeg for and writes the files it would have"""
+
+    def __init__(self):
+        self.calls = []
+
+    def _stills(self, preview_pattern=None, preview_interval=10, timelapse_path=None):
+        if preview_pattern:
+            for i in range(1, 4):
+                touch(preview_pattern % i)
+        if timelapse_path:
+            touch(timelapse_path)
+
+    def remux_hevc(self, input_path, output_path, thumbnail_path=None):
+        self.calls.append("remux")
+        touch(output_path)
+        touch(thumbnail_path)
+
+    def transcode_h264(self, input_path, output_path, thumbnail_path=None, preset="medium", **stills):
+        self.calls.append(("transcode", sorted(name for name, value in stills.items() if value)))
+        touch(output_path)
+        touch(thumbnail_path)
+        self._stills(**stills)
+
+    def stills(self, input_path, **stills):
+        self.calls.append(("stills", sorted(name for name, value in stills.items() if value)))
+        self._stills(**stills)
+
+@pytest.fixture
+def worker(tmp_path, monkeypatch):
+    monkeypatch.setattr(checkpoints, "redis_client", fakeredis.FakeRedis(decode_responses=True))
+    storage = DirectoryStorage(str(tmp_path / "storage"))
+    with open(storage.path(tasks.MINIO_BUCKET, VIDEO_PATH), "wb") as f:
+        f.write(b"fcamera")
+    monkeypatch.setattr(tasks, "storage", storage)
+    monkeypatch.setattr(tasks, "STAGING_DIR", str(tmp_path / "staging"))
+    monkeypatch.setattr(tasks, "_last_sweep", float("-inf"))
+    monkeypatch.setattr(tasks, "VIDEO_STREAMING", False)
+    monkeypatch.setattr(tasks, "_update_segment_video", lambda *args, **kwargs: None)
+    monkeypatch.setattr(tasks, "_upload_sprites", lambda frames, pattern, video_path: {"sheets": ["sheet"], "count": len(frames)})
+    fake = FakeVideo()
+    monkeypatch.setattr(tasks, "video", fake)
+    scheduled = []
+    monkeypatch.setattr(tasks, "_schedule_for_route", lambda task, route_id, delay: scheduled.append(task.name))
+    fake.scheduled = scheduled
+    return fake
+
+def configure(monkeypatch, mode: str, stills: bool):
+    monkeypatch.setattr(tasks, "VIDEO_PROCESSING_MODE", mode)
+    monkeypatch.setattr(tasks, "VIDEO_STILLS", stills)
+    monkeypatch.setattr(tasks, "ROUTE_PREVIEWS", stills or mode == "transcode")
+
+def test_remux_without_stills_is_copy_only(worker, monkeypatch):
+    configure(monkeypatch, "remux", False)
+    result = tasks.process_video("route", "segment", VIDEO_PATH)
+    assert worker.calls == ["remux"]
+    assert set(result["renditions"]) == {"hevc"}
+    assert result["sprites"] == 0
+    assert worker.scheduled == []
+
+def test_remux_with_stills_takes_a_second_pass(worker, monkeypatch):
+    configure(monkeypatch, "remux", True)
+    result = tasks.process_video("route", "segment", VIDEO_PATH)
+    assert worker.calls == ["remux", ("stills", ["preview_interval", "preview_pattern", "timelapse_path"])]
+    assert set(result["renditions"]) == {"hevc", "sprites", "timelapse"}
+    assert worker.scheduled == ["tasks.build_route_preview"]
+
+@pytest.mark.parametrize("stills", [False, True])
+def test_transcode_always_takes_stills(worker, monkeypatch, stills):
+    configure(monkeypatch, "transcode", stills)
+    result = tasks.process_video("route", "segment", VIDEO_PATH)
+    assert worker.calls == [("transcode", ["preview_interval", "preview_pattern", "timelapse_path"])]
+    assert set(result["renditions"]) == {"h264", "sprites", "timelapse"}
+    assert worker.scheduled == ["tasks.build_route_preview"]
+
+def test_rerun_of_a_processed_upload_is_skipped(worker, monkeypatch):
+    configure(monkeypatch, "remux", False)
+    first = tasks.process_video("route", "segment", VIDEO_PATH)
+    assert tasks.process_video("route", "segment", VIDEO_PATH) == first
+    assert worker.calls == ["remux"]
+
+def test_sweep_staging_removes_only_abandoned_files(tmp_path, monkeypatch):
+    staging = tmp_path / "staging"
+    monkeypatch.setattr(tasks, "STAGING_DIR", str(staging))
+    assert tasks.sweep_staging() == 0
+
+    (staging / "job").mkdir(parents=True)
+    (staging / "job" / "segment.hevc").write_bytes(b"\0")
+    (staging / "abandoned.mp4").write_bytes(b"\0")
+    (staging / "running.mp4").write_bytes(b"\0")
+    old = tasks.time.time() - tasks.STAGING_TTL - 60
+    os.utime(staging / "job", (old, old))
+    os.utime(staging / "abandoned.mp4", (old, old))
+
+    assert tasks.sweep_staging() == 2
+    assert os.listdir(staging) == ["running.mp4"]
@@ -0,0 +1,87 @@
+"""Telemetry tables written from log events"""
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+import telemetry
+
+def event(mono_time: int, which: str, **fields) -> SimpleNamespace:
+    return SimpleNamespace(logMonoTime=mono_time, **{which: SimpleNamespace(**fields)})
+
+def car_state(mono_time: int) -> SimpleNamespace:
+    return event(
+        mono_time, 'carState',
+        vEgo=20.0, aEgo=0.0, steeringAngleDeg=0.0, steeringTorque=0.0,
+        gasPressed=False, brakePressed=False, leftBlinker=False, rightBlinker=False,
+        cruiseState=SimpleNamespace(speed=25.0), yawRate=0.0
+    )
+
+def selfdrive_state(mono_time: int, enabled: bool, alert_type: str = '') -> SimpleNamespace:
+    return event(
+        mono_time, 'selfdriveState',
+        enabled=enabled, alertType=alert_type, alertText1=alert_type.upper(), alertStatus='userPrompt'
+    )
+
+def controls_state(mono_time: int, enabled: bool, alert_type: str = '') -> SimpleNamespace:
+    # As decoded with a schema that has selfdriveState: only the renamed fields exist
+    return event(
+        mono_time, 'controlsState',
+        enabledDEPRECATED=enabled, alertTypeDEPRECATED=alert_type,
+        alertText1DEPRECATED=alert_type.upper(), alertStatusDEPRECATED='normal'
+    )
+
+def write(tmp_path, events: list) -> dict:
+    writer = telemetry.TelemetryWriter(str(tmp_path), 'rlog')
+    for e in events:
+        which = next(name for name in vars(e) if name != 'logMonoTime')
+        writer.add(e, which)
+    return {table: telemetry.read(written["path"]).to_pydict() for table, written in writer.close().items()}
+
+def test_engagement_from_selfdrive_state(tmp_path):
+    tables = write(tmp_path, [
+        car_state(1),
+        selfdrive_state(2, True),
+        car_state(3),
+        selfdrive_state(4, False, 'steerSaturated'),
+        car_state(5),
+    ])
+    assert tables['car']['engaged'] == [False, True, False]
+    assert tables['alerts'] == {
+        'mono_time': [4],
+        'alert_type': ['steerSaturated'],
+        'alert_text': ['STEERSATURATED'],
+        'alert_status': ['userPrompt'],
+    }
+
+def test_engagement_from_controls_state_in_older_logs(tmp_path):
+    tables = write(tmp_path, [
+        controls_state(1, True),
+        car_state(2),
+        controls_state(3, True, 'preLaneChangeLeft'),
+        controls_state(4, False),
+        car_state(5),
+    ])
+    assert tables['car']['engaged'] == [True, False]
+    assert tables['alerts']['alert_type'] == ['preLaneChangeLeft', '']
+    assert tables['alerts']['alert_status'] == ['normal', 'normal']
+
+def test_controls_state_ignored_alongside_selfdrive_state(tmp_path):
+    # Current logs still carry controlsState, with its deprecated fields unset
+    tables = write(tmp_path, [
+        selfdrive_state(1, True, 'promptDriverDistracted'),
+        controls_state(2, False),
+        car_state(3),
+        controls_state(4, False),
+        car_state(5),
+    ])
+    assert tables['car']['engaged'] == [True, True]
+    assert tables['alerts']['alert_type'] == ['promptDriverDistracted']
+
+def test_gps_tables(tmp_path):
+    fix = dict(unixTimestampMillis=1714566600000, latitude=32.7, longitude=-117.1, altitude=10.0,
+               speed=20.0, bearingDeg=90.0, accuracy=3.0)
+    tables = write(tmp_path, [event(1, 'gpsLocationExternal', **fix), event(2, 'gpsLocation', **fix)])
+    assert tables['gps']['external'] == [True, False]
+    assert set(tables) == {'gps'}
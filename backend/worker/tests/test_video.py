@@ -0,0 +1,44 @@
+"""ffmpeg graphs of the video stage, run on small synthetic camera clips"""
+import shutil
+
+import pytest
+
+ffmpeg = pytest.importorskip("ffmpeg")
+
+import video
+
+SECONDS = 6
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+
+@pytest.fixture(scope="module")
+def camera_clip(tmp_path_factory):
+    """A raw HEVC stream like fcamera.hevc, SECONDS long at the camera's frame rate"""
+    path = str(tmp_path_factory.mktemp("video") / "fcamera.hevc")
+    try:
+        (
+            ffmpeg
+            .input(f"testsrc2=size=320x240:rate={video.CAMERA_FPS}", format="lavfi", t=SECONDS)
+            .output(path, format="hevc", vcodec="libx265", g=video.CAMERA_FPS, **{"x265-params": "log-level=error"})
+            .run(capture_stdout=True, capture_stderr=True)
+        )
+    except ffmpeg.Error as e:
+        pytest.skip(f"ffmpeg cannot encode HEVC: {e.stderr.decode(errors='replace')[-200:]}")
+    return path
+
+def frame_count(path: str, **input_options) -> int:
+    _, stderr = ffmpeg.input(path, **input_options).output("-", format="null").run(capture_stdout=True, capture_stderr=True)
+    return video.parse_progress(stderr)["frame"]
+
+def test_camera_clip_frames(camera_clip):
+    assert frame_count(camera_clip, format="hevc", r=video.CAMERA_FPS) == SECONDS * video.CAMERA_FPS
+
+def test_timelapse_has_a_frame_per_second_of_drive(camera_clip, tmp_path):
+    timelapse = str(tmp_path / "timelapse.mp4")
+    video.stills(camera_clip, timelapse_path=timelapse)
+    assert frame_count(timelapse) == SECONDS * video.TIMELAPSE_SAMPLE_FPS
+
+def test_transcode_timelapse_has_a_frame_per_second_of_drive(camera_clip, tmp_path):
+    timelapse = str(tmp_path / "timelapse.mp4")
+    video.transcode_h264(camera_clip, str(tmp_path / "video.mp4"), preset="ultrafast", timelapse_path=timelapse)
+    assert frame_count(timelapse) == SECONDS * video.TIMELAPSE_SAMPLE_FPS
@@ -0,0 +1,490 @@
+import math
+import os
+import re
+import shutil
+import threading
+from typing import Callable, Optional
+
+import ffmpeg
+
+# openpilot cameras record raw HEVC at a fixed rate; the elementary stream carries no timestamps
+CAMERA_FPS = 20
+
+# Target HLS segment length; encoded renditions get a keyframe at every boundary
+HLS_SEGMENT_SECONDS = 2
+
+# Fragmented MP4 with the moov box up front, playable while it downloads
+FRAGMENTED_MP4_FLAGS = '+faststart+frag_keyframe+empty_moov+default_base_moof'
+# The same for pipes, where faststart's second pass over the file is impossible
+STREAMING_MP4_FLAGS = '+frag_keyframe+empty_moov+default_base_moof'
+
+# Bytes moved per read between object storage and ffmpeg's pipes
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+# Widths of the segment thumbnail and of the preview frames taken along the segment
+THUMBNAIL_WIDTH = 320
+PREVIEW_WIDTH = 160
+# The thumbnail is the frame this many seconds into the segment
+THUMBNAIL_SECONDS = 1
+
+# Segment time-lapse clips: one frame per second of drive, played at 10 fps.
+# Every clip is encoded alike, so a route's clips concatenate without re-encoding
+TIMELAPSE_WIDTH = 480
+TIMELAPSE_SAMPLE_FPS = 1
+TIMELAPSE_FPS = 10
+
+def _camera_input(input_path: str):
+    """Open a raw camera stream at its real frame rate"""
+    return ffmpeg.input(input_path, format='hevc', r=CAMERA_FPS)
+
+def _thumbnail_output(input_path: str, thumbnail_path: str):
+    """The thumbnail from its own read of the input, outside any split.
+
+    Only the frames up to the thumbnail are decoded: the output ends after
+    one frame, and ffmpeg stops reading an input nothing needs any more.
+    The frames before it are trimmed rather than skipped with -ss, as the
+    raw stream has no timestamps to seek by.
+    """
+    return (
+        _camera_input(input_path)
+        .filter('trim', start=THUMBNAIL_SECONDS)
+        .filter('scale', THUMBNAIL_WIDTH, -1)
+        .output(thumbnail_path, vframes=1)
+    )
+
+def _still_count(thumbnail_path: Optional[str] = None, preview_pattern: Optional[str] = None, timelapse_path: Optional[str] = None, **kwargs) -> int:
+    """Number of decoded branches the stills ask for"""
+    return sum(1 for path in (thumbnail_path, preview_pattern, timelapse_path) if path)
+
+def _stills(
+    branches: list,
+    thumbnail_path: Optional[str] = None,
+    preview_pattern: Optional[str] = None,
+    preview_interval: int = 10,
+    timelapse_path: Optional[str] = None
+) -> list:
+    """Outputs fed from branches of an already decoded stream, each taking the next branch.
+
+    The thumbnail is the JPEG frame one second in, previews one JPEG every
+    preview_interval seconds, and the time-lapse a small H.264 clip of one
+    frame per second.
+    """
+    branches = iter(branches)
+    outputs = []
+    if thumbnail_path:
+        outputs.append(
+            next(branches)
+            .filter('trim', start=THUMBNAIL_SECONDS)
+            .filter('scale', THUMBNAIL_WIDTH, -1)
+            .output(thumbnail_path, vframes=1)
+        )
+    if preview_pattern:
+        outputs.append(
+            next(branches)
+            .filter('fps', fps=f"1/{preview_interval}")
+            .filter('scale', PREVIEW_WIDTH, -1)
+            .output(preview_pattern, format='image2')
+        )
+    if timelapse_path:
+        outputs.append(
+            next(branches)
+            .filter('fps', fps=TIMELAPSE_SAMPLE_FPS)
+            .filter('scale', TIMELAPSE_WIDTH, -2)
+            # fps leaves a 1/TIMELAPSE_SAMPLE_FPS timebase, too coarse for N/(10*TB): restamp first
+            .filter('settb', f'1/{TIMELAPSE_FPS}')
+            .filter('setpts', 'N')
+            .output(
+                timelapse_path,
+                format='mp4',
+                vcodec='libx264',
+                preset='veryfast',
+                crf=28,
+                pix_fmt='yuv420p',
+                r=TIMELAPSE_FPS,
+                movflags='faststart'
+            )
+        )
+    return outputs
+
+def _split(stream, count: int) -> list:
+    """count branches of a decoded stream; a filter output can only be consumed once"""
+    if count == 1:
+        return [stream]
+    split = stream.filter_multi_output('split', count)
+    return [split[i] for i in range(count)]
+
+def parse_progress(stderr: bytes) -> dict:
+    """Final progress ffmpeg reported on stderr, e.g. {'frame': 1200, 'fps': 240.0, 'speed': 12.0}.
+
+    ffmpeg rewrites its status line with carriage returns; the last one
+    holds the totals. Fields it did not report are left out.
+    """
+    lines = re.split(r'[\r\n]+', stderr.decode(errors='replace'))
+    status = next((line for line in reversed(lines) if 'speed=' in line), '')
+    progress = {}
+    for field, value in re.findall(r'(frame|fps|speed)=\s*([0-9.]+)', status):
+        progress[field] = int(value) if field == 'frame' else float(value)
+    return progress
+
+# Called as progress_hook(operation, parse_progress(stderr)) after every successful ffmpeg run
+progress_hook: Optional[Callable[[str, dict], None]] = None
+
+def _report(operation: str, stderr: bytes) -> None:
+    if progress_hook and stderr:
+        progress_hook(operation, parse_progress(stderr))
+
+def _run(operation: str, *outputs) -> None:
+    """Run outputs as one ffmpeg invocation, so the input is demuxed and decoded once"""
+    _, stderr = (
+        ffmpeg
+        .merge_outputs(*outputs)
+        .overwrite_output()
+        .run(capture_stdout=True, capture_stderr=True)
+    )
+    _report(operation, stderr)
+
+def _remux_output(source, output_path: str, movflags: str):
+    """Output copying the HEVC stream into MP4; nothing is decoded"""
+    return source.video.output(
+        output_path,
+        format='mp4',
+        vcodec='copy',
+        movflags=movflags,
+        **{
+            # Stamp every frame, the raw stream has no timestamps to copy
+            'bsf:v': f'setts=ts=N/TB/{CAMERA_FPS}',
+            # hvc1 is the sample entry Safari and iOS require for HEVC
+            'tag:v': 'hvc1'
+        }
+    )
+
+def _transcode_outputs(source, output_path: str, movflags: str, preset: str = 'medium', **stills) -> list:
+    """Outputs encoding the stream to H.264 MP4, plus stills split off the same decode"""
+    branches = _split(source.video, 1 + _still_count(**stills))
+    output = branches[0].output(
+        output_path,
+        format='mp4',
+        vcodec='libx264',
+        video_bitrate='2M',
+        preset=preset,
+        movflags=movflags
+    )
+    return [output] + _stills(branches[1:], **stills)
+
+def remux_hevc(input_path: str, output_path: str, thumbnail_path: Optional[str] = None) -> None:
+    """Copy a raw HEVC stream into fragmented MP4 without re-encoding it.
+
+    The thumbnail, when asked for, comes from a second, seeked read of the
+    input in the same ffmpeg run; the copy itself decodes nothing. Previews
+    and time-lapse clips need a decode of the whole stream, see stills().
+    """
+    outputs = [_remux_output(_camera_input(input_path), output_path, FRAGMENTED_MP4_FLAGS)]
+    if thumbnail_path:
+        outputs.append(_thumbnail_output(input_path, thumbnail_path))
+    _run('remux', *outputs)
+
+def thumbnail(input_path: str, thumbnail_path: str, source=None) -> None:
+    """Take the thumbnail of a raw HEVC stream on its own.
+
+    With source, input_path is 'pipe:' and the stream is read from source;
+    ffmpeg stops reading once it has the frame.
+    """
+    output = _thumbnail_output(input_path, thumbnail_path)
+    if source is None:
+        _run('thumbnail', output)
+    else:
+        _run_fed('thumbnail', source, output)
+
+def stills(
+    input_path: str,
+    preview_pattern: Optional[str] = None,
+    preview_interval: int = 10,
+    timelapse_path: Optional[str] = None,
+    source=None
+) -> None:
+    """Decode a raw HEVC stream once for its previews and time-lapse clip (see _stills()).
+
+    A pass of its own, so remuxes stay copy-only when neither is wanted.
+    With source, input_path is 'pipe:' and the stream is read from source.
+    """
+    wanted = {"preview_pattern": preview_pattern, "preview_interval": preview_interval, "timelapse_path": timelapse_path}
+    count = _still_count(**wanted)
+    if not count:
+        return
+    outputs = _stills(_split(_camera_input(input_path).video, count), **wanted)
+    if source is None:
+        _run('stills', *outputs)
+    else:
+        _run_fed('stills', source, *outputs)
+
+def transcode_h264(
+    input_path: str,
+    output_path: str,
+    thumbnail_path: Optional[str] = None,
+    preview_pattern: Optional[str] = None,
+    preview_interval: int = 10,
+    timelapse_path: Optional[str] = None,
+    preset: str = 'medium'
+) -> None:
+    """Re-encode a raw HEVC stream to H.264 MP4 for clients without HEVC support.
+
+    The encoder and any stills are fed from one decode through a split filter;
+    preset is the x264 speed/size trade-off.
+    """
+    _run('transcode', *_transcode_outputs(
+        _camera_input(input_path), output_path, 'faststart', preset,
+        thumbnail_path=thumbnail_path, preview_pattern=preview_pattern,
+        preview_interval=preview_interval, timelapse_path=timelapse_path
+    ))
+
+class _PipeOutput:
+    """Readable over ffmpeg's stdout that fails at EOF if ffmpeg did.
+
+    Whoever consumes the output (a multipart upload) sees the error before
+    it can finish, instead of storing a truncated video.
+    """
+
+    def __init__(self, process, stderr: list, stderr_reader: threading.Thread):
+        self.process = process
+        self.stderr = stderr
+        self.stderr_reader = stderr_reader
+        self.size = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.process.stdout.read(size)
+        self.size += len(data)
+        if not data and self.process.wait() != 0:
+            self.stderr_reader.join()
+            raise ffmpeg.Error('ffmpeg', None, b''.join(self.stderr))
+        return data
+
+def _feed(stdin, source) -> None:
+    """Copy a readable into ffmpeg's stdin, stopping quietly if ffmpeg exits early"""
+    try:
+        shutil.copyfileobj(source, stdin, STREAM_CHUNK_SIZE)
+    except (BrokenPipeError, ValueError):
+        pass
+    finally:
+        try:
+            stdin.close()
+        except BrokenPipeError:
+            pass
+
+def _run_fed(operation: str, source, *outputs) -> None:
+    """_run() with the 'pipe:' input read from source, e.g. an object in storage"""
+    process = (
+        ffmpeg
+        .merge_outputs(*outputs)
+        .overwrite_output()
+        .run_async(pipe_stdin=True, pipe_stderr=True)
+    )
+    feeder = threading.Thread(target=_feed, args=(process.stdin, source), daemon=True)
+    feeder.start()
+    stderr = process.stderr.read()
+    process.wait()
+    feeder.join()
+    if process.returncode != 0:
+        raise ffmpeg.Error('ffmpeg', None, stderr)
+    _report(operation, stderr)
+
+def stream_video(
+    rendition: str,
+    source,
+    consume: Callable,
+    thumbnail_path: Optional[str] = None,
+    preview_pattern: Optional[str] = None,
+    preview_interval: int = 10,
+    timelapse_path: Optional[str] = None,
+    preset: str = 'medium'
+) -> int:
+    """Remux ('hevc') or transcode ('h264') a raw HEVC stream from pipe to pipe.
+
+    source is read into ffmpeg's stdin while consume() is handed a readable
+    over the fragmented MP4 ffmpeg writes, so reading, encoding and writing
+    overlap and the video never touches local disk; only the stills do.
+    Stills are only split off a transcode's decode; a remux is copy-only,
+    take its thumbnail() and stills() from another read of the source.
+    Raises ffmpeg.Error if ffmpeg fails, also from within consume(). Returns
+    the size of the video written.
+    """
+    source_stream = _camera_input('pipe:')
+    if rendition == 'hevc':
+        if _still_count(thumbnail_path=thumbnail_path, preview_pattern=preview_pattern, timelapse_path=timelapse_path):
+            raise ValueError("A streamed remux makes no stills")
+        outputs = [_remux_output(source_stream, 'pipe:', STREAMING_MP4_FLAGS)]
+    else:
+        outputs = _transcode_outputs(
+            source_stream, 'pipe:', STREAMING_MP4_FLAGS, preset,
+            thumbnail_path=thumbnail_path, preview_pattern=preview_pattern,
+            preview_interval=preview_interval, timelapse_path=timelapse_path
+        )
+    process = (
+        ffmpeg
+        .merge_outputs(*outputs)
+        .overwrite_output()
+        .run_async(pipe_stdin=True, pipe_stdout=True, pipe_stderr=True)
+    )
+    stderr = []
+    # Both side pipes are drained on their own threads, so none fills up and stalls ffmpeg
+    stderr_reader = threading.Thread(target=lambda: stderr.extend(iter(lambda: process.stderr.read(STREAM_CHUNK_SIZE), b'')), daemon=True)
+    feeder = threading.Thread(target=_feed, args=(process.stdin, source), daemon=True)
+    stderr_reader.start()
+    feeder.start()
+
+    output = _PipeOutput(process, stderr, stderr_reader)
+    try:
+        consume(output)
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+        feeder.join()
+        stderr_reader.join()
+        process.stdout.close()
+    if process.returncode != 0:
+        raise ffmpeg.Error('ffmpeg', None, b''.join(stderr))
+    _report({'hevc': 'remux', 'h264': 'transcode'}[rendition], b''.join(stderr))
+    return output.size
+
+def concat_clips(clip_paths: list, output_path: str, list_path: str) -> None:
+    """Join clips encoded alike into one MP4 with the concat demuxer, copying the streams.
+
+    list_path is where the demuxer's file list is written.
+    """
+    with open(list_path, 'w') as f:
+        for path in clip_paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    _, stderr = (
+        ffmpeg
+        .input(list_path, format='concat', safe=0)
+        .output(output_path, c='copy', movflags='faststart')
+        .overwrite_output()
+        .run(capture_stdout=True, capture_stderr=True)
+    )
+    _report('concat', stderr)
+
+def gif(input_path: str, output_path: str, width: int = 320, fps: int = 5) -> None:
+    """Convert a short clip to an animated GIF with a palette made for it"""
+    scaled = ffmpeg.input(input_path).filter('fps', fps=fps).filter('scale', width, -1, flags='lanczos')
+    split = scaled.filter_multi_output('split', 2)
+    palette = split[0].filter('palettegen')
+    _, stderr = (
+        ffmpeg
+        .filter([split[1], palette], 'paletteuse')
+        .output(output_path)
+        .overwrite_output()
+        .run(capture_stdout=True, capture_stderr=True)
+    )
+    _report('gif', stderr)
+
+def package_hls(input_path: str, output_dir: str, ladder: list, include_source: bool = True) -> dict:
+    """Package a raw HEVC stream as CMAF HLS renditions in one ffmpeg pass.
+
+    ladder is a list of (height, bitrate) H.264 renditions, all scaled from
+    a single decode; include_source adds the HEVC stream itself as a copied
+    rendition, which costs no encode. Returns {name: variant} as described
+    by read_hls_variants().
+    """
+    source = _camera_input(input_path)
+    streams = []
+    names = []
+    options = {}
+
+    if ladder:
+        split = source.video.filter_multi_output('split', len(ladder))
+        for i, (height, bitrate) in enumerate(ladder):
+            streams.append(split[i].filter('scale', -2, height))
+            names.append(f"{height}p")
+            options[f'c:v:{i}'] = 'libx264'
+            options[f'b:v:{i}'] = bitrate
+
+    if include_source:
+        i = len(streams)
+        streams.append(source.video)
+        names.append('source')
+        options[f'c:v:{i}'] = 'copy'
+        # Nominal, so the master playlist lists the copied stream; real bandwidth is measured
+        options[f'b:v:{i}'] = '4M'
+        options[f'bsf:v:{i}'] = f'setts=ts=N/TB/{CAMERA_FPS}'
+        options[f'tag:v:{i}'] = 'hvc1'
+
+    _, stderr = (
+        ffmpeg
+        .output(
+            *streams,
+            f"{output_dir}/%v/index.m3u8",
+            format='hls',
+            preset='veryfast',
+            # Keyframes on segment boundaries, so renditions can be switched between
+            g=HLS_SEGMENT_SECONDS * CAMERA_FPS,
+            keyint_min=HLS_SEGMENT_SECONDS * CAMERA_FPS,
+            sc_threshold=0,
+            hls_time=HLS_SEGMENT_SECONDS,
+            hls_playlist_type='vod',
+            hls_segment_type='fmp4',
+            hls_fmp4_init_filename='init.mp4',
+            hls_segment_filename=f"{output_dir}/%v/%03d.m4s",
+            master_pl_name='master.m3u8',
+            var_stream_map=' '.join(f"v:{i},name:{name}" for i, name in enumerate(names)),
+            **options
+        )
+        .overwrite_output()
+        .run(capture_stdout=True, capture_stderr=True)
+    )
+    _report('hls', stderr)
+
+    return read_hls_variants(output_dir)
+
+def _attributes(line: str) -> dict:
+    """Parse the attribute list of an HLS tag (KEY=value,KEY="quoted, value")"""
+    return dict(
+        (key, value.strip('"'))
+        for key, value in re.findall(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)', line.split(':', 1)[1])
+    )
+
+def read_hls_variants(output_dir: str) -> dict:
+    """Read the playlists ffmpeg wrote into {name: variant}.
+
+    A variant holds its resolution and codecs, the init segment and a list of
+    [media segment, duration] paths relative to output_dir, and a bandwidth
+    measured as the peak bitrate of its segments.
+    """
+    variants = {}
+    with open(os.path.join(output_dir, 'master.m3u8')) as f:
+        lines = [line.strip() for line in f if line.strip()]
+
+    for tag, uri in zip(lines, lines[1:]):
+        if not tag.startswith('#EXT-X-STREAM-INF:'):
+            continue
+        attributes = _attributes(tag)
+        name = os.path.dirname(uri)
+        variant = {
+            "resolution": attributes.get('RESOLUTION'),
+            "codecs": attributes.get('CODECS'),
+            "init": None,
+            "segments": []
+        }
+
+        duration = None
+        with open(os.path.join(output_dir, uri)) as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith('#EXT-X-MAP:'):
+                    variant["init"] = f"{name}/{_attributes(line)['URI']}"
+                elif line.startswith('#EXTINF:'):
+                    duration = float(line.split(':', 1)[1].split(',')[0])
+                elif line and not line.startswith('#'):
+                    variant["segments"].append([f"{name}/{line}", duration])
+
+        variant["bandwidth"] = max(
+            (
+                math.ceil(os.path.getsize(os.path.join(output_dir, path)) * 8 / duration)
+                for path, duration in variant["segments"]
+                if duration
+            ),
+            default=0
+        )
+        variants[name] = variant
+
+    return variants
@@ -44,6 +44,8 @@ CREATE TABLE routes (
     processed BOOLEAN DEFAULT FALSE,
     has_video BOOLEAN DEFAULT FALSE,
     max_camera_points INTEGER DEFAULT 0,
+    previews JSONB DEFAULT '{}',
+    stats JSONB DEFAULT '{}',
     created_at TIMESTAMP DEFAULT NOW(),
     updated_at TIMESTAMP DEFAULT NOW()
 );
@@ -63,11 +65,38 @@ CREATE TABLE route_segments (
     qlog_path VARCHAR(512),
     qcamera_path VARCHAR(512),
     thumbnail_path VARCHAR(512),
+    renditions JSONB DEFAULT '{}',
+    telemetry JSONB DEFAULT '{}',
     upload_complete BOOLEAN DEFAULT FALSE,
     created_at TIMESTAMP DEFAULT NOW(),
     UNIQUE(route_id, segment_number)
 );
 
+-- Segment Files table (one row per uploaded file of a segment)
+CREATE TABLE segment_files (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    segment_id UUID REFERENCES route_segments(id) ON DELETE CASCADE,
+    file_type VARCHAR(50) NOT NULL,
+    object_key VARCHAR(512) NOT NULL,
+    content_hash VARCHAR(64),
+    etag VARCHAR(255),
+    file_size BIGINT,
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW(),
+    UNIQUE(segment_id, file_type)
+);
+
+-- Route Geometries table (a route's path simplified for each range of map zoom levels)
+CREATE TABLE route_geometries (
+    route_id UUID REFERENCES routes(id) ON DELETE CASCADE,
+    max_zoom INTEGER NOT NULL,
+    tolerance_meters FLOAT NOT NULL,
+    point_count INTEGER NOT NULL,
+    polyline TEXT NOT NULL,
+    packed BYTEA NOT NULL,
+    PRIMARY KEY (route_id, max_zoom)
+);
+
 -- Events table
 CREATE TABLE events (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
@@ -135,7 +164,9 @@ CREATE INDEX idx_routes_device_id ON routes(device_id);
 CREATE INDEX idx_routes_start_time ON routes(start_time DESC);
 CREATE INDEX idx_routes_fullname ON routes(fullname);
 CREATE INDEX idx_route_segments_route_id ON route_segments(route_id);
+CREATE INDEX idx_segment_files_content_hash ON segment_files(content_hash);
 CREATE INDEX idx_events_route_id ON events(route_id);
+CREATE INDEX idx_events_segment_id ON events(segment_id);
 CREATE INDEX idx_events_timestamp ON events(timestamp);
 CREATE INDEX idx_device_status_device_id ON device_status(device_id);
 CREATE INDEX idx_device_status_timestamp ON device_status(timestamp DESC);
@@ -167,3 +198,6 @@ CREATE TRIGGER update_devices_updated_at BEFORE UPDATE ON devices
 
 CREATE TRIGGER update_routes_updated_at BEFORE UPDATE ON routes
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+CREATE TRIGGER update_segment_files_updated_at BEFORE UPDATE ON segment_files
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
@@ -75,6 +75,10 @@ export const routesAPI = {
   list: (page = 1, pageSize = 20, deviceId?: string) =>
     api.get('/routes', { params: { page, page_size: pageSize, device_id: deviceId } }),
 
+  // Paths of the same page of routes, simplified for a map zoom level (see services/geometry.ts)
+  listGeometries: (zoom: number, page = 1, pageSize = 20, deviceId?: string) =>
+    api.get('/routes/geometries', { params: { zoom, page, page_size: pageSize, device_id: deviceId } }),
+
   get: (routeName: string) => api.get(`/routes/${routeName}`),
 
   delete: (routeName: string) => api.delete(`/routes/${routeName}`),
@@ -83,15 +87,38 @@ export const routesAPI = {
 
   getEvents: (routeName: string) => api.get(`/routes/${routeName}/events`),
 
-  getVideoUrl: (routeName: string, segment?: number) => {
-    const params = segment ? `?segment=${segment}` : '';
-    return `${API_URL}/api/v1/routes/${routeName}/video${params}`;
+  // Presigned playback URLs per segment; without a codec each segment offers what it
+  // already has (HEVC first), codec 'h264' asks for a transcode where there is none
+  getVideo: (routeName: string, segment?: number, codec?: 'hevc' | 'h264') =>
+    api.get(`/routes/${routeName}/video`, { params: { segment, codec } }),
+
+  // URL of a segment's video (the first one by default), null while it is being produced
+  getVideoUrl: async (routeName: string, segment?: number, codec?: 'hevc' | 'h264'): Promise<string | null> => {
+    const { data } = await api.get(`/routes/${routeName}/video`, { params: { segment, codec } });
+    return data.segments[0]?.url ?? null;
   },
 
-  getThumbnailUrl: (routeName: string, segment?: number) => {
-    const params = segment ? `?segment=${segment}` : '';
-    return `${API_URL}/api/v1/routes/${routeName}/thumbnail${params}`;
+  // URL of a segment's thumbnail (the first one that has one by default)
+  getThumbnailUrl: async (routeName: string, segment?: number): Promise<string> => {
+    const { data } = await api.get(`/routes/${routeName}/thumbnail`, { params: { segment } });
+    return data.url;
   },
+
+  // Sprite sheets of the whole drive; tile n of a segment is at n * interval seconds
+  getSprites: (routeName: string) => api.get(`/routes/${routeName}/sprites`),
+
+  // Master playlist URL for native HLS players, authorized by the token in its query;
+  // the first request packages the route, answering 503 with Retry-After meanwhile
+  getHlsUrl: async (routeName: string): Promise<string> => {
+    const { data } = await api.get(`/routes/${routeName}/hls`);
+    return data.url;
+  },
+
+  // Time-lapse of the whole drive, once every segment is processed
+  getPreview: (routeName: string) => api.get(`/routes/${routeName}/preview`),
+
+  getGeometry: (routeName: string, zoom: number) =>
+    api.get(`/routes/${routeName}/geometry`, { params: { zoom } }),
 };
 
 export default api;
@@ -0,0 +1,46 @@
+// Route paths, as returned by GET /routes/:routeName/geometry and /routes/geometries
+
+export interface RouteGeometry {
+  route_name: string;
+  max_zoom: number;
+  tolerance_meters: number;
+  points: number;
+  polyline: string;
+}
+
+// Polylines are encoded at 1e-5 degrees
+const PRECISION = 1e5;
+
+// Decode a Google encoded polyline to GeoJSON-ordered [longitude, latitude] pairs
+export const decodePolyline = (polyline: string): [number, number][] => {
+  const coordinates: [number, number][] = [];
+  let index = 0;
+  let lat = 0;
+  let lng = 0;
+
+  const next = (): number => {
+    let result = 0;
+    let shift = 0;
+    let byte: number;
+    do {
+      byte = polyline.charCodeAt(index++) - 63;
+      result |= (byte & 0x1f) << shift;
+      shift += 5;
+    } while (byte >= 0x20);
+    return result & 1 ? ~(result >> 1) : result >> 1;
+  };
+
+  while (index < polyline.length) {
+    lat += next();
+    lng += next();
+    coordinates.push([lng / PRECISION, lat / PRECISION]);
+  }
+  return coordinates;
+};
+
+// A route as a GeoJSON feature, ready for a mapbox-gl line layer
+export const geometryFeature = (geometry: RouteGeometry) => ({
+  type: 'Feature' as const,
+  properties: { route_name: geometry.route_name },
+  geometry: { type: 'LineString' as const, coordinates: decodePolyline(geometry.polyline) },
+});
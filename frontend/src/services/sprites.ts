@@ -0,0 +1,50 @@
+// Timeline sprite sheets, as returned by GET /routes/:routeName/sprites
+
+export interface SegmentSprites {
+  segment_number: number;
+  count: number;
+  sheets: string[];
+}
+
+export interface SpriteManifest {
+  route_name: string;
+  interval: number;
+  tile_width: number;
+  tile_height: number;
+  columns: number;
+  rows: number;
+  expires_in: number;
+  segments: SegmentSprites[];
+}
+
+export interface SpriteTile {
+  url: string;
+  x: number;
+  y: number;
+  width: number;
+  height: number;
+}
+
+// openpilot segments are one minute long
+const SEGMENT_SECONDS = 60;
+
+// Tile to show when hovering `seconds` into the drive; draw it as a
+// background image offset by (-x, -y) in a width x height box
+export const spriteTileAt = (manifest: SpriteManifest, seconds: number): SpriteTile | null => {
+  const segmentNumber = Math.floor(seconds / SEGMENT_SECONDS);
+  const segment = manifest.segments.find((s) => s.segment_number === segmentNumber);
+  if (!segment || segment.count === 0) {
+    return null;
+  }
+
+  const tile = Math.min(Math.floor((seconds % SEGMENT_SECONDS) / manifest.interval), segment.count - 1);
+  const perSheet = manifest.columns * manifest.rows;
+  const index = tile % perSheet;
+  return {
+    url: segment.sheets[Math.floor(tile / perSheet)],
+    x: (index % manifest.columns) * manifest.tile_width,
+    y: Math.floor(index / manifest.columns) * manifest.tile_height,
+    width: manifest.tile_width,
+    height: manifest.tile_height,
+  };
+};